@@ -0,0 +1,127 @@
+"""
+比较 "不含指定过敏原的产品" 查询:
+  - 旧写法: products LEFT JOIN allergen_mappings 后按产品聚合
+  - 新写法: allergen_profiles 位图上的按位与（SQL），以及载入内存的 ProfileIndex
+并校验三者返回的产品集合一致。
+
+用法:
+    python benchmarks/bench_allergen_profiles.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../db'))
+
+from allergen_profiles import (ProfileIndex, count_safe_products, find_safe_products,  # noqa: E402
+                               rebuild_profiles, sync_allergen_bits)
+from enrich_allergens import ALLERGEN_DICT  # noqa: E402
+from init_db import ensure_schema  # noqa: E402
+
+SOURCES = ['OFF', 'USDA', 'CNF', 'JPN_GOV']
+TAGS = list(ALLERGEN_DICT)
+
+QUERIES = [
+    ("peanuts+sesame+crustaceans", ["en:peanuts", "en:sesame-seeds", "en:crustaceans"], None),
+    ("milk (source=OFF)", ["en:milk"], "OFF"),
+    ("8 allergens", TAGS[:8], None),
+]
+
+
+def build_db(path, rows, seed=11):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    ensure_schema(conn)
+    conn.executemany(
+        "INSERT INTO products (id, source, barcode, name, ingredients) VALUES (?, ?, ?, ?, ?)",
+        ((f"P{i}", SOURCES[i % 4], f"{i:013d}", f"Product {i}", "ingredients") for i in range(rows)))
+
+    def mappings():
+        for i in range(rows):
+            # 多数产品只有 0~3 个过敏原
+            for tag in rng.sample(TAGS, min(len(TAGS), int(rng.expovariate(0.7)))):
+                yield (f"P{i}", tag, 'contains' if rng.random() < 0.7 else 'may_contain')
+
+    conn.executemany(
+        "INSERT INTO allergen_mappings (product_id, allergen_name, status) VALUES (?, ?, ?)", mappings())
+    conn.commit()
+    return conn
+
+
+def join_query(conn, tags, source, limit=None):
+    placeholders = ",".join("?" * len(tags))
+    sql = f'''
+        SELECT p.id FROM products p
+        LEFT JOIN allergen_mappings m ON m.product_id = p.id
+        WHERE (? IS NULL OR p.source = ?)
+        GROUP BY p.id
+        HAVING SUM(CASE WHEN m.allergen_name IN ({placeholders}) THEN 1 ELSE 0 END) = 0
+    '''
+    params = [source, source] + list(tags)
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+def best_of(func, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_profiles_")
+    try:
+        print(f"生成 {args.rows} 个产品的合成数据库...")
+        conn = build_db(os.path.join(workdir, 'food.db'), args.rows)
+        cursor = conn.cursor()
+        t0 = time.perf_counter()
+        sync_allergen_bits(cursor, TAGS)
+        rebuild_profiles(cursor)
+        conn.commit()
+        print(f"位图整表生成: {time.perf_counter() - t0:.2f}s")
+        t0 = time.perf_counter()
+        index = ProfileIndex(conn)
+        print(f"ProfileIndex 载入: {time.perf_counter() - t0:.2f}s\n")
+
+        print(f"{'query':<28}{'join (all)':>12}{'bitmask (count)':>17}{'in-memory':>11}"
+              f"{'join (limit)':>14}{'bitmask (limit)':>17}")
+        for label, tags, source in QUERIES:
+            t_join, join_ids = best_of(lambda: join_query(conn, tags, source), repeat=1)
+            t_count, count = best_of(lambda: count_safe_products(conn, exclude=tags, source=source))
+            t_join_limit, _ = best_of(lambda: join_query(conn, tags, source, args.limit), repeat=1)
+            t_limit, _ = best_of(lambda: find_safe_products(conn, exclude=tags, source=source,
+                                                            limit=args.limit))
+            t_index, index_count = best_of(lambda: index.count(exclude=tags, source=source))
+
+            # 结果校验：位图返回的产品集合必须与聚合查询一致
+            mask_ids = {row[0] for row in find_safe_products(conn, exclude=tags, source=source, limit=None)}
+            index_ids = set(index.find(limit=None, exclude=tags, source=source))
+            if mask_ids != set(join_ids) or index_ids != mask_ids or len({count, index_count, len(join_ids)}) != 1:
+                raise SystemExit(f"结果不一致: {label} join={len(join_ids)} bitmask={len(mask_ids)}/{count}")
+
+            print(f"{label:<28}{t_join * 1000:>10.0f}ms{t_count * 1000:>15.1f}ms{t_index * 1000:>9.1f}ms"
+                  f"{t_join_limit * 1000:>12.0f}ms{t_limit * 1000:>15.2f}ms   ({count} 个产品)")
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
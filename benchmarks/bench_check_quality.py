@@ -0,0 +1,114 @@
+"""
+比较旧版 check_data_quality（七次独立查询，孤儿检查用 NOT IN）与单遍审计引擎的耗时，
+校验两者的精确指标一致，并给出 --sample 模式的耗时和估计误差。
+
+用法:
+    python benchmarks/bench_check_quality.py --rows 1000000
+    python benchmarks/bench_check_quality.py --rows 200000 --sample 0.02
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../db'))
+
+from bench_export import build_db  # noqa: E402
+from check_quality import audit  # noqa: E402
+
+
+def add_defects(path):
+    """加入重复条码（包括空字符串条码）、缺失字段和孤儿映射，让每项指标都不为零。"""
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE products SET barcode = '0000000000001' WHERE rowid % 997 = 0")
+    conn.execute("UPDATE products SET barcode = '' WHERE rowid % 499 = 0")
+    conn.execute("UPDATE products SET brand = '' WHERE rowid % 11 = 0")
+    conn.execute("UPDATE products SET ingredients = NULL WHERE rowid % 7 = 0")
+    conn.execute("UPDATE products SET categories = 'asian noodles' WHERE rowid % 13 = 0")
+    # 删除部分产品但保留其映射，孤儿分散在整张表中
+    conn.execute("DELETE FROM products WHERE rowid % 149 = 0")
+    conn.commit()
+    conn.close()
+
+
+def legacy_audit(conn):
+    """旧版 check_data_quality 的七次查询（去掉打印）。"""
+    cursor = conn.cursor()
+    total = cursor.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    duplicates = cursor.execute("SELECT barcode, COUNT(*) as count FROM products WHERE barcode IS NOT NULL "
+                                "GROUP BY barcode HAVING count > 1").fetchall()
+    missing = [cursor.execute(f"SELECT COUNT(*) FROM products WHERE {c} IS NULL OR {c} = ''").fetchone()[0]
+               for c in ("name", "ingredients", "brand")]
+    orphaned = cursor.execute("SELECT COUNT(*) FROM allergen_mappings "
+                              "WHERE product_id NOT IN (SELECT id FROM products)").fetchone()[0]
+    redundant = cursor.execute("SELECT product_id, allergen_name, COUNT(DISTINCT status) as status_count "
+                               "FROM allergen_mappings GROUP BY product_id, allergen_name "
+                               "HAVING status_count > 1").fetchall()
+    sources = dict(cursor.execute("SELECT source, COUNT(*) FROM products GROUP BY source").fetchall())
+    asian = cursor.execute("SELECT COUNT(*) FROM products WHERE categories LIKE '%asian%' OR "
+                           "categories LIKE '%chinese%' OR categories LIKE '%japanese%'").fetchone()[0]
+    return {"total": total, "duplicates": len(duplicates), "missing_name": missing[0],
+            "missing_ingredients": missing[1], "missing_brand": missing[2], "orphaned": orphaned,
+            "redundant": len(redundant), "sources": sources, "asian": asian}
+
+
+def comparable(report):
+    c = report["completeness"]
+    return {"total": report["total_products"], "duplicates": report["duplicates"]["barcode_groups"],
+            "missing_name": c["name"]["missing"], "missing_ingredients": c["ingredients"]["missing"],
+            "missing_brand": c["brand"]["missing"], "orphaned": report["mappings"]["orphaned"],
+            "redundant": report["mappings"]["conflicting_pairs"],
+            "sources": {s: m["products"] for s, m in report["sources"].items()},
+            "asian": report["asian_coverage"]["products"]}
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--sample', type=float, default=0.02)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_quality_")
+    try:
+        path = os.path.join(workdir, 'food.db')
+        print(f"生成 {args.rows} 个产品的合成数据库...")
+        build_db(path, args.rows)
+        add_defects(path)
+
+        conn = sqlite3.connect(path)
+        legacy, t_legacy = timed(lambda: legacy_audit(conn))
+        full, t_full = timed(lambda: audit(conn))
+        sampled, t_sampled = timed(lambda: audit(conn, args.sample))
+        conn.close()
+
+        print(f"{'legacy':<10}{t_legacy:>8.2f}s")
+        print(f"{'single':<10}{t_full:>8.2f}s   ({t_legacy / t_full:.1f}x faster)")
+        print(f"{'sample':<10}{t_sampled:>8.2f}s   (--sample {args.sample})")
+        identical = legacy == comparable(full)
+        print(f"精确指标与旧版一致: {identical}")
+        if not identical:
+            print(f"  旧版: {legacy}\n  新版: {comparable(full)}")
+
+        print("\n抽样估计误差:")
+        for field in ("name", "brand", "ingredients"):
+            exact = full["completeness"][field]["ratio"]
+            estimate = sampled["completeness"][field]["ratio"]
+            print(f"  missing {field:<12} {exact:.4f} vs {estimate:.4f}")
+        print(f"  orphaned             {full['mappings']['orphaned']} vs {sampled['mappings']['orphaned']}")
+        if not identical:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
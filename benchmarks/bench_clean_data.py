@@ -0,0 +1,226 @@
+"""
+对比逐条码 (N+1) 的旧合并逻辑与基于窗口函数的集合式合并:
+  1. 与 reference_clean（逐条码，合并规则与现在相同）的 products 和 allergen_mappings 必须完全一致
+  2. 与 baseline_clean（最初的 clean_and_consolidate()）的 products 必须一致；
+     allergen_mappings 只允许有两处有意的差异，并报告各自的条数:
+       - 基线的 UPDATE OR IGNORE 在主记录已有同名过敏原时不迁移，重复记录的映射留在已删除的产品上（孤儿映射）
+       - Safety-First：主记录只标了 may_contain、重复记录确认 contains 的，现在升级为 contains
+  3. 输出各自耗时
+
+用法:
+    python benchmarks/bench_clean_data.py --rows 200000 --dup-ratio 0.3
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../db'))
+
+import clean_data  # noqa: E402
+from init_db import ensure_schema  # noqa: E402
+
+TAGS = ["en:peanuts", "en:soybeans", "en:milk", "en:eggs", "en:wheat", "en:fish", "en:sesame-seeds"]
+
+
+def baseline_clean(conn):
+    """最初的 clean_and_consolidate()，逐行相同（去掉了打印）。"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT barcode, COUNT(*) as c
+        FROM products
+        WHERE barcode IS NOT NULL
+        GROUP BY barcode
+        HAVING c > 1
+    """)
+    duplicates = cursor.fetchall()
+
+    for barcode, count in duplicates:
+        cursor.execute(
+            "SELECT id, name, ingredients, image_url, allergens FROM products WHERE barcode = ?", (barcode,))
+        records = cursor.fetchall()
+        main_record = sorted(records, key=lambda x: (
+            1 if x[3] else 0,
+            len(x[2]) if x[2] else 0,
+            1 if x[4] else 0
+        ), reverse=True)[0]
+
+        main_id = main_record[0]
+        other_ids = [r[0] for r in records if r[0] != main_id]
+        for old_id in other_ids:
+            cursor.execute(
+                "UPDATE OR IGNORE allergen_mappings SET product_id = ? WHERE product_id = ?", (main_id, old_id))
+            cursor.execute("DELETE FROM products WHERE id = ?", (old_id,))
+    conn.commit()
+
+    cursor.execute(
+        "DELETE FROM products WHERE (name IS NULL OR name = '') AND (ingredients IS NULL OR ingredients = '')")
+    conn.commit()
+
+
+def reference_clean(conn):
+    """逐条码的参照实现：基线加上 Safety-First 升级和删除重复记录残留的映射，合并规则与集合式实现相同。"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT barcode, COUNT(*) as c
+        FROM products
+        WHERE barcode IS NOT NULL
+        GROUP BY barcode
+        HAVING c > 1
+    """)
+    duplicates = cursor.fetchall()
+
+    for barcode, count in duplicates:
+        cursor.execute(
+            "SELECT id, name, ingredients, image_url, allergens FROM products WHERE barcode = ?", (barcode,))
+        records = cursor.fetchall()
+        main_record = sorted(records, key=lambda x: (
+            1 if x[3] else 0,
+            len(x[2]) if x[2] else 0,
+            1 if x[4] else 0
+        ), reverse=True)[0]
+
+        main_id = main_record[0]
+        other_ids = [r[0] for r in records if r[0] != main_id]
+        for old_id in other_ids:
+            cursor.execute("""
+                UPDATE allergen_mappings SET status = 'contains'
+                WHERE product_id = ? AND status != 'contains' AND allergen_name IN (
+                    SELECT allergen_name FROM allergen_mappings WHERE product_id = ? AND status = 'contains')
+            """, (main_id, old_id))
+            cursor.execute(
+                "UPDATE OR IGNORE allergen_mappings SET product_id = ? WHERE product_id = ?", (main_id, old_id))
+            cursor.execute("DELETE FROM allergen_mappings WHERE product_id = ?", (old_id,))
+            cursor.execute("DELETE FROM products WHERE id = ?", (old_id,))
+    conn.commit()
+
+    cursor.execute(
+        "DELETE FROM products WHERE (name IS NULL OR name = '') AND (ingredients IS NULL OR ingredients = '')")
+    conn.commit()
+
+
+def build_db(path, rows, dup_ratio, seed=3):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    ensure_schema(conn)
+    n_barcodes = max(1, int(rows * (1 - dup_ratio)))
+    products = []
+    mappings = []
+    for i in range(rows):
+        barcode = f"{rng.randrange(n_barcodes):013d}" if rng.random() < 0.95 else None
+        ingredients = rng.choice([None, "", "water", "water, salt", "wheat flour, soy sauce, sugar"])
+        name = rng.choice([None, "", f"Product {i}"])
+        image = rng.choice([None, "", "http://img/x.jpg"])
+        allergens = rng.choice([None, "", "en:milk"])
+        products.append((f"P{i}", 'OFF', barcode, name, ingredients, allergens, image))
+        for tag in rng.sample(TAGS, rng.randint(0, 4)):
+            mappings.append((f"P{i}", tag, rng.choice(['contains', 'may_contain'])))
+    conn.executemany(
+        "INSERT INTO products (id, source, barcode, name, ingredients, allergens, image_url) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        products)
+    conn.executemany(
+        "INSERT INTO allergen_mappings (product_id, allergen_name, status) VALUES (?, ?, ?)", mappings)
+    conn.commit()
+    conn.close()
+
+
+def snapshot(path):
+    conn = sqlite3.connect(path)
+    products = conn.execute("SELECT id FROM products ORDER BY id").fetchall()
+    mappings = conn.execute(
+        "SELECT product_id, allergen_name, status FROM allergen_mappings ORDER BY product_id, allergen_name").fetchall()
+    conn.close()
+    return products, mappings
+
+
+def split_orphans(snapshot_):
+    """返回 ({(产品, 过敏原): 状态}，指向已不存在的产品的 (产品, 过敏原) 集合)。"""
+    product_ids = {p_id for (p_id,) in snapshot_[0]}
+    live, orphans = {}, set()
+    for p_id, tag, status in snapshot_[1]:
+        if p_id in product_ids:
+            live[(p_id, tag)] = status
+        else:
+            orphans.add((p_id, tag))
+    return live, orphans
+
+
+def baseline_differences(baseline_snapshot, new_snapshot):
+    """返回 (基线多出的孤儿映射条数, Safety-First 升级条数, 其他差异)。"""
+    # 两边都不清理被当作垃圾删除的产品的映射，只有合并时遗留的孤儿映射是基线独有的
+    baseline, baseline_orphans = split_orphans(baseline_snapshot)
+    new, new_orphans = split_orphans(new_snapshot)
+    upgraded = sum(1 for key, status in new.items()
+                   if status == 'contains' and baseline.get(key) == 'may_contain')
+    other = sorted(key for key in set(baseline) | set(new)
+                   if baseline.get(key) != new.get(key)
+                   and not (new.get(key) == 'contains' and baseline.get(key) == 'may_contain'))
+    other += sorted(new_orphans - baseline_orphans)
+    return len(baseline_orphans - new_orphans), upgraded, other
+
+
+def main():
+    parser = argparse.ArgumentParser(description="条码合并：旧实现 vs 集合式实现")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--dup-ratio', type=float, default=0.3, help="重复条码所占比例")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_clean_")
+    try:
+        baseline_db = os.path.join(tmp_dir, 'baseline.db')
+        legacy_db = os.path.join(tmp_dir, 'legacy.db')
+        new_db = os.path.join(tmp_dir, 'set_based.db')
+        build_db(legacy_db, args.rows, args.dup_ratio)
+        shutil.copyfile(legacy_db, baseline_db)
+        shutil.copyfile(legacy_db, new_db)
+
+        conn = sqlite3.connect(baseline_db)
+        t0 = time.perf_counter()
+        baseline_clean(conn)
+        baseline_time = time.perf_counter() - t0
+        conn.close()
+
+        conn = sqlite3.connect(legacy_db)
+        t0 = time.perf_counter()
+        reference_clean(conn)
+        legacy_time = time.perf_counter() - t0
+        conn.close()
+
+        clean_data.DB_PATH = new_db
+        t0 = time.perf_counter()
+        clean_data.clean_and_consolidate()
+        new_time = time.perf_counter() - t0
+
+        baseline_snapshot = snapshot(baseline_db)
+        legacy_snapshot = snapshot(legacy_db)
+        new_snapshot = snapshot(new_db)
+        identical = legacy_snapshot == new_snapshot
+        orphans, upgraded, other = baseline_differences(baseline_snapshot, new_snapshot)
+        same_products = baseline_snapshot[0] == new_snapshot[0]
+
+        print(f"\n基线 (逐条码):     {baseline_time:.2f}s")
+        print(f"参照 (逐条码):     {legacy_time:.2f}s")
+        print(f"新实现 (集合式):   {new_time:.2f}s  (相对参照加速 {legacy_time / new_time:.2f}x，"
+              f"相对基线 {baseline_time / new_time:.2f}x)")
+        print(f"与基线: 产品{'一致' if same_products else '不一致!'}；有意的差异: 基线遗留孤儿映射 {orphans} 条，"
+              f"Safety-First 升级 {upgraded} 条；其他差异 {len(other)} 条")
+        print(f"剩余产品: {len(legacy_snapshot[0])} / {len(new_snapshot[0])}，"
+              f"映射: {len(legacy_snapshot[1])} / {len(new_snapshot[1])}")
+        print(f"与参照是否完全一致: {'是' if identical else '否'}")
+        if not identical:
+            diff = set(legacy_snapshot[1]) ^ set(new_snapshot[1])
+            print(f"映射差异示例: {sorted(diff)[:10]}")
+        if other:
+            print(f"与基线的意外差异示例: {other[:10]}")
+        if not identical or not same_products or other:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
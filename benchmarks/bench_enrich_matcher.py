@@ -0,0 +1,179 @@
+"""
+对比旧的逐关键词子串扫描与 Aho-Corasick 匹配器:
+  1. 两种实现生成的 allergen_mappings 必须逐行一致
+  2. 输出各自的耗时。新实现先从空的 ingredient_tokens 冷启动全量重建（同一遍里归一化），
+     再在已归一化的配料上 --full 重建一次，两次的输出都要与旧实现一致
+
+用法:
+    python benchmarks/bench_enrich_matcher.py              # 合成数据
+    python benchmarks/bench_enrich_matcher.py --rows 200000
+    python benchmarks/bench_enrich_matcher.py --db data/food_data.db   # 用真实库 (只读拷贝)
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../db'))
+
+import enrich_allergens  # noqa: E402
+from enrich_allergens import ALLERGEN_DICT, MAY_CONTAIN_PHRASES  # noqa: E402
+from init_db import ensure_schema  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '../db/schema.sql')
+
+FILLER = ["water", "salt", "sugar", "rice", "vinegar", "starch", "eau", "sel",
+          "水", "盐", "砂糖", "米", "醋", "食塩", "でん粉", "spices", "garlic", "大蒜"]
+
+
+def legacy_enrich(conn):
+    """基线实现：与改造前的 enrich_allergens() 逻辑逐行相同。"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM allergen_mappings")
+    cursor.execute("SELECT id, ingredients, allergens, traces FROM products")
+    products = cursor.fetchall()
+
+    for p_id, ingredients, api_allergens, api_traces in products:
+        found_allergens = {}
+
+        if api_allergens:
+            for a in [a.strip() for a in api_allergens.split(',') if a.strip()]:
+                found_allergens[a] = "contains"
+
+        if api_traces:
+            for t in [t.strip() for t in api_traces.split(',') if t.strip()]:
+                if t not in found_allergens:
+                    found_allergens[t] = "may_contain"
+
+        if ingredients:
+            ing_lower = ingredients.lower()
+            main_part = ing_lower
+            may_part = ""
+            for phrase in MAY_CONTAIN_PHRASES:
+                if phrase in ing_lower:
+                    parts = ing_lower.split(phrase, 1)
+                    main_part = parts[0]
+                    may_part = parts[1]
+                    break
+
+            for tag, keywords in ALLERGEN_DICT.items():
+                if found_allergens.get(tag) == "contains":
+                    continue
+                if any(kw.lower() in main_part for kw in keywords):
+                    found_allergens[tag] = "contains"
+                    continue
+                if any(kw.lower() in may_part for kw in keywords):
+                    found_allergens[tag] = "may_contain"
+
+        for tag, status in found_allergens.items():
+            cursor.execute("INSERT INTO allergen_mappings (product_id, allergen_name, status) VALUES (?, ?, ?)",
+                           (p_id, tag, status))
+    conn.commit()
+
+
+def random_ingredients(rng):
+    keywords = [kw for kws in ALLERGEN_DICT.values() for kw in kws]
+    parts = []
+    for _ in range(rng.randint(2, 14)):
+        word = rng.choice(keywords) if rng.random() < 0.35 else rng.choice(FILLER)
+        if rng.random() < 0.2:
+            word = word.upper()
+        parts.append(word)
+    text = ", ".join(parts)
+    if rng.random() < 0.3:
+        tail = ", ".join(rng.choice(keywords) for _ in range(rng.randint(1, 3)))
+        text += f". {rng.choice(MAY_CONTAIN_PHRASES).capitalize()} {tail}"
+    return text
+
+
+def build_synthetic_db(path, rows, seed=42):
+    rng = random.Random(seed)
+    tags = list(ALLERGEN_DICT)
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+    data = []
+    for i in range(rows):
+        allergens = ",".join(rng.sample(tags, rng.randint(1, 2))) if rng.random() < 0.3 else None
+        traces = ",".join(rng.sample(tags, 1)) if rng.random() < 0.15 else None
+        ingredients = random_ingredients(rng) if rng.random() < 0.95 else None
+        data.append((f"SYN_{i}", 'OFF', str(i), f"Product {i}", None,
+                     ingredients, allergens, traces, None, None, None))
+    conn.executemany('''
+        INSERT INTO products (id, source, barcode, name, brand, ingredients, allergens, traces, image_url, categories, countries)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', data)
+    conn.commit()
+    conn.close()
+
+
+def dump_mappings(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        "SELECT product_id, allergen_name, status FROM allergen_mappings ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--db', help="使用已有数据库的拷贝代替合成数据")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_enrich_")
+    try:
+        legacy_db = os.path.join(tmp_dir, 'legacy.db')
+        new_db = os.path.join(tmp_dir, 'matcher.db')
+        if args.db:
+            shutil.copyfile(args.db, legacy_db)
+        else:
+            build_synthetic_db(legacy_db, args.rows)
+        shutil.copyfile(legacy_db, new_db)
+
+        conn = sqlite3.connect(legacy_db)
+        t0 = time.perf_counter()
+        legacy_enrich(conn)
+        legacy_time = time.perf_counter() - t0
+        conn.close()
+
+        conn = sqlite3.connect(new_db)
+        ensure_schema(conn)
+        conn.close()
+
+        # 冷启动：ingredient_tokens 为空，归一化包含在内
+        enrich_allergens.DB_PATH = new_db
+        t0 = time.perf_counter()
+        enrich_allergens.enrich_allergens()
+        cold_time = time.perf_counter() - t0
+        cold_rows = dump_mappings(new_db)
+
+        # 配料已归一化时的全量重建
+        t0 = time.perf_counter()
+        enrich_allergens.enrich_allergens(full=True)
+        new_time = time.perf_counter() - t0
+
+        legacy_rows = dump_mappings(legacy_db)
+        new_rows = dump_mappings(new_db)
+        identical = legacy_rows == new_rows == cold_rows
+
+        print(f"\n旧实现 (子串扫描):   {legacy_time:.2f}s")
+        print("新实现 (Aho-Corasick):")
+        print(f"  冷启动 (含归一化):   {cold_time:.2f}s  (加速 {legacy_time / cold_time:.2f}x)")
+        print(f"  已归一化的全量重建:  {new_time:.2f}s  (加速 {legacy_time / new_time:.2f}x)")
+        print(f"allergen_mappings 行数: {len(legacy_rows)} / {len(new_rows)}")
+        print(f"输出是否完全一致: {'是' if identical else '否'}")
+        if not identical:
+            diff = (set(legacy_rows) ^ set(new_rows)) | (set(legacy_rows) ^ set(cold_rows))
+            print(f"差异示例: {sorted(diff)[:10]}")
+            sys.exit(1)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+比较旧版 pandas 导出与流式 SQL 聚合导出的耗时和峰值内存，并校验 CSV 输出逐字节一致。
+每种导出都在单独的子进程 (spawn) 中运行，峰值内存取该进程的 ru_maxrss。
+
+用法:
+    python benchmarks/bench_export.py --rows 2000000
+    python benchmarks/bench_export.py --rows 200000 --parquet
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../db')
+sys.path.insert(0, DB_DIR)
+
+from init_db import ensure_schema  # noqa: E402
+
+SOURCES = ['OFF', 'USDA', 'CNF', 'JPN_GOV']
+TAGS = ["en:peanuts", "en:soybeans", "en:milk", "en:eggs", "en:wheat", "en:fish", "en:sesame-seeds"]
+
+
+def build_db(path, rows, seed=3):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    ensure_schema(conn)
+    # 基准只关心导出，去掉 FTS 触发器以加快造数
+    for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'products_fts_%'").fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+    conn.executemany(
+        "INSERT INTO products (id, source, barcode, name, brand, ingredients, countries) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((f"P{i}", SOURCES[i % 4], f"{i:013d}" if i % 3 else None, f"Product {i}", f"Brand {i % 500}",
+          "water, sugar, salt, wheat flour, soybean oil, \"natural\" flavour", "Japan, France")
+         for i in range(rows)))
+
+    def mappings():
+        for i in range(rows):
+            for tag in rng.sample(TAGS, rng.randint(0, 3)):
+                yield (f"P{i}", tag, 'contains' if rng.random() < 0.7 else 'may_contain')
+
+    conn.executemany(
+        "INSERT INTO allergen_mappings (product_id, allergen_name, status) VALUES (?, ?, ?)", mappings())
+    conn.commit()
+    conn.close()
+
+
+def legacy_export(db_path, output_path):
+    """旧版 export_to_csv 的导出逻辑（全部读入 pandas 后 groupby().apply 聚合）。"""
+    import pandas as pd
+    conn = sqlite3.connect(db_path)
+    df_products = pd.read_sql_query(
+        "SELECT id, barcode, name, brand, source, ingredients, countries FROM products", conn)
+    df_mappings = pd.read_sql_query(
+        "SELECT product_id, allergen_name, status FROM allergen_mappings", conn)
+    confirmed = df_mappings[df_mappings['status'] == 'contains'].groupby(
+        'product_id')['allergen_name'].apply(lambda x: ', '.join(x)).reset_index()
+    confirmed.columns = ['id', 'allergens_confirmed']
+    may_contain = df_mappings[df_mappings['status'] == 'may_contain'].groupby(
+        'product_id')['allergen_name'].apply(lambda x: ', '.join(x)).reset_index()
+    may_contain.columns = ['id', 'allergens_may_contain']
+    df_final = df_products.merge(confirmed, on='id', how='left').merge(
+        may_contain, on='id', how='left')
+    df_final = df_final.fillna('')
+    df_final.to_csv(output_path, index=False, encoding='utf-8-sig')
+    conn.close()
+
+
+def streaming_export(db_path, output_path, parquet_dir=None):
+    import export_csv
+    export_csv.DB_PATH = db_path
+    export_csv.export_to_csv(output_path, parquet_dir)
+
+
+def child(kind, db_path, output_path, parquet_dir, results):
+    sys.path.insert(0, DB_DIR)
+    import contextlib
+    import io
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if kind == "legacy":
+            legacy_export(db_path, output_path)
+        else:
+            streaming_export(db_path, output_path, parquet_dir)
+    elapsed = time.perf_counter() - t0
+    # Linux 上 ru_maxrss 的单位是 KB
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run(kind, db_path, output_path, parquet_dir=None):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=child, args=(kind, db_path, output_path, parquet_dir, results))
+    process.start()
+    elapsed, peak_mb = results.get()
+    process.join()
+    return elapsed, peak_mb
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--parquet', action='store_true', help="新版导出同时写分区 Parquet")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_export_")
+    try:
+        db_path = os.path.join(workdir, 'food.db')
+        print(f"生成 {args.rows} 个产品的合成数据库...")
+        build_db(db_path, args.rows)
+
+        legacy_csv = os.path.join(workdir, 'legacy.csv')
+        new_csv = os.path.join(workdir, 'new.csv')
+        parquet_dir = os.path.join(workdir, 'parquet') if args.parquet else None
+        t_legacy, mem_legacy = run("legacy", db_path, legacy_csv)
+        t_new, mem_new = run("streaming", db_path, new_csv, parquet_dir)
+
+        identical = file_sha1(legacy_csv) == file_sha1(new_csv)
+        print(f"{'':<12}{'time':>10}{'peak RSS':>12}")
+        print(f"{'pandas':<12}{t_legacy:>9.1f}s{mem_legacy:>10.0f}MB")
+        print(f"{'streaming':<12}{t_new:>9.1f}s{mem_new:>10.0f}MB   "
+              f"({t_legacy / t_new:.1f}x faster, {mem_legacy / mem_new:.1f}x less memory)")
+        print(f"CSV 输出逐字节一致: {identical}")
+        if parquet_dir:
+            import pyarrow.dataset as ds
+            count = ds.dataset(parquet_dir, partitioning="hive").count_rows()
+            print(f"Parquet 行数: {count}，分区: {sorted(os.listdir(parquet_dir))}")
+        if not identical:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+在大规模合成表上比较迁移前后的热点查询耗时:
+  - products.barcode 等值查询
+  - allergen_mappings.product_id 等值查询
+  - 按 source / allergen_name 的过滤统计
+同时校验迁移不丢数据（products 行数不变，映射去重后每个 (product, allergen) 保留一条）。
+
+用法:
+    python benchmarks/bench_indexes.py --rows 1000000 --lookups 200
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../db'))
+
+from init_db import SCHEMA_PATH, run_migrations  # noqa: E402
+
+SOURCES = ['OFF', 'USDA', 'CNF', 'JPN_GOV']
+TAGS = ["en:peanuts", "en:soybeans", "en:milk", "en:eggs", "en:wheat", "en:fish", "en:sesame-seeds"]
+
+
+def build_db(path, rows, seed=7):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+    conn.executemany(
+        "INSERT INTO products (id, source, barcode, name, countries) VALUES (?, ?, ?, ?, ?)",
+        ((f"P{i}", SOURCES[i % 4], f"{rng.randrange(rows):013d}", f"Product {i}", "Japan")
+         for i in range(rows)))
+
+    def mappings():
+        for i in range(rows):
+            for tag in rng.sample(TAGS, rng.randint(0, 4)):
+                yield (f"P{i}", tag, rng.choice(['contains', 'may_contain']))
+            # 少量重复映射，模拟旧库中 UPDATE OR IGNORE 无法忽略造成的重复
+            if i % 50 == 0:
+                yield (f"P{i}", "en:milk", "may_contain")
+                yield (f"P{i}", "en:milk", "contains")
+
+    conn.executemany(
+        "INSERT INTO allergen_mappings (product_id, allergen_name, status) VALUES (?, ?, ?)", mappings())
+    conn.commit()
+    conn.close()
+
+
+def time_queries(conn, barcodes, product_ids):
+    timings = {}
+    t0 = time.perf_counter()
+    for barcode in barcodes:
+        conn.execute("SELECT id FROM products WHERE barcode = ?", (barcode,)).fetchall()
+    timings['barcode'] = (time.perf_counter() - t0) / len(barcodes)
+
+    t0 = time.perf_counter()
+    for p_id in product_ids:
+        conn.execute("SELECT allergen_name, status FROM allergen_mappings WHERE product_id = ?",
+                     (p_id,)).fetchall()
+    timings['product_id'] = (time.perf_counter() - t0) / len(product_ids)
+
+    t0 = time.perf_counter()
+    conn.execute("SELECT COUNT(*) FROM products WHERE source = 'CNF'").fetchone()
+    conn.execute("SELECT COUNT(*) FROM allergen_mappings WHERE allergen_name = 'en:peanuts' AND status = 'contains'").fetchone()
+    timings['filters'] = time.perf_counter() - t0
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移前后热点查询耗时对比")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_indexes_")
+    try:
+        path = os.path.join(tmp_dir, 'bench.db')
+        print(f"生成 {args.rows} 行合成数据...")
+        build_db(path, args.rows)
+
+        rng = random.Random(1)
+        conn = sqlite3.connect(path)
+        barcodes = [r[0] for r in conn.execute(
+            "SELECT barcode FROM products WHERE rowid IN (%s)" %
+            ",".join(str(rng.randrange(1, args.rows + 1)) for _ in range(args.lookups)))]
+        product_ids = [f"P{rng.randrange(args.rows)}" for _ in range(args.lookups)]
+
+        products_before = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        pairs_before = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT DISTINCT product_id, allergen_name FROM allergen_mappings)").fetchone()[0]
+        contains_before = conn.execute(
+            "SELECT COUNT(DISTINCT product_id || '|' || allergen_name) FROM allergen_mappings WHERE status = 'contains'").fetchone()[0]
+
+        before = time_queries(conn, barcodes, product_ids)
+
+        t0 = time.perf_counter()
+        run_migrations(conn)
+        migrate_time = time.perf_counter() - t0
+
+        after = time_queries(conn, barcodes, product_ids)
+
+        products_after = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        mappings_after = conn.execute("SELECT COUNT(*) FROM allergen_mappings").fetchone()[0]
+        contains_after = conn.execute(
+            "SELECT COUNT(*) FROM allergen_mappings WHERE status = 'contains'").fetchone()[0]
+        conn.close()
+
+        print(f"\n迁移耗时: {migrate_time:.2f}s")
+        print(f"{'查询':<24}{'迁移前':>12}{'迁移后':>12}{'加速':>10}")
+        for key, label in (('barcode', 'barcode 等值 (每次)'), ('product_id', 'product_id 等值 (每次)'),
+                           ('filters', 'source/allergen 统计')):
+            print(f"{label:<24}{before[key] * 1000:>10.3f}ms{after[key] * 1000:>10.3f}ms"
+                  f"{before[key] / max(after[key], 1e-9):>9.0f}x")
+
+        ok = (products_before == products_after and pairs_before == mappings_after
+              and contains_before == contains_after)
+        print(f"\n数据校验: products {products_before} -> {products_after}, "
+              f"映射 (去重后) {pairs_before} -> {mappings_after}, contains {contains_before} -> {contains_after}: "
+              f"{'通过' if ok else '失败'}")
+        if not ok:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+在本地桩 HTTP 服务上测量异步 OFF 采集器：不同并发度下的总耗时。
+桩服务模拟固定网络延迟、每个游标若干页数据，并在第 N 个请求时返回一次 429。
+不访问真实网络。
+
+用法:
+    python benchmarks/bench_off_crawler.py --latency 0.2 --pages 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../scripts'))
+
+from fetch_off import SAFE_TAGS, ORIGINS  # noqa: E402
+from fetch_off_async import crawl_async  # noqa: E402
+import http_cache  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '../db/schema.sql')
+
+
+def make_stub_handler(latency, pages, throttle_at):
+    state = {"requests": 0, "lock": threading.Lock()}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with state["lock"]:
+                state["requests"] += 1
+                n = state["requests"]
+            time.sleep(latency)
+            if n == throttle_at:
+                self.send_response(429)
+                self.send_header('Retry-After', '1')
+                self.end_headers()
+                return
+
+            url = urlparse(self.path)
+            if url.path.startswith('/category/'):
+                _, _, key, page_file = url.path.split('/')
+                page = int(page_file.split('.')[0])
+            else:
+                query = parse_qs(url.query)
+                key, page = query['tag_0'][0], int(query['page'][0])
+
+            products = [{"code": f"{key}-{page}-{i}", "product_name": f"{key} {i}",
+                         "ingredients_text": "water, soy sauce"} for i in range(100)] if page <= pages else []
+            body = json.dumps({"products": products}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body)
+
+    return StubHandler, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步 OFF 采集器并发基准（本地桩服务）")
+    parser.add_argument('--latency', type=float, default=0.2, help="桩服务每个请求的模拟延迟（秒）")
+    parser.add_argument('--pages', type=int, default=5, help="每个游标的数据页数")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    # 测的是并发抓取，桩服务的响应不能进（也不能来自）HTTP 缓存
+    http_cache.configure(mode="off")
+    tmp_dir = tempfile.mkdtemp(prefix="bench_off_")
+    try:
+        for concurrency in args.concurrency:
+            handler, state = make_stub_handler(args.latency, args.pages, throttle_at=5)
+            server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+
+            db_path = os.path.join(tmp_dir, f"c{concurrency}.db")
+            conn = sqlite3.connect(db_path)
+            with open(SCHEMA_PATH, 'r') as f:
+                conn.executescript(f.read())
+            conn.close()
+
+            t0 = time.perf_counter()
+            asyncio.run(crawl_async(
+                concurrency=concurrency, category_max_pages=args.pages + 1, origin_max_pages=args.pages + 1,
+                category_base_url=base_url, search_base_url=base_url,
+                # 桩服务不需要遵守 OFF 的真实限速
+                rate_limits={"facet": 6000, "search": 6000}, db_path=db_path))
+            elapsed = time.perf_counter() - t0
+            server.shutdown()
+
+            conn = sqlite3.connect(db_path)
+            rows = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            conn.close()
+            expected = (len(SAFE_TAGS) + len(ORIGINS)) * args.pages * 100
+            print(f"\n并发 {concurrency}: {elapsed:.2f}s, 请求 {state['requests']} 次, "
+                  f"写入 {rows}/{expected} 行")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+离线测试 / 测量 OFF 全量数据包导入 (scripts/import_off_dump.py)，不访问网络。
+
+生成确定性的合成数据包（JSONL / CSV，gzip 或未压缩），其中有命中默认过滤条件（ORIGINS 产地、SAFE_TAGS 分类）
+和不命中的产品、空行和坏行。对每种格式:
+  - 一次读完：耗时、行/秒，导入完成后断点文件应被删除
+  - 中途停下（--limit）再续传：结果必须与一次读完完全一致，累计的行数 / 条数也一致
+先在仓库自带的小数据包 benchmarks/fixtures/off_dump_sample.jsonl 上做同样的检查。
+
+用法:
+    python benchmarks/bench_off_dump.py --rows 200000
+    python benchmarks/bench_off_dump.py --write-fixture     # 重新生成 fixtures/off_dump_sample.jsonl
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../scripts'))
+
+from fetch_off import ORIGINS, SAFE_TAGS  # noqa: E402
+from import_off_dump import DumpFilter, import_off_dump  # noqa: E402
+from init_db import ensure_schema  # noqa: E402
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures/off_dump_sample.jsonl')
+FIXTURE_ROWS = 40
+
+OTHER_COUNTRIES = ["en:france", "en:germany", "en:united-states", "en:canada"]
+OTHER_CATEGORIES = ["en:breakfast-cereals", "en:chocolates", "en:beverages", "en:cheeses"]
+INGREDIENTS = ["water, soy sauce (soybeans, wheat), sugar", "rice, salt", "milk, sugar, cocoa butter",
+               "小麦粉、植物油脂、食塩", "大豆、小麦、食盐", "farine de blé, œufs, sucre"]
+CSV_FIELDS = ["code", "product_name", "brands", "ingredients_text", "allergens", "traces", "categories",
+              "categories_tags", "countries", "countries_tags", "origins", "origins_tags"]
+
+
+def tag(value):
+    return "en:" + value.lower().replace(' ', '-')
+
+
+def generate_products(rows, seed=7):
+    """产出 (产品 dict 或 None, 原始行)；None 表示空行或坏行。"""
+    rng = random.Random(seed)
+    for i in range(rows):
+        roll = rng.random()
+        if roll < 0.01:
+            yield None, ""
+            continue
+        if roll < 0.02:
+            yield None, '{"code": "broken'
+            continue
+        categories = [rng.choice(OTHER_CATEGORIES)]
+        origins = []
+        if roll < 0.3:
+            categories.append(rng.choice(SAFE_TAGS))
+        elif roll < 0.5:
+            origins.append(tag(rng.choice(ORIGINS)))
+        product = {
+            "code": f"{9000000000000 + i}",
+            "product_name": f"Product {i}",
+            "brands": rng.choice(["Kikkoman", "Nissin", "Lee Kum Kee", "Generic"]),
+            "ingredients_text": rng.choice(INGREDIENTS),
+            "allergens": "en:soybeans,en:gluten" if rng.random() < 0.3 else "",
+            "traces": "en:peanuts" if rng.random() < 0.1 else "",
+            "categories": ",".join(categories),
+            "categories_tags": categories,
+            "countries": rng.choice(OTHER_COUNTRIES),
+            "countries_tags": [rng.choice(OTHER_COUNTRIES)],
+            "origins": ",".join(origins),
+            "origins_tags": origins,
+        }
+        yield product, None
+
+
+def write_dump(path, rows, seed=7):
+    csv_dump = '.csv' in os.path.basename(path)
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8', newline='\n') as f:
+        if csv_dump:
+            f.write("\t".join(CSV_FIELDS) + "\n")
+        for product, raw in generate_products(rows, seed):
+            if product is None:
+                # CSV 数据包里没有坏 JSON，只保留空行
+                if not csv_dump or not raw:
+                    f.write(raw + "\n")
+                continue
+            if csv_dump:
+                values = [",".join(v) if isinstance(v, list) else v for v in (product[k] for k in CSV_FIELDS)]
+                f.write("\t".join(values) + "\n")
+            else:
+                f.write(json.dumps(product, ensure_ascii=False) + "\n")
+
+
+def new_db(path):
+    conn = sqlite3.connect(path)
+    ensure_schema(conn)
+    conn.close()
+
+
+def snapshot(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, barcode, name, brand, ingredients, allergens, traces, categories, countries "
+                        "FROM products ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def check(label, dump_path, rows, work_dir):
+    product_filter = DumpFilter(origins=ORIGINS, categories=SAFE_TAGS)
+
+    full_db = os.path.join(work_dir, 'full.db')
+    checkpoint = os.path.join(work_dir, 'checkpoint.json')
+    new_db(full_db)
+    t0 = time.perf_counter()
+    kept = import_off_dump(dump_path, product_filter, db_path=full_db, checkpoint_path=checkpoint)
+    elapsed = time.perf_counter() - t0
+    assert not os.path.exists(checkpoint), "导入完成后断点文件应被删除"
+
+    resumed_db = os.path.join(work_dir, 'resumed.db')
+    new_db(resumed_db)
+    # 读到三分之一处停下
+    limit = max(1, rows // 3)
+    import_off_dump(dump_path, product_filter, db_path=resumed_db, checkpoint_path=checkpoint, limit=limit)
+    assert os.path.exists(checkpoint), "中途停下时应保留断点"
+    resumed_kept = import_off_dump(dump_path, product_filter, db_path=resumed_db, checkpoint_path=checkpoint)
+
+    same = snapshot(full_db) == snapshot(resumed_db)
+    print(f"{label:<28} 一次读完 {elapsed:6.2f}s，保留 {kept} 条；"
+          f"续传后 {'一致' if same and resumed_kept == kept else '不一致!'}（累计保留 {resumed_kept} 条）")
+    for path in (full_db, resumed_db):
+        os.remove(path)
+    return same and resumed_kept == kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OFF 全量数据包导入的离线测试与吞吐")
+    parser.add_argument('--rows', type=int, default=200000, help="合成数据包的行数")
+    parser.add_argument('--write-fixture', action='store_true', help=f"重新生成 {FIXTURE_PATH}（{FIXTURE_ROWS} 行）")
+    args = parser.parse_args()
+
+    if args.write_fixture:
+        os.makedirs(os.path.dirname(FIXTURE_PATH), exist_ok=True)
+        write_dump(FIXTURE_PATH, FIXTURE_ROWS)
+        print(f"已写入 {FIXTURE_PATH}")
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench_off_dump_")
+    try:
+        ok = check("fixture (jsonl)", FIXTURE_PATH, FIXTURE_ROWS, work_dir)
+        for name in ("dump.jsonl.gz", "dump.jsonl", "dump.csv.gz"):
+            dump_path = os.path.join(work_dir, name)
+            write_dump(dump_path, args.rows)
+            size = os.path.getsize(dump_path) / 1e6
+            ok = check(f"{name} ({args.rows} 行, {size:.0f} MB)", dump_path, args.rows, work_dir) and ok
+            os.remove(dump_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
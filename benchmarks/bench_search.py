@@ -0,0 +1,189 @@
+"""
+在固定查询集上测量检索的延迟与召回率 (recall@10):
+  - lexical: FTS5 全文检索（含品牌别名展开）
+  - hybrid*: hybrid_search，另外在归一化后的配料 (ingredient_tokens) 上检索并融合
+  - vector / hybrid: 需要安装 sentence-transformers，加 --vector 时才运行
+另外测量 FTS 同步触发器给批量写入带来的额外开销。
+
+合成库 = 大量无关的填充产品 + 少量已知答案的目标产品（英文、中文、日文、品牌别名）。
+
+用法:
+    python benchmarks/bench_search.py --rows 200000
+    python benchmarks/bench_search.py --rows 5000 --vector
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../db'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../scripts'))
+
+from advanced_cleaning import BRAND_ALIASES  # noqa: E402
+from brand_normalizer import build_normalizer  # noqa: E402
+from ingest import BulkWriter, product_row  # noqa: E402
+from ingredient_tokens import sync_ingredient_tokens  # noqa: E402
+from init_db import SCHEMA_PATH, ensure_schema  # noqa: E402
+from search import hybrid_search, lexical_search, reciprocal_rank_fusion  # noqa: E402
+
+# (id, name, brand, ingredients, categories)
+TARGETS = [
+    ("T1", "Creamy Peanut Butter", "Skippy", "roasted peanuts, sugar, palm oil", "spreads"),
+    ("T2", "Crunchy Peanut Butter", "Jif", "peanuts, molasses, salt", "spreads"),
+    ("T3", "花生酱", "海天", "花生, 白砂糖, 食用盐", "调味品"),
+    ("T4", "Soy Sauce Naturally Brewed", "Kikkoman", "water, wheat, soybeans, salt", "condiments"),
+    ("T5", "特级酱油", "Kikkoman", "水, 大豆, 小麦, 食盐", "调味品"),
+    ("T6", "Cup Noodles Chicken", "Nissin", "wheat flour, palm oil, chicken", "instant noodles"),
+    ("T7", "出前一丁", "Nissin", "小麦粉, 植物油脂, ごま油", "インスタントラーメン"),
+    ("T8", "Pure Sesame Oil", "Kadoya", "sesame", "oils"),
+    ("T9", "ごまドレッシング", "Mizkan", "ごま, 醸造酢, 砂糖", "ドレッシング"),
+    ("T10", "Premium Oyster Sauce", "Lee Kum Kee", "oyster extracts, sugar, salt", "condiments"),
+    ("T11", "蚝油", "Lee Kum Kee", "蚝汁, 白砂糖, 食盐", "调味品"),
+    ("T12", "壺底油精", "Wan Ja Shan", "水、黑豆、醬油、鹽", "調味料"),
+    ("T13", "Dried Apricots", "Sunny Fruit", "apricots, sulphur dioxide (E 220)", "snacks"),
+]
+
+# (查询, 相关产品)
+QUERIES = [
+    ("peanut butter", {"T1", "T2"}),
+    ("花生", {"T3"}),
+    ("kikkoman", {"T4", "T5"}),
+    ("萬字", {"T4", "T5"}),          # Kikkoman 的别名
+    ("日清", {"T6", "T7"}),          # Nissin 的别名
+    ("nissin noodles", {"T6"}),
+    ("ごま", {"T7", "T9"}),
+    ("sesame", {"T8"}),
+    ("oyster sauce", {"T10"}),
+    ("李锦记", {"T10", "T11"}),      # Lee Kum Kee 的别名
+    ("蚝油", {"T11"}),
+    ("soy sauce", {"T4"}),
+    ("酱油", {"T5", "T12"}),         # T12 的配料是繁体 醬油，只在归一化后的配料中命中
+    ("e220", {"T13"}),               # 配料中写作 E 220
+    ("E 220", {"T13"}),              # 整个检索词归一化后是 e220，不会拆成 e 和 220
+    ("INS 220", {"T13"}),
+]
+
+FILLER_WORDS = ["rice", "corn", "tomato", "oat", "apple", "carrot", "potato", "sugar", "salt", "water",
+                "vinegar", "onion", "garlic", "pepper", "lentil", "cocoa", "vanilla",
+                "米", "玉米", "番茄", "苹果", "胡萝卜", "土豆", "醋"]
+FILLER_CATEGORIES = ["snacks", "cereals", "beverages", "frozen", "零食", "飲料"]
+
+
+def filler_rows(rows, seed=5):
+    rng = random.Random(seed)
+    for i in range(rows):
+        yield product_row(f"F{i}", "OFF", name=" ".join(rng.sample(FILLER_WORDS, 2)) + f" {i}",
+                          brand=f"Brand{i % 997}", ingredients=", ".join(rng.sample(FILLER_WORDS, 5)),
+                          categories=rng.choice(FILLER_CATEGORIES))
+
+
+def load(path, rows):
+    """通过采集脚本共用的 BulkWriter 写入，返回耗时。"""
+    t0 = time.perf_counter()
+    with BulkWriter(path, label="bench") as writer:
+        writer.add_many(filler_rows(rows))
+        writer.add_many(product_row(p_id, "OFF", name=name, brand=brand, ingredients=ingredients,
+                                    categories=categories)
+                        for p_id, name, brand, ingredients, categories in TARGETS)
+    return time.perf_counter() - t0
+
+
+def recall_at(ids, relevant, k=10):
+    return len(set(ids[:k]) & relevant) / min(len(relevant), k)
+
+
+def evaluate(label, search):
+    latencies = []
+    recalls = []
+    for query, relevant in QUERIES:
+        t0 = time.perf_counter()
+        ids = search(query)
+        latencies.append(time.perf_counter() - t0)
+        recalls.append(recall_at(ids, relevant))
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<10} recall@10 {statistics.mean(recalls):.2f}   "
+          f"mean {statistics.mean(latencies) * 1000:.2f} ms   p95 {p95 * 1000:.2f} ms")
+    misses = [q for (q, relevant), r in zip(QUERIES, recalls) if r < 1.0]
+    if misses:
+        print(f"{'':<10} 未完全召回: {', '.join(misses)}")
+
+
+def build_vector_search(workdir, conn):
+    try:
+        import chromadb
+        from embedding_engine import EmbeddingEngine
+    except ImportError as e:
+        print(f"跳过向量检索: {e}")
+        return None
+    rows = conn.execute("SELECT id, name, brand, ingredients FROM products").fetchall()
+    client = chromadb.PersistentClient(path=os.path.join(workdir, 'chroma'))
+    collection = client.create_collection(name="bench")
+    engine = EmbeddingEngine(workers=1)
+    try:
+        docs = [f"Name: {n or ''}. Brand: {b or ''}. Ingredients: {i or ''}." for _, n, b, i in rows]
+        for start in range(0, len(rows), 1000):
+            collection.add(ids=[r[0] for r in rows[start:start + 1000]], documents=docs[start:start + 1000],
+                           embeddings=engine.encode(docs[start:start + 1000]))
+    except ImportError as e:
+        engine.close()
+        print(f"跳过向量检索: {e}")
+        return None
+
+    def search(query, limit=30):
+        return collection.query(query_embeddings=engine.encode([query]), n_results=limit)['ids'][0]
+    return search
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help="填充产品数")
+    parser.add_argument('--vector', action='store_true', help="同时测量向量检索与混合检索（需要模型）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_search_")
+    try:
+        plain_path = os.path.join(workdir, 'plain.db')
+        plain = sqlite3.connect(plain_path)
+        with open(SCHEMA_PATH, 'r') as f:
+            plain.executescript(f.read())
+        plain.close()
+        t_plain = load(plain_path, args.rows)
+
+        path = os.path.join(workdir, 'food.db')
+        conn = sqlite3.connect(path)
+        ensure_schema(conn)
+        conn.close()
+        t_fts = load(path, args.rows)
+        print(f"写入 {args.rows} 行: 无 FTS {t_plain:.2f}s，带 FTS 触发器 {t_fts:.2f}s "
+              f"(+{(t_fts / t_plain - 1):.0%})")
+        conn = sqlite3.connect(path)
+        t0 = time.perf_counter()
+        sync_ingredient_tokens(conn)
+        print(f"配料归一化 (ingredient_tokens): {time.perf_counter() - t0:.2f}s\n")
+
+        normalizer = build_normalizer(BRAND_ALIASES)
+        evaluate("lexical", lambda q: lexical_search(conn, q, 30, normalizer))
+
+        if args.vector:
+            vector = build_vector_search(workdir, conn)
+            if vector is not None:
+                evaluate("vector", lambda q: vector(q))
+                evaluate("hybrid", lambda q: reciprocal_rank_fusion(
+                    [lexical_search(conn, q, 30, normalizer), vector(q)])[:10])
+        else:
+            # 没有向量库时 hybrid_search 退化为全文检索
+            evaluate("hybrid*", lambda q: hybrid_search(conn, q, 10, normalizer=normalizer)[0])
+            print("(* 未加 --vector：没有向量检索器，hybrid_search 只走全文检索)")
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
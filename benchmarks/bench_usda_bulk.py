@@ -0,0 +1,183 @@
+"""
+离线测试 / 测量 USDA Branded Foods 全量数据包导入 (scripts/import_usda_bulk.py)，不访问网络。
+
+生成确定性的合成数据包，结构与官方下载一致:
+    JSON zip  一个 {"BrandedFoods": [...]} 文件，每个食品带 foodNutrients 等大字段
+    CSV zip   branded_food.csv + food.csv（名称在 food.csv 中，另有非品牌食品行）
+两种 zip 分别在单独的子进程 (spawn) 中导入，报告耗时和峰值内存 (ru_maxrss)，并校验写入的产品完全一致；
+JSON 另与一次 json.loads 整个文件的解析做对比。
+
+用法:
+    python benchmarks/bench_usda_bulk.py --foods 300000
+    python benchmarks/bench_usda_bulk.py --foods 2000 --keep /tmp/usda   # 保留生成的 zip，供手动测试
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from fetch_usda import USDA_QUERIES  # noqa: E402
+from init_db import ensure_schema  # noqa: E402
+
+CATEGORIES = ["Asian Foods", "Candy", "Cereal", "Frozen Dinners & Entrees", "Sauces, Spices & Salsas",
+              "Soups", "Snacks, Chips"]
+WORDS = ["Chicken", "Noodle", "Sauce", "Rice", "Crackers", "Cookie", "Soup", "Dumpling", "Bar", "Cereal"]
+INGREDIENTS = ["WATER, SOY SAUCE (WATER, SOYBEANS, WHEAT, SALT), SUGAR", "ENRICHED FLOUR, SUGAR, PALM OIL",
+               "RICE, SALT", "MILK, CREAM, SUGAR", "PEANUTS, SALT", "TOMATOES, ONIONS, GARLIC"]
+NUTRIENTS_PER_FOOD = 20
+
+
+def generate_foods(foods, seed=11):
+    rng = random.Random(seed)
+    for i in range(foods):
+        name = " ".join(rng.sample(WORDS, 2))
+        if rng.random() < 0.2:
+            name = f"{rng.choice(USDA_QUERIES)} {name}"
+        yield {
+            "fdcId": 1000000 + i,
+            "description": name.upper(),
+            "brandOwner": rng.choice(["Kikkoman Sales USA, Inc.", "Nissin Foods", "Generic Foods LLC"]),
+            "brandName": rng.choice(["KIKKOMAN", "CUP NOODLES", ""]),
+            "gtinUpc": f"{rng.randrange(10 ** 11, 10 ** 12)}",
+            "ingredients": rng.choice(INGREDIENTS),
+            "brandedFoodCategory": rng.choice(CATEGORIES),
+            "marketCountry": "United States",
+            "foodNutrients": [{"nutrient": {"id": 1000 + n, "number": str(200 + n), "unitName": "G"},
+                               "amount": round(rng.random() * 50, 2)} for n in range(NUTRIENTS_PER_FOOD)],
+        }
+
+
+def write_json_zip(path, foods, seed=11):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("brandedDownload.json", 'w', force_zip64=True) as raw:
+            out = io.TextIOWrapper(raw, encoding='utf-8')
+            out.write('{"BrandedFoods": [\n')
+            for i, food in enumerate(generate_foods(foods, seed)):
+                out.write((",\n" if i else "") + json.dumps(food))
+            out.write("\n]}\n")
+            out.flush()
+            out.detach()
+
+
+def write_csv_zip(path, foods, seed=11):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("FoodData_Central_branded_food_csv/food.csv", 'w', force_zip64=True) as raw:
+            out = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            writer = csv.writer(out)
+            writer.writerow(["fdc_id", "data_type", "description", "food_category_id", "publication_date"])
+            for food in generate_foods(foods, seed):
+                writer.writerow([food["fdcId"], "branded_food", food["description"], "", "2024-10-31"])
+                # 非品牌食品的行：导入时应被忽略
+                if food["fdcId"] % 50 == 0:
+                    writer.writerow([food["fdcId"] + 10 ** 7, "sr_legacy_food", "Soup, chicken", "6", "2019-04-01"])
+            out.flush()
+            out.detach()
+        with zf.open("FoodData_Central_branded_food_csv/branded_food.csv", 'w', force_zip64=True) as raw:
+            out = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            writer = csv.writer(out)
+            writer.writerow(["fdc_id", "brand_owner", "brand_name", "gtin_upc", "ingredients",
+                             "branded_food_category", "market_country"])
+            for food in generate_foods(foods, seed):
+                writer.writerow([food["fdcId"], food["brandOwner"], food["brandName"], food["gtinUpc"],
+                                 food["ingredients"], food["brandedFoodCategory"], food["marketCountry"]])
+            out.flush()
+            out.detach()
+
+
+def run_import(zip_path, db_path, queue):
+    from import_usda_bulk import FoodFilter, import_usda_bulk
+    t0 = time.perf_counter()
+    kept = import_usda_bulk(zip_path, FoodFilter(USDA_QUERIES), db_path=db_path)
+    queue.put((time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, kept))
+
+
+def run_json_loads(zip_path, db_path, queue):
+    # 旧做法的下限：整个 JSON 一次读入内存再解析（还没有写库）
+    t0 = time.perf_counter()
+    with zipfile.ZipFile(zip_path) as zf:
+        data = json.loads(zf.read("brandedDownload.json"))
+    count = len(data["BrandedFoods"])
+    queue.put((time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, count))
+
+
+def in_subprocess(target, zip_path, db_path):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(zip_path, db_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def new_db(path):
+    conn = sqlite3.connect(path)
+    ensure_schema(conn)
+    conn.close()
+
+
+def snapshot(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, source, barcode, name, brand, ingredients, categories, countries "
+                        "FROM products ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="USDA Branded Foods 全量数据包导入的离线测试与吞吐")
+    parser.add_argument('--foods', type=int, default=100000, help="合成数据包中的品牌食品数")
+    parser.add_argument('--keep', help="把生成的 zip 保留在这个目录")
+    args = parser.parse_args()
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="bench_usda_bulk_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        json_zip = os.path.join(work_dir, "FoodData_Central_branded_food_json_synthetic.zip")
+        csv_zip = os.path.join(work_dir, "FoodData_Central_branded_food_csv_synthetic.zip")
+        t0 = time.perf_counter()
+        write_json_zip(json_zip, args.foods)
+        write_csv_zip(csv_zip, args.foods)
+        with zipfile.ZipFile(json_zip) as zf:
+            uncompressed = zf.getinfo("brandedDownload.json").file_size
+        print(f"生成 {args.foods} 个食品: JSON {uncompressed / 1e6:.0f} MB（解压后），"
+              f"zip {os.path.getsize(json_zip) / 1e6:.0f} MB / CSV zip {os.path.getsize(csv_zip) / 1e6:.0f} MB，"
+              f"{time.perf_counter() - t0:.1f}s\n")
+
+        snapshots = {}
+        for label, zip_path in (("json", json_zip), ("csv", csv_zip)):
+            db_path = os.path.join(work_dir, f"{label}.db")
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            new_db(db_path)
+            elapsed, rss, kept = in_subprocess(run_import, zip_path, db_path)
+            snapshots[label] = snapshot(db_path)
+            print(f"{label:<10} 导入 {elapsed:6.2f}s   峰值内存 {rss:6.0f} MB   保留 {kept} 条")
+
+        elapsed, rss, count = in_subprocess(run_json_loads, json_zip, None)
+        print(f"{'json.loads':<10} 解析 {elapsed:6.2f}s   峰值内存 {rss:6.0f} MB   （{count} 条，不含过滤和写库）")
+
+        same = snapshots["json"] == snapshots["csv"] and len(snapshots["json"]) > 0
+        print(f"\nJSON 与 CSV 数据包写入的产品一致: {same}")
+        if not same:
+            sys.exit(1)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+流水线各阶段的基准套件：在确定性合成数据 (synthetic.py) 上依次运行
+    ingest → advanced_cleaning → clean_data → normalize → enrich → enrich_incremental → check_quality → export → graph
+（可选 vector），记录每个阶段的耗时、行/秒和峰值内存，写入 JSON 结果文件，并与基线比较。
+
+每个阶段在单独的子进程 (spawn) 中运行，峰值内存取该进程的 ru_maxrss；
+各阶段按流水线顺序作用在同一个数据库上（清洗后的数据再做标注、导出……）。
+
+用法:
+    python benchmarks/run_suite.py                                  # 10k / 100k / 1M
+    python benchmarks/run_suite.py --sizes 10000 100000 --save-baseline
+    python benchmarks/run_suite.py --sizes 100000 --threshold 0.15   # 与基线比较，变慢超过 15% 时退出码为 1
+    python benchmarks/run_suite.py --sizes 10000 --stages enrich export
+    python benchmarks/run_suite.py --sizes 10000 --vector            # 需要 chromadb / sentence-transformers
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '../db'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '../scripts'))
+sys.path.insert(0, BENCH_DIR)
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+RESULTS_PATH = os.path.join(RESULTS_DIR, 'latest.json')
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'baseline.json')
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_THRESHOLD = 0.2
+
+
+# --- 各阶段（在子进程中运行；db_path / workdir 为本次运行的临时目录） ---
+# 返回数值时以它作为该阶段的耗时（用于扣除造数等不属于被测代码的开销）
+
+def stage_ingest(db_path, workdir, rows, seed):
+    from synthetic import build_synthetic_db
+    write_seconds, _ = build_synthetic_db(db_path, rows, seed)
+    return write_seconds
+
+
+def stage_advanced_cleaning(db_path, workdir, rows, seed):
+    import advanced_cleaning
+    advanced_cleaning.DB_PATH = db_path
+    advanced_cleaning.advanced_cleaning(alias_file=None)
+
+
+def stage_clean_data(db_path, workdir, rows, seed):
+    import clean_data
+    clean_data.DB_PATH = db_path
+    clean_data.clean_and_consolidate()
+
+
+def stage_normalize(db_path, workdir, rows, seed):
+    import ingredient_tokens
+    ingredient_tokens.DB_PATH = db_path
+    ingredient_tokens.normalize_ingredients(full=True)
+
+
+def stage_enrich(db_path, workdir, rows, seed):
+    import enrich_allergens
+    enrich_allergens.DB_PATH = db_path
+    enrich_allergens.enrich_allergens(full=True)
+
+
+def stage_enrich_incremental(db_path, workdir, rows, seed):
+    # 数据没有变化时的增量运行：只比对指纹
+    import enrich_allergens
+    enrich_allergens.DB_PATH = db_path
+    enrich_allergens.enrich_allergens()
+
+
+def stage_check_quality(db_path, workdir, rows, seed):
+    from check_quality import audit
+    conn = sqlite3.connect(db_path)
+    try:
+        audit(conn)
+    finally:
+        conn.close()
+
+
+def stage_export(db_path, workdir, rows, seed):
+    import export_csv
+    export_csv.DB_PATH = db_path
+    export_csv.export_to_csv(os.path.join(workdir, 'summary.csv'))
+
+
+def stage_graph(db_path, workdir, rows, seed):
+    import build_graph
+    build_graph.DB_PATH = db_path
+    build_graph.build_graph(os.path.join(workdir, 'food_graph'), os.path.join(workdir, 'food_graph.jsonl'))
+
+
+def stage_vector(db_path, workdir, rows, seed):
+    import init_vector
+    init_vector.DB_PATH = db_path
+    init_vector.CHROMA_PATH = os.path.join(workdir, 'chroma_db')
+    # 不用向量缓存，测的是实际编码吞吐
+    init_vector.init_vector_db(use_cache=False)
+
+
+STAGES = {
+    "ingest": stage_ingest,
+    "advanced_cleaning": stage_advanced_cleaning,
+    "clean_data": stage_clean_data,
+    "normalize": stage_normalize,
+    "enrich": stage_enrich,
+    "enrich_incremental": stage_enrich_incremental,
+    "check_quality": stage_check_quality,
+    "export": stage_export,
+    "graph": stage_graph,
+    "vector": stage_vector,
+}
+OPTIONAL_STAGES = {"vector"}
+
+
+def child(name, db_path, workdir, rows, seed, results):
+    sys.path.insert(0, os.path.join(BENCH_DIR, '../db'))
+    sys.path.insert(0, os.path.join(BENCH_DIR, '../scripts'))
+    sys.path.insert(0, BENCH_DIR)
+    try:
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            measured = STAGES[name](db_path, workdir, rows, seed)
+        elapsed = time.perf_counter() - t0 if measured is None else measured
+    except ImportError as e:
+        results.put(("skipped", str(e)))
+        return
+    except Exception as e:
+        results.put(("error", f"{type(e).__name__}: {e}"))
+        return
+    # Linux 上 ru_maxrss 的单位是 KB
+    results.put(("ok", (elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)))
+
+
+def run_stage(name, db_path, workdir, rows, seed):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=child, args=(name, db_path, workdir, rows, seed, results))
+    process.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                # 子进程被杀（如内存不足）时不会写回结果
+                if not process.is_alive():
+                    return "error", f"子进程退出，退出码 {process.exitcode}"
+    finally:
+        process.join()
+
+
+def count_products(db_path):
+    if not os.path.exists(db_path):
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_size(rows, stages, seed):
+    """在一个新的临时目录中按顺序运行各阶段，返回 {阶段: 指标}。"""
+    workdir = tempfile.mkdtemp(prefix=f"bench_suite_{rows}_")
+    db_path = os.path.join(workdir, 'food.db')
+    results = {}
+    try:
+        for name in stages:
+            # 行/秒按阶段开始时的产品数计算（ingest 按生成的行数）
+            stage_rows = rows if name == "ingest" else count_products(db_path)
+            status, value = run_stage(name, db_path, workdir, rows, seed)
+            if status != "ok":
+                results[name] = {"status": status, "detail": value}
+                print(f"  {name:<20} {status}: {value}")
+                continue
+            elapsed, peak_mb = value
+            results[name] = {"status": "ok", "rows": stage_rows, "seconds": round(elapsed, 3),
+                             "rows_per_sec": round(stage_rows / elapsed, 1) if elapsed > 0 else None,
+                             "peak_rss_mb": round(peak_mb, 1)}
+            print(f"  {name:<20} {elapsed:>9.2f}s {results[name]['rows_per_sec'] or 0:>12,.0f} 行/秒 "
+                  f"{peak_mb:>8.0f}MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线逐项比较：耗时或峰值内存比基线高出 threshold（比例）以上记为回退。
+    返回回退列表 [(规模, 阶段, 指标, 基线值, 本次值)]。
+    """
+    regressions = []
+    for size, stages in results["results"].items():
+        for name, metrics in stages.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if metrics.get("status") != "ok" or not base or base.get("status") != "ok":
+                continue
+            for key in ("seconds", "peak_rss_mb"):
+                if base[key] and metrics[key] > base[key] * (1 + threshold):
+                    regressions.append((size, name, key, base[key], metrics[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="每轮生成的产品数")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                        help="只运行这些阶段（按流水线顺序执行；未包含 ingest 时也会先生成数据）")
+    parser.add_argument('--vector', action='store_true', help="加上 vector 阶段（需要模型，较慢）")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=RESULTS_PATH, help="结果 JSON 路径")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="基线 JSON 路径")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="允许比基线慢 / 多占内存的比例（默认 0.2 即 20%%）")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为新的基线")
+    args = parser.parse_args()
+
+    if args.stages:
+        selected = set(args.stages) | {"ingest"}
+    else:
+        selected = set(STAGES) - OPTIONAL_STAGES
+    if args.vector:
+        selected.add("vector")
+    stages = [name for name in STAGES if name in selected]
+
+    report = {
+        "generated_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "seed": args.seed,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "results": {},
+    }
+    for rows in args.sizes:
+        print(f"== {rows} 行")
+        report["results"][str(rows)] = run_size(rows, stages, args.seed)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        shutil.copyfile(args.output, args.baseline)
+        print(f"已保存为基线: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("没有基线文件，跳过比较（用 --save-baseline 生成）")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    if not regressions:
+        print(f"与基线相比没有超过 {args.threshold:.0%} 的回退")
+        return
+    print(f"与基线相比有 {len(regressions)} 项回退（阈值 {args.threshold:.0%}）:")
+    for size, name, key, base, value in regressions:
+        print(f"  {size:>8} 行 {name:<20} {key:<12} {base} -> {value} (+{value / base - 1:.0%})")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
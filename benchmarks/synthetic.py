@@ -0,0 +1,160 @@
+"""
+确定性的合成数据生成器（同一 seed + 行数总是生成同一批产品），供 run_suite.py 等基准共用。
+
+生成的产品覆盖流水线各阶段关心的情况:
+  - 英 / 法 / 中 / 日四种语言的配料表，过敏原词汇直接取自 ALLERGEN_DICT，
+    部分带 "可能含有" 短语 (MAY_CONTAIN_PHRASES)
+  - 重复条码（不同来源、不同完整度的同一商品）
+  - 垃圾配料（"N/A"、"see packaging"、过短文本）、HTML 标签和多余空白
+  - BRAND_ALIASES 中的品牌别名写法
+  - 既没有名称也没有配料的无效记录
+
+用法:
+    python benchmarks/synthetic.py --rows 100000 --output /tmp/synthetic.db
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../db'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../scripts'))
+
+from advanced_cleaning import BRAND_ALIASES  # noqa: E402
+from enrich_allergens import ALLERGEN_DICT, MAY_CONTAIN_PHRASES  # noqa: E402
+from ingest import BulkWriter, product_row  # noqa: E402
+from init_db import ensure_schema  # noqa: E402
+
+SOURCES = ["OFF", "USDA", "CNF", "JPN_GOV"]
+LANGUAGES = ["en", "fr", "zh", "ja"]
+
+FILLER = {
+    "en": ["water", "sugar", "salt", "rice", "corn starch", "vinegar", "onion powder", "garlic", "tomato paste",
+           "sunflower oil", "citric acid", "natural flavour", "potato", "cocoa", "vanilla extract"],
+    "fr": ["eau", "sucre", "sel", "riz", "amidon de maïs", "vinaigre", "oignon", "ail", "purée de tomate",
+           "huile de tournesol", "acide citrique", "arôme naturel", "pomme de terre", "cacao"],
+    "zh": ["水", "白砂糖", "食用盐", "大米", "玉米淀粉", "醋", "洋葱", "大蒜", "番茄酱", "葵花籽油",
+           "柠檬酸", "食用香精", "马铃薯", "可可粉"],
+    "ja": ["水", "砂糖", "食塩", "米", "コーンスターチ", "醸造酢", "たまねぎ", "にんにく", "トマトペースト",
+           "ひまわり油", "クエン酸", "香料", "じゃがいも", "ココア"],
+}
+SEPARATORS = {"en": ", ", "fr": ", ", "zh": "、", "ja": "、"}
+CATEGORIES = ["snacks", "beverages", "sauces", "instant noodles", "asian foods", "chinese sauces",
+              "japanese snacks", "biscuits", "dairies", "frozen foods"]
+COUNTRIES = ["United States", "France", "Canada", "Japan", "China", "Taiwan", "Hong Kong"]
+GARBAGE_INGREDIENTS = [None, "", "N/A", "none", "see packaging", "No ingredients", "-", "tbd"]
+
+
+def split_vocabulary():
+    """把 ALLERGEN_DICT 的关键词按文字分成拉丁文 / 中日文两组，按语言取词。"""
+    latin = {}
+    cjk = {}
+    for tag, keywords in ALLERGEN_DICT.items():
+        latin[tag] = [k for k in keywords if not any(ord(c) > 0x2E80 for c in k)]
+        cjk[tag] = [k for k in keywords if any(ord(c) > 0x2E80 for c in k)]
+    return latin, cjk
+
+
+LATIN_KEYWORDS, CJK_KEYWORDS = split_vocabulary()
+TAGS = list(ALLERGEN_DICT)
+BRAND_VARIANTS = [alias for canonical, aliases in BRAND_ALIASES.items() for alias in [canonical] + aliases]
+
+
+def allergen_keyword(rng, language, tag):
+    keywords = (CJK_KEYWORDS if language in ("zh", "ja") else LATIN_KEYWORDS)[tag] or ALLERGEN_DICT[tag]
+    return rng.choice(keywords)
+
+
+def ingredient_text(rng, language):
+    tags = rng.sample(TAGS, rng.randint(0, 3))
+    parts = rng.sample(FILLER[language], rng.randint(3, 8))
+    parts += [allergen_keyword(rng, language, tag) for tag in tags]
+    rng.shuffle(parts)
+    text = SEPARATORS[language].join(parts)
+    if rng.random() < 0.15:
+        trace_tag = rng.choice(TAGS)
+        text += f". {rng.choice(MAY_CONTAIN_PHRASES)} {allergen_keyword(rng, language, trace_tag)}"
+    return text, tags
+
+
+def noisy(rng, text):
+    """给文本加上 HTML 标签和多余空白（advanced_cleaning 要清理的情况）。"""
+    roll = rng.random()
+    if roll < 0.03:
+        return f"<p>{text}</p>"
+    if roll < 0.06:
+        return f"  {text.replace(' ', '   ')}\n"
+    return text
+
+
+def generate_products(rows, seed=42, dup_ratio=0.1):
+    """按行号顺序生成 product_row 元组；同样的参数总是得到同样的结果。"""
+    rng = random.Random(seed)
+    barcode_pool = max(1, int(rows * (1 - dup_ratio)))
+    for i in range(rows):
+        source = SOURCES[i % len(SOURCES)]
+        language = rng.choice(LANGUAGES)
+
+        if rng.random() < 0.06:
+            ingredients, tags = rng.choice(GARBAGE_INGREDIENTS), []
+        else:
+            ingredients, tags = ingredient_text(rng, language)
+            ingredients = noisy(rng, ingredients)
+
+        name = None if rng.random() < 0.03 else noisy(rng, f"{rng.choice(FILLER[language])} {i}")
+        if rng.random() < 0.2:
+            brand = rng.choice(BRAND_VARIANTS)
+            brand = brand.upper() if rng.random() < 0.2 else brand
+        else:
+            brand = f"Brand {rng.randrange(2000)}"
+
+        # OFF 风格的 API 标签（部分产品才有）
+        allergens = ",".join(tags) if tags and rng.random() < 0.3 else None
+        traces = rng.choice(TAGS) if rng.random() < 0.1 else None
+
+        yield product_row(
+            f"{source}_{i}", source,
+            barcode=f"{rng.randrange(barcode_pool):013d}" if rng.random() < 0.9 else None,
+            name=name, brand=brand, ingredients=ingredients, allergens=allergens, traces=traces,
+            image_url=f"https://images.example/{i}.jpg" if rng.random() < 0.4 else None,
+            categories=", ".join(rng.sample(CATEGORIES, rng.randint(1, 3))),
+            countries=rng.choice(COUNTRIES))
+
+
+def build_synthetic_db(path, rows, seed=42, dup_ratio=0.1):
+    """
+    建库（含全部迁移）并通过采集脚本共用的 BulkWriter 写入合成产品。
+    返回 (写入耗时, 生成耗时)：生成数据本身的开销单独计时，不算进写入。
+    """
+    conn = sqlite3.connect(path)
+    ensure_schema(conn)
+    conn.close()
+    products = generate_products(rows, seed, dup_ratio)
+    write_seconds = 0.0
+    generate_seconds = 0.0
+    with BulkWriter(path, label="synthetic") as writer:
+        while True:
+            t0 = time.perf_counter()
+            chunk = list(itertools.islice(products, writer.batch_size))
+            t1 = time.perf_counter()
+            generate_seconds += t1 - t0
+            if not chunk:
+                break
+            writer.add_many(chunk)
+            write_seconds += time.perf_counter() - t1
+        t0 = time.perf_counter()
+    write_seconds += time.perf_counter() - t0
+    return write_seconds, generate_seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dup-ratio', type=float, default=0.1, help="重复条码所占比例")
+    parser.add_argument('--output', required=True, help="输出的 SQLite 文件（已存在时追加/覆盖同 id 的行）")
+    args = parser.parse_args()
+    build_synthetic_db(args.output, args.rows, args.seed, args.dup_ratio)
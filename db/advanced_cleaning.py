@@ -1,28 +1,39 @@
-import sqlite3
 import os
 import re
+import argparse
+
+import instrumentation
+from brand_normalizer import build_normalizer
+from init_db import ensure_schema
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, 'data/food_data.db')
+# 可选的外部别名表 (CSV, 表头: alias,canonical)
+ALIAS_FILE = os.path.join(BASE_DIR, 'data/brand_aliases.csv')
 
-# 1. 定义品牌映射字典（可根据需要持续添加）
-BRAND_MAPPING = {
-    r"lee kum kee|李錦記|李锦记": "Lee Kum Kee",
-    r"nissin|日清食品|日清": "Nissin",
-    r"nongshim|农心|農心": "Nongshim",
-    r"kikkoman|万字|萬字": "Kikkoman",
-    r"maggi|美极|美極": "Maggi",
-    r"indomie|营多": "Indomie",
-    r"samyang|三养|三養": "Samyang"
+# 1. 定义品牌别名字典（可根据需要持续添加，更大的别名表放在 ALIAS_FILE 或 brand_aliases 表中）
+BRAND_ALIASES = {
+    "Lee Kum Kee": ["lee kum kee", "李錦記", "李锦记"],
+    "Nissin": ["nissin", "日清食品", "日清"],
+    "Nongshim": ["nongshim", "农心", "農心"],
+    "Kikkoman": ["kikkoman", "万字", "萬字"],
+    "Maggi": ["maggi", "美极", "美極"],
+    "Indomie": ["indomie", "营多"],
+    "Samyang": ["samyang", "三养", "三養"]
 }
 
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# 每批写回的行数
+UPDATE_BATCH_SIZE = 5000
+
 def sanitize_text(text):
     if not text: return ""
     # 去除 HTML 标签
-    text = re.sub(r'<[^>]+>', '', text)
-    # 去除多余空格和换行
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    if '<' in text:
+        text = HTML_TAG_RE.sub('', text)
+    # 去除多余空格和换行（str.split() 与 \s+ 使用相同的空白字符定义）
+    return ' '.join(text.split())
 
 def is_garbage_ingredients(text):
     if not text: return True
@@ -32,56 +43,87 @@ def is_garbage_ingredients(text):
     if text.lower() in garbage_keywords: return True
     return False
 
-def advanced_cleaning():
-    conn = sqlite3.connect(DB_PATH)
+def clean_product(normalizer, name, brand, ingredients):
+    new_name = sanitize_text(name)
+    new_ingredients = sanitize_text(ingredients)
+    new_brand = sanitize_text(brand)
+
+    # 1. 品牌归一化
+    canonical_name = normalizer.normalize(new_brand, new_name)
+    if canonical_name:
+        new_brand = canonical_name
+
+    # 2. 检查配料表是否有效
+    if is_garbage_ingredients(new_ingredients):
+        # 标记这些产品的配料表为 NULL，避免 Agent 被误导
+        new_ingredients = ""
+
+    return new_name, new_brand, new_ingredients
+
+@instrumentation.instrumented("advanced_cleaning")
+def advanced_cleaning(alias_file=ALIAS_FILE):
+    conn = instrumentation.connect(DB_PATH)
+    ensure_schema(conn)
     cursor = conn.cursor()
     
     print("开始执行高级数据清洗...")
 
+    normalizer = build_normalizer(BRAND_ALIASES, cursor=cursor, alias_file=alias_file)
+    print(f"已加载 {len(normalizer.canonical_names)} 个标准品牌，"
+          f"{len(normalizer.automaton.keywords)} 个别名。")
+
     # 获取所有需要处理的产品
     cursor.execute("SELECT id, name, brand, ingredients FROM products")
-    products = cursor.fetchall()
     
     cleaned_count = 0
-    garbage_deleted = 0
+    updated_count = 0
+    pending = []
     
-    for p_id, name, brand, ingredients in products:
-        new_name = sanitize_text(name)
-        new_ingredients = sanitize_text(ingredients)
-        new_brand = sanitize_text(brand)
-        
-        # 1. 品牌归一化
-        for pattern, canonical_name in BRAND_MAPPING.items():
-            if re.search(pattern, new_brand, re.IGNORECASE) or re.search(pattern, new_name, re.IGNORECASE):
-                new_brand = canonical_name
-                break
-        
-        # 2. 检查配料表是否有效
-        if is_garbage_ingredients(new_ingredients):
-            # 标记这些产品的配料表为 NULL，避免 Agent 被误导
-            new_ingredients = ""
-            
-        # 3. 更新数据库
-        cursor.execute("""
-            UPDATE products 
-            SET name = ?, brand = ?, ingredients = ? 
-            WHERE id = ?
-        """, (new_name, new_brand, new_ingredients, p_id))
+    for p_id, name, brand, ingredients in cursor.fetchall():
+        new_name, new_brand, new_ingredients = clean_product(normalizer, name, brand, ingredients)
         cleaned_count += 1
 
-    conn.commit()
+        # 3. 只写回真正有变化的行，避免每次运行都重写整张表
+        if (new_name, new_brand, new_ingredients) == (name, brand, ingredients):
+            continue
+        pending.append((new_name, new_brand, new_ingredients, p_id))
+        if len(pending) >= UPDATE_BATCH_SIZE:
+            updated_count += flush_updates(conn, pending)
+            pending = []
+
+    updated_count += flush_updates(conn, pending)
     
     # 4. 物理删除：删除既没名字又没配料表的完全无用数据
     cursor.execute("DELETE FROM products WHERE (name = '' OR name IS NULL) AND (ingredients = '' OR ingredients IS NULL)")
     garbage_deleted = cursor.rowcount
+    instrumentation.current().add("rows_written", updated_count + garbage_deleted)
     
     conn.commit()
     conn.close()
     
     print(f"清洗任务完成：")
-    print(f" - 标准化/清洗了 {cleaned_count} 条记录")
+    print(f" - 检查了 {cleaned_count} 条记录，其中 {updated_count} 条有变化并已更新")
     print(f" - 删除了 {garbage_deleted} 条完全无效的记录")
 
-if __name__ == "__main__":
-    advanced_cleaning()
+def flush_updates(conn, rows):
+    if not rows:
+        return 0
+    # 先写入临时表再一条 UPDATE ... FROM 提交：全文索引触发器仍逐行执行，
+    # 但整批只有一条语句，FTS5 只刷一次缓冲（逐行 executemany 时每条语句都刷一次，见 ingest.py）
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS cleaned_products (name, brand, ingredients, id)")
+        conn.executemany("INSERT INTO cleaned_products VALUES (?, ?, ?, ?)", rows)
+        conn.execute("""
+            UPDATE products
+            SET name = c.name, brand = c.brand, ingredients = c.ingredients
+            FROM cleaned_products c
+            WHERE products.id = c.id
+        """)
+        conn.execute("DELETE FROM cleaned_products")
+    return len(rows)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="品牌归一化与配料表清洗")
+    parser.add_argument('--aliases', default=ALIAS_FILE, help="额外的品牌别名 CSV (alias,canonical)")
+    args = parser.parse_args()
+    advanced_cleaning(alias_file=args.aliases)
@@ -0,0 +1,236 @@
+"""
+多模式过敏原匹配器 (Aho-Corasick)
+
+把 ALLERGEN_DICT 的全部关键词和 MAY_CONTAIN_PHRASES 编译成一个自动机，
+对每条配料文本只做一次线性扫描，就能同时得到：
+  - 每个过敏原标签命中的位置
+  - "可能含有" 短语的切分点
+结果与逐个 `kw.lower() in text` 的旧逻辑完全一致（包括中日文混排文本）。
+
+传入 normalize（如 ingredient_tokens.normalize_text）时关键词与配料用同一函数归一化；
+再传入 tokenize 时，可以对预先切好的配料项做哈希查找（classify_tokens），
+常见配料项（sugar、水、小麦粉……）只在第一次出现时扫描，带 "可能含有" 短语的配料表也一样。
+"""
+
+# 模式类型
+KIND_KEYWORD = 0
+KIND_PHRASE = 1
+
+# classify_tokens 缓存的配料项数上限，超出后清空重来
+TOKEN_CACHE_SIZE = 200000
+
+
+class KeywordAutomaton:
+    """通用的 Aho-Corasick 自动机：一次扫描找出所有关键词（含重叠）的出现位置。"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        # goto[state] = {字符: 下一个状态}
+        goto = [{}]
+        outputs = [[]]
+
+        for keyword_idx, keyword in enumerate(self.keywords):
+            # 空关键词无法放进自动机，直接忽略
+            if not keyword:
+                continue
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(keyword_idx)
+
+        # BFS 计算失败链接，并把失败链上的输出合并到当前状态
+        fail = [0] * len(goto)
+        order = []
+        queue = list(goto[0].values())
+        while queue:
+            order.extend(queue)
+            next_queue = []
+            for state in queue:
+                for ch, nxt in goto[state].items():
+                    f = fail[state]
+                    while f and ch not in goto[f]:
+                        f = fail[f]
+                    target = goto[f].get(ch, 0)
+                    fail[nxt] = target if target != nxt else 0
+                    outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+                    next_queue.append(nxt)
+            queue = next_queue
+
+        # 转成确定性自动机：每个状态只保存与根节点不同的转移，
+        # 扫描时先查本状态，查不到再回退到根节点的转移表。
+        root = goto[0]
+        delta = [None] * len(goto)
+        delta[0] = {}
+        for state in order:
+            table = dict(delta[fail[state]]) if fail[state] else {}
+            table.update(goto[state])
+            delta[state] = {ch: nxt for ch, nxt in table.items()
+                            if root.get(ch, 0) != nxt}
+
+        self._root = root
+        self._delta = delta
+        self._outputs = [tuple(o) for o in outputs]
+
+    def find_all(self, text):
+        """返回 [(结束位置, 关键词序号), ...]，按结束位置排列。"""
+        root = self._root
+        delta = self._delta
+        outputs = self._outputs
+
+        hits = []
+        state = 0
+        for pos, ch in enumerate(text):
+            nxt = delta[state].get(ch)
+            state = nxt if nxt is not None else root.get(ch, 0)
+            outs = outputs[state]
+            if outs:
+                end = pos + 1
+                for keyword_idx in outs:
+                    hits.append((end, keyword_idx))
+        return hits
+
+
+class AllergenMatcher:
+    def __init__(self, allergen_dict, may_contain_phrases, normalize=str.lower, tokenize=None):
+        self.tags = list(allergen_dict.keys())
+        self.normalize = normalize
+        self.phrases = [normalize(phrase) for phrase in may_contain_phrases]
+
+        # 每个模式: (类型, 标签/短语序号, 长度)
+        self.patterns = []
+        keywords = []
+        for tag_idx, tag in enumerate(self.tags):
+            for kw in allergen_dict[tag]:
+                kw = normalize(kw)
+                keywords.append(kw)
+                self.patterns.append((KIND_KEYWORD, tag_idx, len(kw)))
+        for phrase_idx, phrase in enumerate(self.phrases):
+            keywords.append(phrase)
+            self.patterns.append((KIND_PHRASE, phrase_idx, len(phrase)))
+
+        self.automaton = KeywordAutomaton(keywords)
+
+        # 没有关键词或短语跨越配料项分隔符时，整段文本的命中 = 各配料项命中的并集
+        self.token_safe = tokenize is not None and all(tokenize(kw) == [kw] for kw in keywords if kw)
+        self.token_cache = {}
+
+    def scan(self, text_lower):
+        """
+        单次扫描已归一化（默认为小写）的文本。
+        返回 (tag_first_end, tag_last_start, phrase_first_start)：
+        每个标签最早的结束位置、最晚的开始位置，以及每个短语最早的开始位置。
+        """
+        patterns = self.patterns
+
+        tag_first_end = {}
+        tag_last_start = {}
+        phrase_first_start = {}
+
+        for end, pid in self.automaton.find_all(text_lower):
+            kind, index, length = patterns[pid]
+            start = end - length
+            if kind == KIND_KEYWORD:
+                if index not in tag_first_end:
+                    tag_first_end[index] = end
+                tag_last_start[index] = max(tag_last_start.get(index, start), start)
+            elif index not in phrase_first_start:
+                phrase_first_start[index] = start
+
+        return tag_first_end, tag_last_start, phrase_first_start
+
+    def classify(self, ingredients):
+        """
+        返回 [(标签, 'contains' | 'may_contain'), ...]，按 ALLERGEN_DICT 顺序排列。
+        切分规则与旧逻辑一致：取 MAY_CONTAIN_PHRASES 中排在最前、且出现在文本里的短语，
+        在其第一次出现处切成 "主配料" 和 "可能含有" 两部分。
+        """
+        if not ingredients:
+            return []
+        return self.classify_text(self.normalize(ingredients))
+
+    def classify_text(self, text):
+        """同 classify，text 已经用 normalize 归一化过。"""
+        if not text:
+            return []
+        tag_first_end, tag_last_start, phrase_first_start = self.scan(text)
+        if not tag_first_end:
+            return []
+
+        split_start = len(text)
+        split_end = len(text) + 1
+        if phrase_first_start:
+            phrase_idx = min(phrase_first_start)
+            split_start = phrase_first_start[phrase_idx]
+            split_end = split_start + len(self.phrases[phrase_idx])
+
+        results = []
+        for tag_idx in sorted(tag_first_end):
+            if tag_first_end[tag_idx] <= split_start:
+                results.append((self.tags[tag_idx], "contains"))
+            elif tag_last_start[tag_idx] >= split_end:
+                results.append((self.tags[tag_idx], "may_contain"))
+        return results
+
+    def classify_tokens(self, text, tokens):
+        """
+        同 classify_text，tokens 为 text 切出的配料项。
+        每个配料项命中的标签和短语按配料项缓存（关键词和短语都不跨配料项）。
+        出现 "可能含有" 短语时，切分点之前的配料项都是 contains、之后的都是 may_contain，
+        只有切分点所在的那一项需要按位置重新扫描。
+        """
+        if not text:
+            return []
+        if not self.token_safe:
+            return self.classify_text(text)
+
+        cache = self.token_cache
+        hits = []
+        for token in tokens:
+            hit = cache.get(token)
+            if hit is None:
+                tag_first_end, _, phrase_first_start = self.scan(token)
+                hit = (tuple(tag_first_end), tuple(phrase_first_start))
+                if len(cache) >= TOKEN_CACHE_SIZE:
+                    cache.clear()
+                cache[token] = hit
+            hits.append(hit)
+
+        # 与 classify_text 相同：切分短语取 MAY_CONTAIN_PHRASES 中排在最前、且出现在文本里的
+        present = [min(phrases) for _, phrases in hits if phrases]
+        if not present:
+            found = set()
+            for tags, _ in hits:
+                found.update(tags)
+            return [(self.tags[tag_idx], "contains") for tag_idx in sorted(found)]
+
+        phrase_idx = min(present)
+        split = next(i for i, (_, phrases) in enumerate(hits) if phrase_idx in phrases)
+        contains = set()
+        for tags, _ in hits[:split]:
+            contains.update(tags)
+        may_contain = set()
+        for tags, _ in hits[split + 1:]:
+            may_contain.update(tags)
+
+        token = tokens[split]
+        tag_first_end, tag_last_start, phrase_first_start = self.scan(token)
+        split_start = phrase_first_start[phrase_idx]
+        split_end = split_start + len(self.phrases[phrase_idx])
+        for tag_idx, first_end in tag_first_end.items():
+            if first_end <= split_start:
+                contains.add(tag_idx)
+            elif tag_last_start[tag_idx] >= split_end:
+                may_contain.add(tag_idx)
+
+        return [(self.tags[tag_idx], "contains" if tag_idx in contains else "may_contain")
+                for tag_idx in sorted(contains | may_contain)]
+
+
+def compile_matcher(allergen_dict, may_contain_phrases, normalize=str.lower, tokenize=None):
+    return AllergenMatcher(allergen_dict, may_contain_phrases, normalize, tokenize)
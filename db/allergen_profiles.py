@@ -0,0 +1,241 @@
+"""
+过敏原位图 (allergen_profiles) 的维护与查询
+
+每个产品一行：contains_mask / may_contain_mask 的第 n 位对应 allergen_bits 中位号为 n 的标签。
+"不含花生、芝麻、甲壳类" 这类查询只需一次按位与，不必连接并聚合 allergen_mappings。
+常驻进程（如查询服务）可以用 ProfileIndex 把位图载入内存，百万行级别的筛选只需几毫秒。
+
+用法:
+    python db/allergen_profiles.py --exclude peanuts,sesame-seeds,crustaceans
+    python db/allergen_profiles.py --exclude milk --source OFF --country japan --limit 20
+    python db/allergen_profiles.py --exclude peanuts --allow-traces --count
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
+
+# SQLite 整数为有符号 64 位，保留符号位
+MAX_BITS = 63
+
+PROFILE_SELECT_SQL = '''
+    SELECT p.id,
+        COALESCE((SELECT SUM(1 << b.bit) FROM allergen_mappings m
+                  JOIN allergen_bits b ON b.tag = m.allergen_name
+                  WHERE m.product_id = p.id AND m.status = 'contains'), 0),
+        COALESCE((SELECT SUM(1 << b.bit) FROM allergen_mappings m
+                  JOIN allergen_bits b ON b.tag = m.allergen_name
+                  WHERE m.product_id = p.id AND m.status != 'contains'), 0),
+        CASE WHEN COALESCE(p.ingredients, '') != '' OR COALESCE(p.allergens, '') != ''
+                  OR COALESCE(p.traces, '') != '' THEN 1 ELSE 0 END
+    FROM products p
+'''
+
+
+def sync_allergen_bits(cursor, tags):
+    """为尚未分配位号的标签分配新位号（已有的位号保持不变）。"""
+    cursor.execute("SELECT tag, bit FROM allergen_bits")
+    bits = dict(cursor.fetchall())
+    next_bit = max(bits.values(), default=-1) + 1
+    new_rows = []
+    for tag in tags:
+        if tag in bits:
+            continue
+        if next_bit >= MAX_BITS:
+            raise ValueError(f"过敏原标签超过 {MAX_BITS} 个，无法分配位号: {tag}")
+        bits[tag] = next_bit
+        new_rows.append((tag, next_bit))
+        next_bit += 1
+    cursor.executemany("INSERT INTO allergen_bits (tag, bit) VALUES (?, ?)", new_rows)
+    return bits
+
+
+def rebuild_profiles(cursor, dirty_table=None):
+    """
+    由 allergen_mappings 重新生成位图。
+    传入 dirty_table（含 product_id 列的临时表）时只重算其中的产品，否则整表重建。
+    """
+    if dirty_table is None:
+        cursor.execute("DELETE FROM allergen_profiles")
+        cursor.execute(f"INSERT INTO allergen_profiles "
+                       f"(product_id, contains_mask, may_contain_mask, known) {PROFILE_SELECT_SQL}")
+    else:
+        cursor.execute(f"DELETE FROM allergen_profiles WHERE product_id IN "
+                       f"(SELECT product_id FROM {dirty_table})")
+        cursor.execute(f"INSERT INTO allergen_profiles "
+                       f"(product_id, contains_mask, may_contain_mask, known) {PROFILE_SELECT_SQL} "
+                       f"WHERE p.id IN (SELECT product_id FROM {dirty_table})")
+    return cursor.rowcount
+
+
+def load_bits(cursor):
+    cursor.execute("SELECT tag, bit FROM allergen_bits")
+    return dict(cursor.fetchall())
+
+
+def resolve_mask(cursor, tags, bits=None):
+    """'peanuts' / 'en:peanuts' -> 位掩码；未知标签抛出 ValueError。"""
+    if bits is None:
+        bits = load_bits(cursor)
+    mask = 0
+    for tag in tags:
+        tag = tag.strip().lower()
+        if not tag:
+            continue
+        if ':' not in tag:
+            tag = f"en:{tag}"
+        if tag not in bits:
+            raise ValueError(f"未知过敏原标签: {tag} (可选: {', '.join(sorted(bits))})")
+        mask |= 1 << bits[tag]
+    return mask
+
+
+def build_filter(cursor, exclude=(), allow_traces=False, barcode=None, source=None, country=None,
+                 include_unknown=False):
+    """
+    返回 (WHERE 子句, 参数, 是否用到 products 列)，供 find_safe_products / count_safe_products 共用。
+    """
+    conditions = []
+    params = []
+    mask = resolve_mask(cursor, exclude)
+    if mask:
+        # allow_traces: 只排除确认含有，接受 "可能含有"
+        column = "a.contains_mask" if allow_traces else "(a.contains_mask | a.may_contain_mask)"
+        conditions.append(f"{column} & ? = 0")
+        params.append(mask)
+    if not include_unknown:
+        conditions.append("a.known = 1")
+    needs_products = False
+    for condition, value in (("p.barcode = ?", barcode), ("p.source = ?", source),
+                             ("p.countries LIKE ?", f"%{country}%" if country else None)):
+        if value:
+            conditions.append(condition)
+            params.append(value)
+            needs_products = True
+    where = " AND ".join(conditions) if conditions else "1"
+    return where, params, needs_products
+
+
+def find_safe_products(conn, exclude=(), allow_traces=False, barcode=None, source=None, country=None,
+                       include_unknown=False, limit=50):
+    """
+    返回不含 exclude 中任一过敏原的产品 [(id, barcode, name, brand, source), ...]。
+    默认 "可能含有" 也视为不安全，且跳过没有任何配料信息的产品。
+    """
+    cursor = conn.cursor()
+    where, params, _ = build_filter(cursor, exclude, allow_traces, barcode, source, country,
+                                    include_unknown)
+    sql = f'''
+        SELECT p.id, p.barcode, p.name, p.brand, p.source
+        FROM allergen_profiles a JOIN products p ON p.id = a.product_id
+        WHERE {where}
+    '''
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def count_safe_products(conn, exclude=(), allow_traces=False, barcode=None, source=None, country=None,
+                        include_unknown=False):
+    cursor = conn.cursor()
+    where, params, needs_products = build_filter(cursor, exclude, allow_traces, barcode, source,
+                                                 country, include_unknown)
+    if needs_products:
+        sql = f"SELECT COUNT(*) FROM allergen_profiles a JOIN products p ON p.id = a.product_id WHERE {where}"
+    else:
+        # 只按位图过滤时不必连接 products
+        sql = f"SELECT COUNT(*) FROM allergen_profiles a WHERE {where}"
+    cursor.execute(sql, params)
+    return cursor.fetchone()[0]
+
+
+class ProfileIndex:
+    """
+    位图的内存副本：一次性读入 numpy 数组，之后的筛选都是向量化的按位运算。
+    数据库更新后需要重新创建。
+    """
+
+    def __init__(self, conn):
+        cursor = conn.cursor()
+        self.bits = load_bits(cursor)
+        cursor.execute('''
+            SELECT a.product_id, a.contains_mask, a.may_contain_mask, a.known, p.source
+            FROM allergen_profiles a JOIN products p ON p.id = a.product_id
+        ''')
+        rows = cursor.fetchall()
+        self.ids = np.array([row[0] for row in rows], dtype=object)
+        self.contains = np.array([row[1] for row in rows], dtype=np.int64)
+        self.any_mask = self.contains | np.array([row[2] for row in rows], dtype=np.int64)
+        self.known = np.array([row[3] for row in rows], dtype=bool)
+        self.source_names, self.source_codes = np.unique(
+            np.array([row[4] or '' for row in rows], dtype=object), return_inverse=True)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def select(self, exclude=(), allow_traces=False, source=None, include_unknown=False):
+        """返回布尔数组，True 表示该产品满足条件。"""
+        keep = np.ones(len(self.ids), dtype=bool)
+        mask = resolve_mask(None, exclude, bits=self.bits)
+        if mask:
+            keep &= ((self.contains if allow_traces else self.any_mask) & mask) == 0
+        if not include_unknown:
+            keep &= self.known
+        if source:
+            matches = np.flatnonzero(self.source_names == source)
+            if len(matches) == 0:
+                keep[:] = False
+            else:
+                keep &= self.source_codes == matches[0]
+        return keep
+
+    def find(self, limit=50, **filters):
+        ids = self.ids[self.select(**filters)]
+        return list(ids[:limit] if limit else ids)
+
+    def count(self, **filters):
+        return int(np.count_nonzero(self.select(**filters)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按过敏原排除条件筛选产品")
+    parser.add_argument('--exclude', default='', help="要排除的过敏原标签（逗号分隔，如 peanuts,sesame-seeds）")
+    parser.add_argument('--allow-traces', action='store_true', help="只排除确认含有的，接受 \"可能含有\"")
+    parser.add_argument('--barcode')
+    parser.add_argument('--source', help="数据来源，如 OFF / USDA / CNF")
+    parser.add_argument('--country', help="国家（模糊匹配 countries 列）")
+    parser.add_argument('--include-unknown', action='store_true', help="包含没有任何配料信息的产品")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--count', action='store_true', help="只输出数量")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"Error: {DB_PATH} not found.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    filters = dict(exclude=args.exclude.split(','), allow_traces=args.allow_traces,
+                   barcode=args.barcode, source=args.source, country=args.country,
+                   include_unknown=args.include_unknown)
+    started = time.perf_counter()
+    try:
+        if args.count:
+            print(f"符合条件的产品: {count_safe_products(conn, **filters)}")
+        else:
+            for p_id, barcode, name, brand, source in find_safe_products(conn, limit=args.limit, **filters):
+                print(f"{p_id:<24} {barcode or '':<16} {source or '':<6} {name or ''} ({brand or ''})")
+    except ValueError as e:
+        raise SystemExit(str(e))
+    finally:
+        conn.close()
+    print(f"查询耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+品牌归一化引擎
+
+所有别名（内置 + 别名文件 + brand_aliases 表）编译成一个 Aho-Corasick 自动机，
+品牌和产品名各扫描一次即可找到命中的标准品牌。
+规则优先级与旧的逐条 re.search 一致：按标准品牌出现的先后顺序，先出现的优先。
+"""
+import csv
+import os
+
+from allergen_matcher import KeywordAutomaton
+
+
+class BrandNormalizer:
+    def __init__(self, brand_aliases):
+        # brand_aliases: {标准品牌: [别名, ...]}，字典顺序即优先级
+        self.canonical_names = list(brand_aliases.keys())
+        keywords = []
+        self.keyword_rank = []
+        for rank, canonical in enumerate(self.canonical_names):
+            for alias in brand_aliases[canonical]:
+                keywords.append(alias.lower())
+                self.keyword_rank.append(rank)
+        self.automaton = KeywordAutomaton(keywords)
+
+    def best_rank(self, text):
+        if not text:
+            return None
+        hits = self.automaton.find_all(text.lower())
+        if not hits:
+            return None
+        return min(self.keyword_rank[keyword_idx] for _, keyword_idx in hits)
+
+    def normalize(self, brand, name):
+        """返回品牌或产品名中命中的优先级最高的标准品牌；都没命中返回 None。"""
+        ranks = [r for r in (self.best_rank(brand), self.best_rank(name)) if r is not None]
+        if not ranks:
+            return None
+        return self.canonical_names[min(ranks)]
+
+
+def merge_aliases(brand_aliases, extra_pairs):
+    """把 (别名, 标准品牌) 追加进别名字典；新品牌排在已有品牌之后。"""
+    merged = {canonical: list(aliases) for canonical, aliases in brand_aliases.items()}
+    for alias, canonical in extra_pairs:
+        alias = (alias or "").strip()
+        canonical = (canonical or "").strip()
+        if not alias or not canonical:
+            continue
+        merged.setdefault(canonical, [])
+        if alias not in merged[canonical]:
+            merged[canonical].append(alias)
+    return merged
+
+
+def load_alias_file(path):
+    """读取 CSV 别名表（表头: alias,canonical），返回 [(别名, 标准品牌), ...]。"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return [(row.get('alias'), row.get('canonical')) for row in csv.DictReader(f)]
+
+
+def load_alias_table(cursor):
+    """读取数据库中的 brand_aliases 表（按 priority、rowid 排序）。"""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'brand_aliases'")
+    if cursor.fetchone() is None:
+        return []
+    cursor.execute("SELECT alias, canonical FROM brand_aliases ORDER BY priority, rowid")
+    return cursor.fetchall()
+
+
+def build_normalizer(brand_aliases, cursor=None, alias_file=None):
+    pairs = []
+    if cursor is not None:
+        pairs.extend(load_alias_table(cursor))
+    if alias_file and os.path.exists(alias_file):
+        pairs.extend(load_alias_file(alias_file))
+    return BrandNormalizer(merge_aliases(brand_aliases, pairs))
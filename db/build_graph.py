@@ -1,44 +1,191 @@
-import sqlite3
+import argparse
 import json
 import os
+import shutil
+import time
+from array import array
+
+import numpy as np
+
+import instrumentation
+from graph_store import EDGE_CODES, GRAPH_DIR
 
 DB_PATH = 'data/food_data.db'
 GRAPH_OUTPUT = 'data/food_graph.jsonl'
 
-def build_graph():
+# 每次从 SQLite 取出的行数
+FETCH_SIZE = 10000
+
+
+def split_values(text):
+    """OFF 的品牌 / 分类是逗号分隔的文本。"""
+    if not text:
+        return []
+    return [v.strip() for v in text.split(',') if v.strip()]
+
+
+class GraphBuilder:
+    """
+    边缓存在紧凑的 array 中（每条边 9 字节），节点名称直接写入 nodes.db；
+    非产品节点（过敏原、品牌、分类、来源）数量很少，在内存中去重。
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.next_id = 0
+        self.interned = {}
+        self.pending_nodes = []
+        self.src = array('i')
+        self.dst = array('i')
+        self.types = array('B')
+
+    def add_node(self, node_type, key, label=None):
+        node_id = self.next_id
+        self.next_id += 1
+        self.pending_nodes.append((node_id, node_type, key, label))
+        if len(self.pending_nodes) >= FETCH_SIZE:
+            self.flush_nodes()
+        return node_id
+
+    def intern(self, node_type, key):
+        node_id = self.interned.get((node_type, key))
+        if node_id is None:
+            node_id = self.add_node(node_type, key, key)
+            self.interned[(node_type, key)] = node_id
+        return node_id
+
+    def flush_nodes(self):
+        self.conn.executemany("INSERT INTO g.nodes (node_id, type, key, label) VALUES (?, ?, ?, ?)",
+                              self.pending_nodes)
+        self.pending_nodes = []
+
+    def add_edge(self, src, dst, edge_type):
+        self.src.append(src)
+        self.dst.append(dst)
+        self.types.append(EDGE_CODES[edge_type])
+
+    def to_csr(self):
+        """正反两个方向都存储，按起点排序得到 CSR 数组。"""
+        src = np.frombuffer(self.src, dtype=np.int32)
+        dst = np.frombuffer(self.dst, dtype=np.int32)
+        types = np.frombuffer(self.types, dtype=np.uint8)
+        all_src = np.concatenate((src, dst))
+        order = np.argsort(all_src, kind='stable')
+        indices = np.concatenate((dst, src))[order]
+        edge_types = np.concatenate((types, types))[order]
+        indptr = np.zeros(self.next_id + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_src, minlength=self.next_id), out=indptr[1:])
+        return indptr, indices, edge_types
+
+
+def write_graph(conn, tmp_dir, jsonl_path):
+    """把图写进 tmp_dir（关系另写到 jsonl_path），返回 (meta, 关系数)。"""
+    conn.execute("ATTACH DATABASE ? AS g", (os.path.join(tmp_dir, 'nodes.db'),))
+    conn.execute("CREATE TABLE g.nodes (node_id INTEGER PRIMARY KEY, type TEXT, key TEXT, label TEXT)")
+    builder = GraphBuilder(conn)
+
+    # 1. 产品节点（以产品 id 为键，同名的不同产品不会合并）及其品牌 / 分类 / 来源
+    product_count = 0
+    cursor = conn.execute("SELECT id, name, brand, categories, source FROM products ORDER BY rowid")
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for p_id, name, brand, categories, source in rows:
+            node = builder.add_node("product", p_id, name)
+            for value in split_values(brand):
+                builder.add_edge(node, builder.intern("brand", value), "brand")
+            for value in split_values(categories):
+                builder.add_edge(node, builder.intern("category", value), "category")
+            if source:
+                builder.add_edge(node, builder.intern("source", source), "source")
+        product_count += len(rows)
+    builder.flush_nodes()
+    conn.execute("CREATE UNIQUE INDEX g.idx_nodes_type_key ON nodes (type, key)")
+
+    # 2. 产品 -> 过敏原：在 SQL 中把产品 id 换成节点 id；同时流式写出 JSONL（兼容旧的下游）
+    relation_count = 0
+    jsonl = open(jsonl_path, 'w', encoding='utf-8') if jsonl_path else None
+    try:
+        cursor = conn.execute("""
+            SELECT n.node_id, p.id, p.name, m.allergen_name, m.status
+            FROM allergen_mappings m
+            JOIN products p ON p.id = m.product_id
+            JOIN g.nodes n ON n.type = 'product' AND n.key = p.id
+        """)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for node, p_id, product_name, allergen, status in rows:
+                predicate = "contains" if status == 'contains' else "may_contain"
+                builder.add_edge(node, builder.intern("allergen", allergen), predicate)
+                if jsonl is not None:
+                    # 构建图关系：(产品) -[含有/可能含有]-> (过敏原)
+                    jsonl.write(json.dumps({"subject": product_name, "subject_id": p_id,
+                                            "predicate": predicate, "object": allergen},
+                                           ensure_ascii=False) + '\n')
+            relation_count += len(rows)
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+    builder.flush_nodes()
+    conn.commit()
+    conn.execute("DETACH DATABASE g")
+
+    # 3. CSR 数组
+    indptr, indices, edge_types = builder.to_csr()
+    np.save(os.path.join(tmp_dir, 'indptr.npy'), indptr)
+    np.save(os.path.join(tmp_dir, 'indices.npy'), indices)
+    np.save(os.path.join(tmp_dir, 'edge_types.npy'), edge_types)
+    meta = {"nodes": builder.next_id, "products": product_count, "edges": len(builder.src),
+            "built_at": time.strftime('%Y-%m-%d %H:%M:%S')}
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta, relation_count
+
+
+@instrumentation.instrumented("graph")
+def build_graph(graph_dir=GRAPH_DIR, jsonl_path=GRAPH_OUTPUT):
     if not os.path.exists(DB_PATH):
         print("SQL 数据库不存在")
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 提取产品与过敏原的关系
-    cursor.execute("""
-        SELECT p.name, m.allergen_name, m.status 
-        FROM products p 
-        JOIN allergen_mappings m ON p.id = m.product_id
-    """)
-    
-    graph_data = []
-    for row in cursor.fetchall():
-        product_name, allergen, status = row
-        # 构建图关系：(产品) -[含有/可能含有]-> (过敏原)
-        relation = {
-            "subject": product_name,
-            "predicate": "contains" if status == 'contains' else "may_contain",
-            "object": allergen
-        }
-        graph_data.append(relation)
-
-    # 存入文件
-    with open(GRAPH_OUTPUT, 'w', encoding='utf-8') as f:
-        for entry in graph_data:
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-    
-    print(f"图数据已生成至 {GRAPH_OUTPUT}，共 {len(graph_data)} 条关系。")
+    started = time.perf_counter()
+    # 先写到临时目录 / 临时文件，完成后整体替换，查询方不会读到一半的图
+    tmp_dir = graph_dir + '.tmp'
+    tmp_jsonl = jsonl_path + '.tmp' if jsonl_path else None
+    # 上次被强行终止时可能留下的残余
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    conn = instrumentation.connect(DB_PATH)
+    try:
+        meta, relation_count = write_graph(conn, tmp_dir, tmp_jsonl)
+    except BaseException:
+        # 失败时不留下半成品，下次运行也不会在旧内容上继续
+        conn.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if tmp_jsonl and os.path.exists(tmp_jsonl):
+            os.remove(tmp_jsonl)
+        raise
     conn.close()
 
-if __name__ == "__main__":
-    build_graph()
+    shutil.rmtree(graph_dir, ignore_errors=True)
+    os.replace(tmp_dir, graph_dir)
+    if tmp_jsonl:
+        os.replace(tmp_jsonl, jsonl_path)
+    instrumentation.current().add("rows_written", meta["nodes"] + meta["edges"])
 
+    if jsonl_path:
+        print(f"图数据已生成至 {jsonl_path}，共 {relation_count} 条关系。")
+    print(f"图谱已写入 {graph_dir}: {meta['nodes']} 个节点（产品 {meta['products']}），"
+          f"{meta['edges']} 条边，耗时 {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 SQLite 生成知识图谱 (CSR) 及 JSONL 关系文件")
+    parser.add_argument('--graph-dir', default=GRAPH_DIR)
+    parser.add_argument('--no-jsonl', action='store_true', help="不写 JSONL 关系文件")
+    args = parser.parse_args()
+    build_graph(args.graph_dir, None if args.no_jsonl else GRAPH_OUTPUT)
@@ -1,75 +1,339 @@
-import sqlite3
+"""
+Data correctness & consistency audit.
+
+Metrics are computed in as few passes as possible:
+  - source distribution and duplicate barcodes come from index-only scans
+    (idx_products_source / idx_products_barcode);
+  - completeness and Asian-category coverage come from ONE pass over products,
+    grouped by source;
+  - orphaned and conflicting mappings come from ONE pass over allergen_mappings,
+    using indexed lookups instead of NOT IN (SELECT ...). When the unique
+    (product_id, allergen_name) index from migration 0001 exists a pair cannot
+    carry two statuses and the conflict check is skipped; on older databases
+    the pass groups by (product_id, allergen_name) instead.
+
+With --sample, the two data passes only read random blocks of rowids and the
+counts are extrapolated from the exact per-source / per-table totals.
+
+Usage:
+    python db/check_quality.py
+    python db/check_quality.py --json data/quality_report.json
+    python db/check_quality.py --sample 0.05 --json -
+    python db/check_quality.py --max completeness.ingredients.ratio=0.3 --max mappings.orphaned=0
+    python db/check_quality.py --thresholds quality_thresholds.json
+"""
+import argparse
+import json
+import math
 import os
+import random
+import sys
+import time
+
+import instrumentation
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
 
-def check_data_quality():
+# Rows per sampled rowid block; contiguous ranges are read straight off the b-tree
+SAMPLE_BLOCK = 1000
+UNKNOWN_SOURCE = "unknown"
+TOP_DUPLICATES = 5
+
+COMPLETENESS_FIELDS = ("name", "brand", "ingredients", "barcode")
+
+PRODUCT_SCAN_SQL = '''
+    SELECT p.source, COUNT(*),
+        SUM(p.name IS NULL OR p.name = ''),
+        SUM(p.brand IS NULL OR p.brand = ''),
+        SUM(p.ingredients IS NULL OR p.ingredients = ''),
+        SUM(p.barcode IS NULL OR p.barcode = ''),
+        SUM(p.categories LIKE '%asian%' OR p.categories LIKE '%chinese%' OR p.categories LIKE '%japanese%')
+    FROM products p {where}
+    GROUP BY p.source
+'''
+
+MAPPING_SCAN_SQL = '''
+    SELECT COUNT(*),
+        SUM(m.status = 'contains'),
+        SUM(m.status = 'may_contain'),
+        SUM(NOT EXISTS (SELECT 1 FROM products p WHERE p.id = m.product_id)),
+        0
+    FROM allergen_mappings m {where}
+'''
+
+# Without the unique pair index: group by pair in the same pass and count status conflicts
+MAPPING_GROUPED_SQL = '''
+    SELECT SUM(n), SUM(contains), SUM(may_contain),
+        SUM(CASE WHEN NOT EXISTS (SELECT 1 FROM products p WHERE p.id = g.product_id) THEN n ELSE 0 END),
+        SUM(statuses > 1)
+    FROM (
+        SELECT m.product_id, COUNT(*) AS n, SUM(m.status = 'contains') AS contains,
+            SUM(m.status = 'may_contain') AS may_contain, COUNT(DISTINCT m.status) AS statuses
+        FROM allergen_mappings m {where}
+        GROUP BY m.product_id, m.allergen_name
+    ) g
+'''
+
+
+def ratio(part, whole):
+    return round(part / whole, 6) if whole else 0.0
+
+
+def sample_where(conn, table, alias, fraction, rng):
+    """
+    Fill a temp table with the rowids of random SAMPLE_BLOCK-sized blocks covering
+    about `fraction` of `table`; returns (WHERE clause, rows sampled).
+    """
+    sample_table = f"audit_sample_{table}"
+    conn.execute(f"DROP TABLE IF EXISTS temp.{sample_table}")
+    conn.execute(f"CREATE TEMP TABLE {sample_table} (rid INTEGER PRIMARY KEY)")
+    low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    if low is not None:
+        blocks = (high - low) // SAMPLE_BLOCK + 1
+        picked = rng.sample(range(blocks), max(1, math.ceil(blocks * fraction)))
+        for block in sorted(picked):
+            start = low + block * SAMPLE_BLOCK
+            conn.execute(f"INSERT INTO {sample_table} SELECT rowid FROM {table} WHERE rowid BETWEEN ? AND ?",
+                         (start, start + SAMPLE_BLOCK - 1))
+    sampled = conn.execute(f"SELECT COUNT(*) FROM {sample_table}").fetchone()[0]
+    return f"WHERE {alias}.rowid IN (SELECT rid FROM temp.{sample_table})", sampled
+
+
+def has_unique_pair_index(conn):
+    for _, name, unique, *_ in conn.execute("PRAGMA index_list(allergen_mappings)"):
+        if unique and [row[2] for row in conn.execute(f"PRAGMA index_info({name})")] == [
+                "product_id", "allergen_name"]:
+            return True
+    return False
+
+
+def coverage_metrics(missing, scanned, products):
+    """Per-field missing counts; with sampling the ratio comes from the sample and the count is scaled."""
+    metrics = {}
+    for field, count in zip(COMPLETENESS_FIELDS, missing):
+        r = ratio(count, scanned)
+        metrics[field] = {"missing": round(r * products) if scanned != products else count, "ratio": r}
+    return metrics
+
+
+def scaled(count, scanned, total):
+    return round(count * total / scanned) if scanned and scanned != total else count
+
+
+def audit(conn, sample=None, seed=0):
+    """Run the audit and return the report as a JSON-serializable dict."""
+    started = time.perf_counter()
+    rng = random.Random(seed)
+
+    # Exact source distribution (index-only scan)
+    source_counts = {(source or UNKNOWN_SOURCE): count for source, count in
+                     conn.execute("SELECT source, COUNT(*) FROM products GROUP BY source")}
+    total_products = sum(source_counts.values())
+
+    # Duplicate barcodes (index-only scan; always exact). Same grouping as clean_data, which also
+    # merges '' barcodes, so the report shows what consolidation would act on.
+    duplicate_groups = 0
+    duplicate_rows = 0
+    top = []
+    for barcode, count in conn.execute(
+            "SELECT barcode, COUNT(*) FROM products WHERE barcode IS NOT NULL "
+            "GROUP BY barcode HAVING COUNT(*) > 1 ORDER BY COUNT(*) DESC"):
+        duplicate_groups += 1
+        duplicate_rows += count - 1
+        if len(top) < TOP_DUPLICATES:
+            top.append([barcode, count])
+
+    # Single pass over products
+    where, sampled_products = sample_where(conn, "products", "p", sample, rng) if sample else ("", None)
+    per_source = {}
+    for source, scanned, *counts in conn.execute(PRODUCT_SCAN_SQL.format(where=where)):
+        per_source[source or UNKNOWN_SOURCE] = (scanned, [c or 0 for c in counts])
+
+    sources = {}
+    totals = [0] * (len(COMPLETENESS_FIELDS) + 1)
+    for source, products in sorted(source_counts.items(), key=lambda kv: -kv[1]):
+        scanned, counts = per_source.get(source, (0, [0] * len(totals)))
+        completeness = coverage_metrics(counts[:len(COMPLETENESS_FIELDS)], scanned, products)
+        asian = scaled(counts[-1], scanned, products)
+        sources[source] = {
+            "products": products,
+            "share": ratio(products, total_products),
+            "scanned": scanned,
+            "completeness": completeness,
+            "asian_coverage": {"products": asian, "ratio": ratio(asian, products)},
+        }
+        for i, field in enumerate(COMPLETENESS_FIELDS):
+            totals[i] += completeness[field]["missing"]
+        totals[-1] += asian
+
+    # Single pass over allergen_mappings
+    if sample:
+        total_mappings = conn.execute("SELECT COUNT(*) FROM allergen_mappings").fetchone()[0]
+        where, _ = sample_where(conn, "allergen_mappings", "m", sample, rng)
+    else:
+        total_mappings, where = None, ""
+    sql = MAPPING_SCAN_SQL if has_unique_pair_index(conn) else MAPPING_GROUPED_SQL
+    scanned, contains, may_contain, orphaned, conflicting = conn.execute(sql.format(where=where)).fetchone()
+    scanned = scanned or 0
+    if total_mappings is None:
+        total_mappings = scanned
+    mappings = {
+        "total": total_mappings,
+        "scanned": scanned,
+        "contains": scaled(contains or 0, scanned, total_mappings),
+        "may_contain": scaled(may_contain or 0, scanned, total_mappings),
+        "orphaned": scaled(orphaned or 0, scanned, total_mappings),
+        # (product, allergen) pairs marked both contains and may_contain
+        "conflicting_pairs": scaled(conflicting or 0, scanned, total_mappings),
+    }
+
+    return {
+        "generated_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "sampled": bool(sample),
+        "sample_fraction": sample,
+        "sampled_products": sampled_products,
+        "total_products": total_products,
+        "completeness": {field: {"missing": totals[i], "ratio": ratio(totals[i], total_products)}
+                         for i, field in enumerate(COMPLETENESS_FIELDS)},
+        "asian_coverage": {"products": totals[-1], "ratio": ratio(totals[-1], total_products)},
+        "duplicates": {"barcode_groups": duplicate_groups, "extra_rows": duplicate_rows, "top": top},
+        "mappings": mappings,
+        "sources": sources,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def metric_value(report, path):
+    """Look up a dotted metric path, e.g. 'sources.OFF.completeness.ingredients.ratio'."""
+    value = report
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(path)
+        value = value[part]
+    if not isinstance(value, (int, float)):
+        raise KeyError(path)
+    return value
+
+
+def check_thresholds(report, thresholds):
+    """
+    thresholds = {"max": {path: limit}, "min": {path: limit}}.
+    Returns a list of failure messages; unknown metric paths also count as failures.
+    """
+    failures = []
+    for kind, breached in (("max", lambda v, limit: v > limit), ("min", lambda v, limit: v < limit)):
+        for path, limit in thresholds.get(kind, {}).items():
+            try:
+                value = metric_value(report, path)
+            except KeyError:
+                failures.append(f"{path}: unknown metric")
+                continue
+            if breached(value, limit):
+                failures.append(f"{path} = {value} ({kind} {limit})")
+    return failures
+
+
+def parse_threshold_args(max_args, min_args, thresholds_path=None):
+    thresholds = {"max": {}, "min": {}}
+    if thresholds_path:
+        with open(thresholds_path, 'r') as f:
+            loaded = json.load(f)
+        thresholds["max"].update(loaded.get("max", {}))
+        thresholds["min"].update(loaded.get("min", {}))
+    for kind, items in (("max", max_args), ("min", min_args)):
+        for item in items or []:
+            path, sep, limit = item.partition('=')
+            if not sep:
+                raise SystemExit(f"Invalid threshold (expected METRIC=VALUE): {item}")
+            thresholds[kind][path.strip()] = float(limit)
+    return thresholds
+
+
+def print_report(report):
+    total = report["total_products"]
+    print("=== Data Correctness & Consistency Audit ===\n")
+    if report["sampled"]:
+        print(f"(sampled {report['sampled_products']} products, ~{report['sample_fraction']:.1%}; counts are estimates)")
+    print(f"Total products: {total}")
+
+    duplicates = report["duplicates"]
+    print(f"Duplicate barcodes found: {duplicates['barcode_groups']} ({duplicates['extra_rows']} extra rows)")
+    if duplicates["top"]:
+        print(f"   (Top {len(duplicates['top'])} duplicates: {[tuple(d) for d in duplicates['top']]})")
+
+    print("\nCompleteness:")
+    for field in COMPLETENESS_FIELDS:
+        metric = report["completeness"][field]
+        print(f" - Missing {field.capitalize()}: {metric['missing']} ({metric['ratio']:.1%})")
+
+    mappings = report["mappings"]
+    print("\nConsistency:")
+    print(f" - Orphaned allergen mappings (no matching product): {mappings['orphaned']}")
+    print(f" - Products with redundant allergen logic (both contains & may_contain): "
+          f"{mappings['conflicting_pairs']}")
+
+    print("\nSource Distribution:")
+    print(f" {'source':<12}{'products':>10}{'share':>8}{'no name':>9}{'no brand':>10}"
+          f"{'no ingr.':>10}")
+    for source, metrics in report["sources"].items():
+        c = metrics["completeness"]
+        print(f" {source:<12}{metrics['products']:>10}{metrics['share']:>8.1%}{c['name']['ratio']:>9.1%}"
+              f"{c['brand']['ratio']:>10.1%}{c['ingredients']['ratio']:>10.1%}")
+
+    asian = report["asian_coverage"]
+    print("\nAsian Food Coverage:")
+    print(f" - Products with Asian-related keywords in categories: {asian['products']} ({asian['ratio']:.1%})")
+    print(f"\n(audit took {report['elapsed_seconds']}s)")
+
+
+@instrumentation.instrumented("check_quality")
+def check_data_quality(sample=None, json_path=None, thresholds=None, seed=0):
+    """Run the audit, print it (or write JSON) and return (report, threshold failures)."""
     if not os.path.exists(DB_PATH):
         print("Error: Database file not found.")
-        return
+        return None, []
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    conn = instrumentation.connect(DB_PATH)
+    try:
+        report = audit(conn, sample, seed)
+    finally:
+        conn.close()
 
-    print("=== Data Correctness & Consistency Audit ===\n")
+    failures = check_thresholds(report, thresholds) if thresholds else []
+    if thresholds:
+        report["thresholds"] = {"passed": not failures, "failures": failures}
+
+    if json_path == '-':
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report)
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"JSON report written to {json_path}")
+        if thresholds:
+            print("\nThresholds: " + ("all passed" if not failures else f"{len(failures)} failed"))
+            for failure in failures:
+                print(f" - {failure}")
+    return report, failures
 
-    # 1. Basic Counts
-    cursor.execute("SELECT COUNT(*) FROM products")
-    total_products = cursor.fetchone()[0]
-    print(f"Total products: {total_products}")
-
-    # 2. Duplicate Check
-    cursor.execute("SELECT barcode, COUNT(*) as count FROM products WHERE barcode IS NOT NULL GROUP BY barcode HAVING count > 1")
-    duplicates = cursor.fetchall()
-    print(f"Duplicate barcodes found: {len(duplicates)}")
-    if duplicates:
-        print(f"   (Top 5 duplicates: {duplicates[:5]})")
-
-    # 3. Completeness Check
-    cursor.execute("SELECT COUNT(*) FROM products WHERE name IS NULL OR name = ''")
-    missing_name = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM products WHERE ingredients IS NULL OR ingredients = ''")
-    missing_ingredients = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM products WHERE brand IS NULL OR brand = ''")
-    missing_brand = cursor.fetchone()[0]
-
-    print(f"\nCompleteness:")
-    print(f" - Missing Name: {missing_name} ({missing_name/total_products:.1%})")
-    print(f" - Missing Ingredients: {missing_ingredients} ({missing_ingredients/total_products:.1%})")
-    print(f" - Missing Brand: {missing_brand} ({missing_brand/total_products:.1%})")
-
-    # 4. Consistency: Foreign Key Integrity
-    cursor.execute("""
-        SELECT COUNT(*) FROM allergen_mappings 
-        WHERE product_id NOT IN (SELECT id FROM products)
-    """)
-    orphaned_mappings = cursor.fetchone()[0]
-    print(f"\nConsistency:")
-    print(f" - Orphaned allergen mappings (no matching product): {orphaned_mappings}")
-
-    # 5. Redundancy Check: Same allergen marked as both contains and may_contain for same product
-    cursor.execute("""
-        SELECT product_id, allergen_name, COUNT(DISTINCT status) as status_count 
-        FROM allergen_mappings 
-        GROUP BY product_id, allergen_name 
-        HAVING status_count > 1
-    """)
-    redundant_logic = cursor.fetchall()
-    print(f" - Products with redundant allergen logic (both contains & may_contain): {len(redundant_logic)}")
-
-    # 6. Source Distribution
-    cursor.execute("SELECT source, COUNT(*) FROM products GROUP BY source")
-    sources = cursor.fetchall()
-    print(f"\nSource Distribution: {dict(sources)}")
-
-    # 7. Sample check for specific Asian flags
-    cursor.execute("SELECT COUNT(*) FROM products WHERE categories LIKE '%asian%' OR categories LIKE '%chinese%' OR categories LIKE '%japanese%'")
-    asian_flagged = cursor.fetchone()[0]
-    print(f"\nAsian Food Coverage:")
-    print(f" - Products with Asian-related keywords in categories: {asian_flagged} ({asian_flagged/total_products:.1%})")
-
-    conn.close()
 
 if __name__ == "__main__":
-    check_data_quality()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json', metavar='PATH', help="write the report as JSON ('-' for stdout only)")
+    parser.add_argument('--sample', type=float, help="audit a random fraction of rows (0-1], counts are extrapolated")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for --sample")
+    parser.add_argument('--max', action='append', metavar='METRIC=VALUE', help="fail if metric > VALUE (repeatable)")
+    parser.add_argument('--min', action='append', metavar='METRIC=VALUE', help="fail if metric < VALUE (repeatable)")
+    parser.add_argument('--thresholds', metavar='PATH', help='JSON file: {"max": {metric: value}, "min": {...}}')
+    args = parser.parse_args()
+    if args.sample is not None and not 0 < args.sample <= 1:
+        parser.error("--sample must be in (0, 1]")
 
+    thresholds = None
+    if args.max or args.min or args.thresholds:
+        thresholds = parse_threshold_args(args.max, args.min, args.thresholds)
+    _, failures = check_data_quality(args.sample, args.json, thresholds, args.seed)
+    if failures:
+        sys.exit(1)
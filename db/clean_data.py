@@ -1,62 +1,164 @@
-import sqlite3
 import os
+import argparse
+
+import instrumentation
+from enrich_allergens import mark_products_dirty
+from init_db import ensure_schema
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(
     os.path.abspath(__file__))), 'data/food_data.db')
 
+# 挑选“信息最全”的一条作为主记录
+# 优先级：有图片 > 配料表长 > 有原始过敏原标签，全部相同时保留最早写入的一条
+SURVIVOR_ORDER = """
+    (image_url IS NOT NULL AND image_url != '') DESC,
+    COALESCE(LENGTH(ingredients), 0) DESC,
+    (allergens IS NOT NULL AND allergens != '') DESC,
+    rowid
+"""
 
-def clean_and_consolidate():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+JUNK_CONDITION = "(name IS NULL OR name = '') AND (ingredients IS NULL OR ingredients = '')"
 
-    print("开始执行数据审计与安全合并...")
 
-    # 1. 找出重复的条形码
+def build_merge_plan(cursor):
+    # 每个重复条码组中排名第一的是主记录，其余每行对应一个待合并的重复记录
+    cursor.execute("DROP TABLE IF EXISTS temp.merge_plan")
+    cursor.execute(f"""
+        CREATE TEMP TABLE merge_plan AS
+        SELECT barcode, id AS loser_id, loser_rowid, survivor_id FROM (
+            SELECT barcode, id, rowid AS loser_rowid,
+                   ROW_NUMBER() OVER w AS rn,
+                   FIRST_VALUE(id) OVER w AS survivor_id
+            FROM products
+            WHERE barcode IN (
+                SELECT barcode FROM products
+                WHERE barcode IS NOT NULL
+                GROUP BY barcode
+                HAVING COUNT(*) > 1)
+            WINDOW w AS (PARTITION BY barcode ORDER BY {SURVIVOR_ORDER})
+        )
+        WHERE rn > 1
+    """)
+    cursor.execute("CREATE INDEX temp.idx_merge_plan_loser ON merge_plan (loser_id)")
+    cursor.execute("CREATE INDEX temp.idx_merge_plan_survivor ON merge_plan (survivor_id)")
+
+
+def merge_mappings(cursor):
+    """
+    安全合并逻辑：将重复记录的过敏原映射全部迁移到主记录 ID 下。
+    这样即使 A 记录写了 soy，B 记录写了 peanut，合并后主记录会拥有全部过敏原；
+    任意一条记录确认含有 (contains) 的过敏原，合并后即为 contains (Safety-First)。
+    """
+    # 1. 主记录已有的过敏原：若任一重复记录确认含有，则升级为 contains
     cursor.execute("""
-        SELECT barcode, COUNT(*) as c 
-        FROM products 
-        WHERE barcode IS NOT NULL 
-        GROUP BY barcode 
-        HAVING c > 1
+        UPDATE allergen_mappings SET status = 'contains'
+        WHERE status != 'contains'
+          AND product_id IN (SELECT survivor_id FROM merge_plan)
+          AND EXISTS (
+              SELECT 1 FROM merge_plan mp
+              JOIN allergen_mappings l ON l.product_id = mp.loser_id
+              WHERE mp.survivor_id = allergen_mappings.product_id
+                AND l.allergen_name = allergen_mappings.allergen_name
+                AND l.status = 'contains')
     """)
-    duplicates = cursor.fetchall()
-    print(f"发现 {len(duplicates)} 组条形码重复的产品。")
-
-    for barcode, count in duplicates:
-        # 获取这组重复产品的所有记录
-        cursor.execute(
-            "SELECT id, name, ingredients, image_url, allergens FROM products WHERE barcode = ?", (barcode,))
-        records = cursor.fetchall()
-
-        # 挑选“信息最全”的一条作为主记录
-        # 优先级：有图片 > 配料表长 > 有原始过敏原标签
-        main_record = sorted(records, key=lambda x: (
-            1 if x[3] else 0,
-            len(x[2]) if x[2] else 0,
-            1 if x[4] else 0
-        ), reverse=True)[0]
-
-        main_id = main_record[0]
-        other_ids = [r[0] for r in records if r[0] != main_id]
-
-        # 安全合并逻辑：将其他重复记录的过敏原映射全部迁移到主记录 ID 下
-        # 这样即使 A 记录写了 soy，B 记录写了 peanut，合并后主记录会拥有全部过敏原
-        for old_id in other_ids:
-            cursor.execute(
-                "UPDATE OR IGNORE allergen_mappings SET product_id = ? WHERE product_id = ?", (main_id, old_id))
-            cursor.execute("DELETE FROM products WHERE id = ?", (old_id,))
+    upgraded = cursor.rowcount
 
-    conn.commit()
+    # 2. 主记录没有的过敏原：每个 (主记录, 过敏原) 取最早写入的重复记录那一行迁移过来
+    cursor.execute("DROP TABLE IF EXISTS temp.moved_mappings")
+    cursor.execute("""
+        CREATE TEMP TABLE moved_mappings AS
+        SELECT mapping_id, survivor_id,
+               CASE WHEN status IS NOT NULL AND any_contains THEN 'contains' ELSE status END AS status
+        FROM (
+            SELECT m.id AS mapping_id, mp.survivor_id, m.status,
+                   ROW_NUMBER() OVER w AS rn,
+                   MAX(m.status = 'contains') OVER w_all AS any_contains
+            FROM allergen_mappings m
+            JOIN merge_plan mp ON m.product_id = mp.loser_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM allergen_mappings s
+                WHERE s.product_id = mp.survivor_id AND s.allergen_name = m.allergen_name)
+            WINDOW w AS (PARTITION BY mp.survivor_id, m.allergen_name ORDER BY mp.loser_rowid, m.id),
+                   w_all AS (PARTITION BY mp.survivor_id, m.allergen_name)
+        )
+        WHERE rn = 1
+    """)
+    cursor.execute("""
+        UPDATE allergen_mappings
+        SET product_id = mm.survivor_id, status = mm.status
+        FROM moved_mappings mm
+        WHERE mm.mapping_id = allergen_mappings.id
+    """)
+    moved = cursor.rowcount
+
+    # 3. 其余重复映射（主记录已覆盖）以及重复产品本身一次性删除
+    cursor.execute("DELETE FROM allergen_mappings WHERE product_id IN (SELECT loser_id FROM merge_plan)")
+    cursor.execute("DELETE FROM products WHERE id IN (SELECT loser_id FROM merge_plan)")
+    return upgraded, moved, cursor.rowcount
+
+
+def report_merge_plan(cursor, limit=10):
+    cursor.execute("SELECT COUNT(DISTINCT barcode), COUNT(*) FROM merge_plan")
+    groups, losers = cursor.fetchone()
+    cursor.execute("""
+        SELECT COUNT(*) FROM allergen_mappings
+        WHERE product_id IN (SELECT loser_id FROM merge_plan)
+    """)
+    loser_mappings = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM products WHERE {JUNK_CONDITION}")
+    junk = cursor.fetchone()[0]
+
+    print(f"[dry-run] {groups} 组重复条码，将删除 {losers} 条重复记录，"
+          f"涉及 {loser_mappings} 条过敏原映射；另有 {junk} 条无效记录将被删除。")
+    cursor.execute("""
+        SELECT barcode, survivor_id, GROUP_CONCAT(loser_id, ', ')
+        FROM merge_plan GROUP BY barcode, survivor_id
+        ORDER BY COUNT(*) DESC, barcode LIMIT ?
+    """, (limit,))
+    for barcode, survivor_id, loser_ids in cursor.fetchall():
+        print(f"   条码 {barcode}: 保留 {survivor_id} <- 合并 {loser_ids}")
+
+
+@instrumentation.instrumented("clean_data")
+def clean_and_consolidate(dry_run=False):
+    conn = instrumentation.connect(DB_PATH)
+    ensure_schema(conn)
+    cursor = conn.cursor()
+
+    print("开始执行数据审计与安全合并...")
+
+    # 1. 用窗口函数一次性给所有重复条码组排名，生成合并计划
+    build_merge_plan(cursor)
+
+    if dry_run:
+        report_merge_plan(cursor)
+        conn.rollback()
+        conn.close()
+        return
+
+    cursor.execute("SELECT COUNT(DISTINCT barcode) FROM merge_plan")
+    print(f"发现 {cursor.fetchone()[0]} 组条形码重复的产品。")
+
+    # 整个合并在一个事务里完成
+    upgraded, moved, merged = merge_mappings(cursor)
+
+    # 主记录的映射已被合并，下一次增量标注时需要重新计算
+    cursor.execute("SELECT DISTINCT survivor_id FROM merge_plan")
+    mark_products_dirty(cursor, [row[0] for row in cursor.fetchall()])
 
     # 2. 清理完全没有名字或配料的“垃圾数据”
-    cursor.execute(
-        "DELETE FROM products WHERE (name IS NULL OR name = '') AND (ingredients IS NULL OR ingredients = '')")
+    cursor.execute(f"DELETE FROM products WHERE {JUNK_CONDITION}")
     deleted_junk = cursor.rowcount
+    instrumentation.current().add("rows_written", upgraded + moved + merged + deleted_junk)
 
     conn.commit()
     conn.close()
-    print(f"清理完成：合并了重复条码，删除了 {deleted_junk} 条无效记录。")
+    print(f"清理完成：合并了 {merged} 条重复记录（迁移 {moved} 条映射，升级 {upgraded} 条为 contains），"
+          f"删除了 {deleted_junk} 条无效记录。")
 
 
 if __name__ == "__main__":
-    clean_and_consolidate()
+    parser = argparse.ArgumentParser(description="按条码合并重复产品并清理无效记录")
+    parser.add_argument('--dry-run', action='store_true', help="只报告将要合并/删除的内容，不修改数据库")
+    args = parser.parse_args()
+    clean_and_consolidate(dry_run=args.dry_run)
@@ -0,0 +1,263 @@
+"""
+按内容寻址的向量缓存（跨运行、跨集合共享）
+
+每个模型一个目录：
+    vectors.f16  float16 向量矩阵，通过 np.memmap 读写，每行一个槽位
+    index.db     SQLite 索引：文本哈希 -> 槽位、最近使用时间
+键为规整空白后的文档文本的 SHA-1，所以只有 id 不同的产品、重复抓取的同一商品
+以及 CNF/日本标准食品中的重复条目都只需编码一次。
+
+总大小超过 max_bytes 时按最近使用时间淘汰，腾出的槽位直接复用，矩阵文件不会变大。
+读取时不写索引：命中的条目只在最近使用时间早于 TOUCH_RESOLUTION 时记下，
+随下一次 put_many 的事务或 close() 一起写入。
+
+查询路径（search、inspect_data）用 read_only=True 打开：只查不写，未命中的查询向量不进缓存，
+也不记录最近使用时间。可写的实例（vector 阶段）可以有多个进程同时打开：put_many 在
+BEGIN IMMEDIATE 写锁内重新读取 rows/next_slot 再分配槽位，矩阵文件只会变大，不会被截短。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '../data/embedding_cache')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# 一次淘汰至少容量的 10%，避免每批都触发淘汰
+EVICT_FRACTION = 0.1
+GROW_MIN_ROWS = 1024
+# 最近使用时间的精度（秒）：比这更新的命中不再记录
+TOUCH_RESOLUTION = 3600
+# 待写入的最近使用时间超过这么多条时，在 get_many 里直接写入
+TOUCH_FLUSH_ROWS = 50000
+SQL_PARAM_CHUNK = 500
+
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    slot INTEGER NOT NULL UNIQUE,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY);
+'''
+
+
+def text_key(text):
+    normalized = ' '.join((text or '').split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def model_slug(model_name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+
+
+def chunked(items, size=SQL_PARAM_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, read_only=False):
+        self.model_name = model_name
+        self.dir = os.path.join(cache_dir, model_slug(model_name))
+        self.matrix_path = os.path.join(self.dir, 'vectors.f16')
+        self.index_path = os.path.join(self.dir, 'index.db')
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+
+        self.dim = None
+        self.rows = 0
+        self.next_slot = 0
+        self.matrix = None
+        if read_only:
+            # 还没有缓存时按空缓存处理，不创建目录
+            self.conn = None
+            if os.path.exists(self.index_path):
+                self.conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+        else:
+            os.makedirs(self.dir, exist_ok=True)
+            self.conn = sqlite3.connect(self.index_path)
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.executescript(INDEX_SCHEMA)
+        if self.conn is not None:
+            self._load_meta()
+        self.hits = 0
+        self.misses = 0
+        # 键 -> 最近一次命中的时间，尚未写入索引
+        self.pending_touches = {}
+
+    def _load_meta(self):
+        """读取 dim/rows/next_slot；其他进程扩大了矩阵时重新映射。"""
+        self.dim = self._get_meta('dim')
+        self.next_slot = self._get_meta('next_slot') or 0
+        rows = self._get_meta('rows') or 0
+        if rows != self.rows or (self.matrix is None and rows):
+            self._map(rows)
+
+    def _map(self, rows):
+        if self.matrix is not None:
+            if not self.read_only:
+                self.matrix.flush()
+            del self.matrix
+            self.matrix = None
+        self.rows = rows
+        if self.dim and rows:
+            self.matrix = np.memmap(self.matrix_path, dtype=np.float16, mode='r' if self.read_only else 'r+',
+                                    shape=(rows, self.dim))
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **values):
+        self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                              list(values.items()))
+
+    @property
+    def capacity(self):
+        return max(1, self.max_bytes // (self.dim * 2)) if self.dim else 0
+
+    def __len__(self):
+        if self.conn is None:
+            return 0
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, keys):
+        """返回 {键: float16 向量}，只包含命中的键；命中的条目稍后刷新最近使用时间（见 flush_touches）。"""
+        if self.conn is None:
+            self.misses += len(keys)
+            return {}
+        unique = list(dict.fromkeys(keys))
+        slots = {}
+        now = time.time()
+        for chunk in chunked(unique):
+            placeholders = ",".join("?" * len(chunk))
+            for key, slot, last_used in self.conn.execute(
+                    f"SELECT key, slot, last_used FROM entries WHERE key IN ({placeholders})", chunk):
+                slots[key] = slot
+                if not self.read_only and last_used < now - TOUCH_RESOLUTION:
+                    self.pending_touches[key] = now
+        if len(self.pending_touches) >= TOUCH_FLUSH_ROWS:
+            self.flush_touches()
+        if slots and max(slots.values()) >= self.rows:
+            # 打开之后其他进程扩大了矩阵
+            self._load_meta()
+        slots = {key: slot for key, slot in slots.items() if slot < self.rows}
+        found = {key: np.array(self.matrix[slot]) for key, slot in slots.items()}
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, keys, vectors):
+        if self.read_only:
+            return
+        vectors = np.asarray(vectors, dtype=np.float16)
+        rows = {}
+        for key, vector in zip(keys, vectors):
+            rows[key] = vector
+        if not rows:
+            return
+
+        with self.conn:
+            # 写锁内重新读取元数据：其他进程可能已经分配了槽位或扩大了矩阵
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._load_meta()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与缓存中的 {self.dim} 不一致 ({self.dir})")
+            # 一批比整个缓存还大时只保留最后 capacity 条
+            items = list(rows.items())[-self.capacity:]
+            # 先写入待刷新的最近使用时间，淘汰时才不会误删刚用过的条目
+            self._write_touches()
+            existing = {}
+            for chunk in chunked([key for key, _ in items]):
+                placeholders = ",".join("?" * len(chunk))
+                existing.update(self.conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", chunk).fetchall())
+            new_keys = [key for key, _ in items if key not in existing]
+            slots = dict(existing)
+            slots.update(zip(new_keys, self._allocate(len(new_keys), protected=set(existing))))
+
+            self._ensure_rows(max(slots.values()) + 1)
+            for key, vector in items:
+                self.matrix[slots[key]] = vector
+            self.matrix.flush()
+
+            now = time.time()
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slots[key], now) for key, _ in items])
+            self._set_meta(dim=self.dim, rows=self.rows, next_slot=self.next_slot)
+
+    def _write_touches(self):
+        if self.pending_touches:
+            self.conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                  [(used, key) for key, used in self.pending_touches.items()])
+            self.pending_touches = {}
+
+    def flush_touches(self):
+        """把读取时记下的最近使用时间写入索引（一个事务）。"""
+        if self.pending_touches:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._write_touches()
+
+    def _allocate(self, count, protected=()):
+        slots = []
+        if count == 0:
+            return slots
+
+        free = self.conn.execute("SELECT slot FROM free_slots ORDER BY slot LIMIT ?", (count,)).fetchall()
+        slots.extend(slot for (slot,) in free)
+        self.conn.executemany("DELETE FROM free_slots WHERE slot = ?", free)
+
+        fresh = min(count - len(slots), self.capacity - self.next_slot)
+        if fresh > 0:
+            slots.extend(range(self.next_slot, self.next_slot + fresh))
+            self.next_slot += fresh
+
+        needed = count - len(slots)
+        if needed > 0:
+            # 按最近使用时间淘汰；本批正在更新的条目不淘汰
+            evict_count = max(needed, int(self.capacity * EVICT_FRACTION))
+            victims = [(key, slot) for key, slot in self.conn.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?",
+                (evict_count + len(protected),)).fetchall() if key not in protected][:evict_count]
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+            victim_slots = [slot for _, slot in victims]
+            slots.extend(victim_slots[:needed])
+            self.conn.executemany("INSERT INTO free_slots (slot) VALUES (?)",
+                                  [(slot,) for slot in victim_slots[needed:]])
+        return slots
+
+    def _ensure_rows(self, min_rows):
+        if min_rows <= self.rows:
+            return
+        new_rows = min(self.capacity, max(min_rows, self.rows * 2, GROW_MIN_ROWS))
+        # 文件只扩大不截短（max_bytes 调小后已有的槽位仍然有效）
+        new_rows = max(new_rows, min_rows)
+        with open(self.matrix_path, 'ab') as f:
+            if os.path.getsize(self.matrix_path) < new_rows * self.dim * 2:
+                f.truncate(new_rows * self.dim * 2)
+        self._map(new_rows)
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return f"命中 {self.hits} / {total} ({hit_rate:.1%})，缓存中共 {len(self)} 条"
+
+    def close(self):
+        if self.matrix is not None:
+            if not self.read_only:
+                self.matrix.flush()
+            self.matrix = None
+        if self.conn is not None:
+            self.flush_touches()
+            self.conn.close()
+            self.conn = None
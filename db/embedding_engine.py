@@ -0,0 +1,180 @@
+"""
+向量计算引擎
+
+把「模型编码」和「写入 Chroma」拆成两个阶段并行运行：
+主线程按文本长度排序后分批编码（多进程时由 sentence-transformers 的进程池分担），
+编码好的向量通过队列交给写入线程，用 collection.upsert(embeddings=...) 写入，
+两边互不等待。
+
+编码结果与 Chroma 的 SentenceTransformerEmbeddingFunction 完全一致（同一模型、不做归一化），
+所以集合仍可以用该 embedding_function 做 query_texts 查询。
+
+传入 EmbeddingCache 时先查缓存，只编码未命中的文本；全部命中时连模型都不加载。
+"""
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import text_key
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Chroma 单次写入的上限因版本/后端而异，取不到时按旧版 SQLite 后端的上限处理
+CHROMA_DEFAULT_MAX_BATCH = 5461
+# 每次送入模型的句子数（进程池内部再按此大小切分）
+ENCODE_BATCH_SIZE = 64
+
+
+def chroma_max_batch_size(client):
+    getter = getattr(client, "get_max_batch_size", None)
+    if getter is not None:
+        try:
+            return getter()
+        except Exception:
+            pass
+    return getattr(client, "max_batch_size", None) or CHROMA_DEFAULT_MAX_BATCH
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+class EmbeddingEngine:
+    """
+    第一次需要编码时加载模型；workers > 1 时启动多进程编码池。
+    作为上下文管理器使用，退出时关闭进程池和缓存。
+    """
+
+    def __init__(self, model_name=MODEL_NAME, workers=None, encode_batch_size=ENCODE_BATCH_SIZE,
+                 cache=None):
+        self.model_name = model_name
+        self.workers = workers if workers is not None else default_workers()
+        self.encode_batch_size = encode_batch_size
+        self.cache = cache
+        self.model = None
+        self.pool = None
+
+    def start(self):
+        if self.model is not None:
+            return
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(self.model_name)
+        if self.workers > 1:
+            self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+
+    def encode(self, texts):
+        if self.cache is None:
+            return self._encode(texts)
+
+        keys = [text_key(text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = np.asarray(self._encode(list(missing.values()))).astype(np.float16)
+            self.cache.put_many(list(missing), vectors)
+            found.update(zip(missing, vectors))
+        # 命中与否都返回 float16 精度的向量，保证同一文本每次写入的向量完全相同
+        return np.stack([found[key] for key in keys]).astype(np.float32)
+
+    def _encode(self, texts):
+        self.start()
+        if self.pool is not None:
+            return self.model.encode_multi_process(
+                texts, self.pool, batch_size=self.encode_batch_size)
+        return self.model.encode(
+            texts, batch_size=self.encode_batch_size, convert_to_numpy=True)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class UpsertWorker(threading.Thread):
+    """从队列取 (ids, 文本, 元数据, 向量) 写入集合；出错后继续取空队列，避免主线程阻塞。"""
+
+    def __init__(self, collection, jobs):
+        super().__init__(daemon=True)
+        self.collection = collection
+        self.jobs = jobs
+        self.error = None
+        self.seconds = 0.0
+        self.written = 0
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            if self.error is not None:
+                continue
+            ids, documents, metadatas, embeddings = job
+            started = time.perf_counter()
+            try:
+                self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas,
+                                       embeddings=embeddings)
+            except Exception as e:
+                self.error = e
+                continue
+            self.seconds += time.perf_counter() - started
+            self.written += len(ids)
+
+
+def rate(count, seconds):
+    return count / seconds if seconds > 0 else 0.0
+
+
+def embed_and_upsert(collection, engine, ids, documents, metadatas, batch_size, queue_depth=2):
+    """
+    按文本长度排序后分批编码并写入集合，返回各阶段耗时。
+    长度相近的文本在同一批里，padding 最少。
+    """
+    total = len(documents)
+    order = sorted(range(total), key=lambda i: len(documents[i]))
+    jobs = queue.Queue(maxsize=queue_depth)
+    writer = UpsertWorker(collection, jobs)
+    writer.start()
+
+    started = time.perf_counter()
+    encode_seconds = 0.0
+    try:
+        for start in range(0, total, batch_size):
+            if writer.error is not None:
+                break
+            batch = order[start:start + batch_size]
+            batch_docs = [documents[i] for i in batch]
+
+            t0 = time.perf_counter()
+            embeddings = engine.encode(batch_docs)
+            encode_seconds += time.perf_counter() - t0
+
+            jobs.put(([ids[i] for i in batch], batch_docs, [metadatas[i] for i in batch], embeddings))
+            done = min(start + batch_size, total)
+            print(f"   进度: 已编码 {done} / {total}，已写入 {writer.written}")
+    finally:
+        jobs.put(None)
+        writer.join()
+    if writer.error is not None:
+        raise writer.error
+
+    wall = time.perf_counter() - started
+    print(f"   编码: {total} 条 {encode_seconds:.1f}s ({rate(total, encode_seconds):.0f} 条/秒)")
+    print(f"   写入: {writer.written} 条 {writer.seconds:.1f}s ({rate(writer.written, writer.seconds):.0f} 条/秒)")
+    print(f"   总计: {total} 条 {wall:.1f}s ({rate(total, wall):.0f} 条/秒)")
+    if engine.cache is not None:
+        print(f"   向量缓存: {engine.cache.stats()}")
+    return {"encode_seconds": encode_seconds, "upsert_seconds": writer.seconds, "wall_seconds": wall}
@@ -1,8 +1,32 @@
-import sqlite3
 import os
+import argparse
+import hashlib
+
+import instrumentation
+from allergen_matcher import compile_matcher
+from allergen_profiles import rebuild_profiles, sync_allergen_bits
+from ingredient_tokens import (NORMALIZER_VERSION, TOKENS_JOIN, delete_stale_tokens, normalize_text,
+                               split_tokens, sync_ingredient_tokens, token_row, tokenize,
+                               write_ingredient_tokens)
+from init_db import ensure_schema
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
 
+# enrichment_dict_state 中保存短语哈希的保留键
+PHRASES_KEY = "__may_contain_phrases__"
+
+# 配料取 ingredient_tokens 中预先归一化、切分好的结果（缺行时 t.* 为 NULL，当场归一化）；原始三列只用于指纹
+PRODUCTS_SQL = f'''
+    SELECT p.id, p.ingredients, p.allergens, p.traces, t.normalized, t.tokens
+    FROM products p {TOKENS_JOIN}
+'''
+# 增量运行先只读原始三列比对指纹，再读需要重算的产品的归一化配料
+FINGERPRINT_SQL = "SELECT id, ingredients, allergens, traces FROM products"
+DIRTY_TOKENS_SQL = '''
+    SELECT t.product_id, t.normalized, t.tokens
+    FROM dirty_products d JOIN ingredient_tokens t ON t.product_id = d.product_id
+'''
+
 ALLERGEN_DICT = {
     "en:peanuts": ["peanut", "groundnut", "花生", "落花生", "ピーナッツ", "arachide", "cacahuète"],
     "en:soybeans": ["soy", "soya", "soybean", "lecithin", "大豆", "だいず", "酱油", "醬油", "soja", "edamame", "tofu", "豆豉", "腐乳", "味噌", "miso"],
@@ -29,64 +53,251 @@ MAY_CONTAIN_PHRASES = [
 ]
 
 
-def enrich_allergens():
-    if not os.path.exists(DB_PATH):
-        print(f"Error: {DB_PATH} not found.")
+def derive_allergens(matcher, normalized, tokens, api_allergens, api_traces):
+    found_allergens = {}
+
+    if api_allergens:
+        for a in [a.strip() for a in api_allergens.split(',') if a.strip()]:
+            found_allergens[a] = "contains"
+
+    if api_traces:
+        for t in [t.strip() for t in api_traces.split(',') if t.strip()]:
+            if t not in found_allergens:
+                found_allergens[t] = "may_contain"
+
+    # 配料项查缓存；有 "可能含有" 短语时一次扫描同时得到关键词命中与切分点
+    for tag, status in matcher.classify_tokens(normalized, tokens):
+        if found_allergens.get(tag) == "contains":
+            continue
+        found_allergens[tag] = status
+
+    return found_allergens
+
+
+def product_fingerprint(ingredients, api_allergens, api_traces):
+    # 只对影响映射结果的三列取指纹
+    raw = "\x1f".join([ingredients or "", api_allergens or "", api_traces or ""])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def dictionary_hashes():
+    """
+    每个标签的关键词哈希，外加 "可能含有" 短语的哈希（短语变化会影响所有标签）。
+    关键词按归一化后的形式比较；归一化规则的版本计入短语哈希，规则变化时整表重建。
+    """
+    hashes = {}
+    for tag, keywords in ALLERGEN_DICT.items():
+        raw = "\x1f".join(sorted({normalize_text(kw) for kw in keywords}))
+        hashes[tag] = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    raw = "\x1f".join([NORMALIZER_VERSION] + MAY_CONTAIN_PHRASES)
+    hashes[PHRASES_KEY] = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return hashes
+
+
+def dictionary_version(hashes):
+    raw = "\x1f".join(f"{k}={v}" for k, v in sorted(hashes.items()))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def mark_products_dirty(cursor, product_ids):
+    """让指定产品在下一次增量运行时重新计算（例如 clean_data 合并了映射之后）。"""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'enrichment_state'")
+    if cursor.fetchone() is None:
         return
+    cursor.executemany("DELETE FROM enrichment_state WHERE product_id = ?",
+                       [(p_id,) for p_id in product_ids])
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
+def mapping_rows(p_id, found_allergens):
+    return [(p_id, tag, status) for tag, status in found_allergens.items()]
+
+
+def insert_mappings(cursor, rows):
+    # 所有产品的映射一次 executemany 写入，不再每个产品一条语句
+    cursor.executemany("INSERT INTO allergen_mappings (product_id, allergen_name, status) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+def enrich_full(cursor, matcher, version):
     print("正在清理旧的过敏原映射数据...")
     cursor.execute("DELETE FROM allergen_mappings")
+    cursor.execute("DELETE FROM enrichment_state")
+    delete_stale_tokens(cursor)
 
-    cursor.execute("SELECT id, ingredients, allergens, traces FROM products")
+    cursor.execute(PRODUCTS_SQL)
     products = cursor.fetchall()
 
     print(f"正在重新处理 {len(products)} 个产品...")
 
-    added_count = 0
-    for p_id, ingredients, api_allergens, api_traces in products:
-        found_allergens = {}
-
-        if api_allergens:
-            for a in [a.strip() for a in api_allergens.split(',') if a.strip()]:
-                found_allergens[a] = "contains"
-
-        if api_traces:
-            for t in [t.strip() for t in api_traces.split(',') if t.strip()]:
-                if t not in found_allergens:
-                    found_allergens[t] = "may_contain"
-
-        if ingredients:
-            ing_lower = ingredients.lower()
-            main_part = ing_lower
-            may_part = ""
-            for phrase in MAY_CONTAIN_PHRASES:
-                if phrase in ing_lower:
-                    parts = ing_lower.split(phrase, 1)
-                    main_part = parts[0]
-                    may_part = parts[1]
-                    break
-
-            for tag, keywords in ALLERGEN_DICT.items():
-                if found_allergens.get(tag) == "contains":
-                    continue
-                if any(kw.lower() in main_part for kw in keywords):
-                    found_allergens[tag] = "contains"
-                    continue
-                if any(kw.lower() in may_part for kw in keywords):
-                    found_allergens[tag] = "may_contain"
-
-        for tag, status in found_allergens.items():
-            cursor.execute("INSERT INTO allergen_mappings (product_id, allergen_name, status) VALUES (?, ?, ?)",
-                           (p_id, tag, status))
-            added_count += 1
+    mappings = []
+    states = []
+    # 冷启动时 ingredient_tokens 为空：在同一遍里归一化，最后整批写回，不再先单独跑一遍 normalize
+    token_rows = []
+    for p_id, ingredients, api_allergens, api_traces, normalized, tokens in products:
+        if normalized is None:
+            normalized = normalize_text(ingredients)
+            tokens = tokenize(normalized)
+            token_rows.append(token_row(p_id, normalized, tokens))
+        else:
+            tokens = split_tokens(tokens)
+        found_allergens = derive_allergens(
+            matcher, normalized, tokens, api_allergens, api_traces)
+        mappings.extend(mapping_rows(p_id, found_allergens))
+        states.append((p_id, product_fingerprint(
+            ingredients, api_allergens, api_traces), version))
+    if token_rows:
+        write_ingredient_tokens(cursor, token_rows)
+        print(f"归一化了 {len(token_rows)} 个产品的配料。")
+    added_count = insert_mappings(cursor, mappings)
+
+    cursor.executemany(
+        "INSERT INTO enrichment_state (product_id, fingerprint, dict_version) VALUES (?, ?, ?)", states)
+    return added_count
+
+
+def enrich_incremental(cursor, matcher, version, old_version, affected_tags):
+    cursor.execute("SELECT product_id, fingerprint, dict_version FROM enrichment_state")
+    known = {p_id: (fp, ver) for p_id, fp, ver in cursor.fetchall()}
+
+    cursor.execute(FINGERPRINT_SQL)
+    products = cursor.fetchall()
+
+    # 1. 根据指纹区分 新增 / 变化 / 未变化 的产品
+    changed = []
+    unchanged = []
+    new_count = 0
+    for row in products:
+        p_id, ingredients, api_allergens, api_traces = row
+        fp = product_fingerprint(ingredients, api_allergens, api_traces)
+        state = known.pop(p_id, None)
+        if state is None:
+            new_count += 1
+            changed.append((row, fp))
+        elif state[0] != fp or state[1] != old_version:
+            changed.append((row, fp))
+        else:
+            unchanged.append(row)
+    # 剩下的 known 即为已被删除的产品
+    deleted_ids = list(known)
+
+    print(f"新增 {new_count} 个，变化 {len(changed) - new_count} 个，"
+          f"删除 {len(deleted_ids)} 个，未变化 {len(unchanged)} 个产品。")
+
+    # 2. 一次性删除 已删除 + 新增/变化 产品的旧映射（临时表避免逐行全表扫描）
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS dirty_products (product_id TEXT PRIMARY KEY)")
+    cursor.execute("DELETE FROM dirty_products")
+    cursor.executemany("INSERT OR IGNORE INTO dirty_products (product_id) VALUES (?)",
+                       [(p_id,) for p_id in deleted_ids] + [(row[0],) for row, _ in changed])
+    cursor.execute(
+        "DELETE FROM allergen_mappings WHERE product_id IN (SELECT product_id FROM dirty_products)")
+    cursor.execute(
+        "DELETE FROM enrichment_state WHERE product_id IN (SELECT product_id FROM dirty_products)")
+
+    # 受词典变化影响的标签先整体清掉，下面再按产品补回
+    if affected_tags:
+        placeholders = ",".join("?" * len(affected_tags))
+        cursor.execute(f"DELETE FROM allergen_mappings WHERE allergen_name IN ({placeholders})",
+                       sorted(affected_tags))
+
+    # 3. 新增/变化的产品：整行重算
+    cursor.execute(DIRTY_TOKENS_SQL)
+    normalized_by_id = {p_id: (normalized, tokens) for p_id, normalized, tokens in cursor.fetchall()}
+    mappings = []
+    states = []
+    for (p_id, _, api_allergens, api_traces), fp in changed:
+        normalized, tokens = normalized_by_id.get(p_id, ("", ""))
+        found_allergens = derive_allergens(
+            matcher, normalized, split_tokens(tokens), api_allergens, api_traces)
+        mappings.extend(mapping_rows(p_id, found_allergens))
+        states.append((p_id, fp, version))
+    added_count = insert_mappings(cursor, mappings)
+    cursor.executemany(
+        "INSERT INTO enrichment_state (product_id, fingerprint, dict_version) VALUES (?, ?, ?)", states)
+
+    # 4. 词典变化：未变化的产品只重算受影响的标签
+    if affected_tags:
+        print(f"词典变化，重算标签: {', '.join(sorted(affected_tags))}")
+        sub_dict = {tag: kws for tag, kws in ALLERGEN_DICT.items() if tag in affected_tags}
+        sub_matcher = compile_matcher(sub_dict, MAY_CONTAIN_PHRASES, normalize_text, tokenize)
+        cursor.execute("SELECT product_id, normalized, tokens FROM ingredient_tokens")
+        normalized_by_id = {p_id: (normalized, tokens) for p_id, normalized, tokens in cursor.fetchall()}
+        mappings = []
+        for p_id, _, api_allergens, api_traces in unchanged:
+            normalized, tokens = normalized_by_id.get(p_id, ("", ""))
+            found_allergens = derive_allergens(
+                sub_matcher, normalized, split_tokens(tokens), api_allergens, api_traces)
+            mappings.extend(mapping_rows(p_id, {
+                tag: status for tag, status in found_allergens.items() if tag in affected_tags}))
+        added_count += insert_mappings(cursor, mappings)
+        cursor.execute("UPDATE enrichment_state SET dict_version = ?", (version,))
+
+    return added_count
+
+
+@instrumentation.instrumented("enrich")
+def enrich_allergens(full=False):
+    if not os.path.exists(DB_PATH):
+        print(f"Error: {DB_PATH} not found.")
+        return
+
+    conn = instrumentation.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    # 确保增量状态表和索引存在（旧数据库未包含这些表）
+    ensure_schema(conn)
+
+    hashes = dictionary_hashes()
+    version = dictionary_version(hashes)
+    cursor.execute("SELECT tag, keywords_hash FROM enrichment_dict_state")
+    old_hashes = dict(cursor.fetchall())
+    cursor.execute("SELECT COUNT(*) FROM enrichment_state")
+    has_state = cursor.fetchone()[0] > 0
+    # 没有历史状态，或者 "可能含有" 短语变化（切分点全部失效）时整表重建
+    rebuild = full or not has_state or old_hashes.get(PHRASES_KEY) != hashes[PHRASES_KEY]
+
+    if not rebuild:
+        # 流水线中 normalize 阶段已经处理过，这里只补上单独运行时缺少的产品；
+        # 整表重建时由 enrich_full 在同一遍里归一化
+        normalized_count = sync_ingredient_tokens(conn)
+        if normalized_count:
+            print(f"归一化了 {normalized_count} 个产品的配料。")
+
+    cursor.execute("SELECT COUNT(*) FROM allergen_profiles")
+    has_profiles = cursor.fetchone()[0] > 0
+
+    matcher = compile_matcher(ALLERGEN_DICT, MAY_CONTAIN_PHRASES, normalize_text, tokenize)
+    sync_allergen_bits(cursor, ALLERGEN_DICT)
+
+    if rebuild:
+        added_count = enrich_full(cursor, matcher, version)
+        rebuild_profiles(cursor)
+    else:
+        # 新增、删除或关键词变化的标签
+        affected_tags = {tag for tag in set(hashes) | set(old_hashes)
+                         if tag != PHRASES_KEY and hashes.get(tag) != old_hashes.get(tag)}
+        added_count = enrich_incremental(
+            cursor, matcher, version, dictionary_version(old_hashes), affected_tags)
+        # 词典变化会影响所有产品的位图；否则只重算新增/变化/删除的产品
+        if affected_tags or not has_profiles:
+            rebuild_profiles(cursor)
+        else:
+            rebuild_profiles(cursor, dirty_table="dirty_products")
+
+    cursor.execute("DELETE FROM enrichment_dict_state")
+    cursor.executemany("INSERT INTO enrichment_dict_state (tag, keywords_hash) VALUES (?, ?)",
+                       list(hashes.items()))
 
     conn.commit()
+    instrumentation.current().add("rows_written", added_count)
+    cursor.execute("SELECT COUNT(*) FROM allergen_mappings")
+    total = cursor.fetchone()[0]
     conn.close()
-    print(f"处理完成！当前数据库共有 {added_count} 条唯一的过敏原关系。")
+    print(f"处理完成！本次写入 {added_count} 条过敏原关系，当前数据库共有 {total} 条。")
 
 
 if __name__ == "__main__":
-    enrich_allergens()
+    parser = argparse.ArgumentParser(description="为产品打过敏原标签")
+    parser.add_argument('--full', action='store_true', help="忽略增量状态，整表重建")
+    args = parser.parse_args()
+    enrich_allergens(full=args.full)
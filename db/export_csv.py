@@ -1,59 +1,127 @@
-import sqlite3
-import pandas as pd
+import argparse
+import csv
 import os
+import time
+
+import instrumentation
 
 # 获取项目根目录 (相对于 db/export_csv.py)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, 'data/food_data.db')
 OUTPUT_PATH = os.path.join(BASE_DIR, 'data/food_products_summary.csv')
 
+# 每次从 SQLite 取出并写出的行数，内存占用与数据库大小无关
+CHUNK_SIZE = 10000
 
-def export_to_csv():
-    if not os.path.exists(DB_PATH):
-        print(f"Database not found at: {DB_PATH}")
-        print("Please run this script from the project root or ensure scripts/fetch_off.py has run.")
-        return
+EXPORT_COLUMNS = ["id", "barcode", "name", "brand", "source", "ingredients", "countries",
+                  "allergens_confirmed", "allergens_may_contain"]
+
+# 过敏原在 SQL 中按状态聚合；子查询按映射写入顺序 (id) 排列，与旧版 pandas 聚合的顺序一致
+EXPORT_SQL = '''
+    SELECT p.id, p.barcode, p.name, p.brand, p.source, p.ingredients, p.countries,
+        (SELECT GROUP_CONCAT(allergen_name, ', ') FROM (
+            SELECT allergen_name FROM allergen_mappings m
+            WHERE m.product_id = p.id AND m.status = 'contains' ORDER BY m.id)),
+        (SELECT GROUP_CONCAT(allergen_name, ', ') FROM (
+            SELECT allergen_name FROM allergen_mappings m
+            WHERE m.product_id = p.id AND m.status = 'may_contain' ORDER BY m.id))
+    FROM products p
+'''
+
+# Parquet 分区列；空值写入这个分区
+PARTITION_COLUMN = "source"
+UNKNOWN_PARTITION = "unknown"
 
-    print("Exporting data to CSV...")
-    conn = sqlite3.connect(DB_PATH)
 
-    # 1. 获取所有产品基本信息
-    query_products = "SELECT id, barcode, name, brand, source, ingredients, countries FROM products"
-    df_products = pd.read_sql_query(query_products, conn)
+def iter_export_chunks(conn, chunk_size=CHUNK_SIZE):
+    cursor = conn.execute(EXPORT_SQL)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        # 与旧版 fillna('') 一致：NULL 写成空字符串
+        yield [tuple('' if value is None else value for value in row) for row in rows]
 
-    # 2. 获取过敏原映射并聚合
-    query_allergens = "SELECT product_id, allergen_name, status FROM allergen_mappings"
-    df_mappings = pd.read_sql_query(query_allergens, conn)
 
-    if df_mappings.empty:
-        df_final = df_products
-        df_final['allergens_confirmed'] = ''
-        df_final['allergens_may_contain'] = ''
-    else:
-        # 聚合确切含有的过敏原
-        confirmed = df_mappings[df_mappings['status'] == 'contains'].groupby(
-            'product_id')['allergen_name'].apply(lambda x: ', '.join(x)).reset_index()
-        confirmed.columns = ['id', 'allergens_confirmed']
+class PartitionedParquetWriter:
+    """按 source 分区写 Parquet（目录结构 source=OFF/part-0.parquet，pyarrow / pandas 可直接读取）。"""
 
-        # 聚合可能含有的过敏原
-        may_contain = df_mappings[df_mappings['status'] == 'may_contain'].groupby(
-            'product_id')['allergen_name'].apply(lambda x: ', '.join(x)).reset_index()
-        may_contain.columns = ['id', 'allergens_may_contain']
+    def __init__(self, root):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("写 Parquet 需要安装 pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.pq = pq
+        self.root = root
+        self.partition_index = EXPORT_COLUMNS.index(PARTITION_COLUMN)
+        self.columns = [c for c in EXPORT_COLUMNS if c != PARTITION_COLUMN]
+        self.schema = pa.schema([(c, pa.string()) for c in self.columns])
+        self.writers = {}
+        os.makedirs(root, exist_ok=True)
 
-        # 3. 合并数据
-        df_final = df_products.merge(confirmed, on='id', how='left').merge(
-            may_contain, on='id', how='left')
+    def write(self, rows):
+        partitions = {}
+        for row in rows:
+            key = row[self.partition_index] or UNKNOWN_PARTITION
+            partitions.setdefault(key, []).append(row)
+        for key, part_rows in partitions.items():
+            writer = self.writers.get(key)
+            if writer is None:
+                directory = os.path.join(self.root, f"{PARTITION_COLUMN}={key}")
+                os.makedirs(directory, exist_ok=True)
+                writer = self.pq.ParquetWriter(os.path.join(directory, "part-0.parquet"), self.schema)
+                self.writers[key] = writer
+            arrays = [self.pa.array([str(row[i]) for row in part_rows], type=self.pa.string())
+                      for i, column in enumerate(EXPORT_COLUMNS) if column != PARTITION_COLUMN]
+            writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
 
-    # 清洗：将 NaN 替换为空字符串
-    df_final = df_final.fillna('')
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+@instrumentation.instrumented("export")
+def export_to_csv(output_path=OUTPUT_PATH, parquet_dir=None, chunk_size=CHUNK_SIZE):
+    if not os.path.exists(DB_PATH):
+        print(f"Database not found at: {DB_PATH}")
+        print("Please run this script from the project root or ensure scripts/fetch_off.py has run.")
+        return
+
+    print("Exporting data to CSV...")
+    started = time.perf_counter()
+    conn = instrumentation.connect(DB_PATH)
+    parquet = PartitionedParquetWriter(parquet_dir) if parquet_dir else None
 
-    # 4. 导出
-    df_final.to_csv(OUTPUT_PATH, index=False, encoding='utf-8-sig')
-    print(f"Export completed: {OUTPUT_PATH}")
-    print(f"Total rows exported: {len(df_final)}")
+    total = 0
+    try:
+        # 流式写出：每次只在内存中保留 chunk_size 行
+        with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(EXPORT_COLUMNS)
+            for rows in iter_export_chunks(conn, chunk_size):
+                writer.writerows(rows)
+                if parquet is not None:
+                    parquet.write(rows)
+                total += len(rows)
+                instrumentation.current().add("rows_written", len(rows))
+    finally:
+        if parquet is not None:
+            parquet.close()
+        conn.close()
 
-    conn.close()
+    print(f"Export completed: {output_path}")
+    if parquet is not None:
+        print(f"Parquet dataset (partitioned by {PARTITION_COLUMN}): {parquet_dir}")
+    print(f"Total rows exported: {total} ({time.perf_counter() - started:.1f}s)")
 
 
 if __name__ == "__main__":
-    export_to_csv()
+    parser = argparse.ArgumentParser(description="导出产品及过敏原汇总 (CSV / 可选 Parquet)")
+    parser.add_argument('--output', default=OUTPUT_PATH, help="CSV 输出路径")
+    parser.add_argument('--parquet', metavar='DIR', help="同时按 source 分区写出 Parquet 数据集到该目录")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="每批读取/写出的行数")
+    args = parser.parse_args()
+    export_to_csv(args.output, args.parquet, args.chunk_size)
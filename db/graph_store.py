@@ -0,0 +1,185 @@
+"""
+紧凑的知识图谱存储与查询
+
+目录结构 (data/food_graph/):
+    nodes.db          SQLite: node_id -> (类型, 键, 名称)，按 (类型, 键) 建索引
+    indptr.npy        CSR 行指针，长度 = 节点数 + 1
+    indices.npy       CSR 邻居节点 (int32)
+    edge_types.npy    与 indices 对齐的边类型 (uint8，见 EDGE_TYPES)
+    meta.json         节点数、边数、构建时间
+
+节点: product(键为产品 id)、allergen、brand、category、source。
+每条关系正反两个方向都存储，所以任意节点都能直接查邻居。
+数组用 np.load(mmap_mode='r') 打开，查询时不需要把整张图读入内存。
+
+用法:
+    python db/graph_store.py neighbours product:OFF_123
+    python db/graph_store.py cooccurrence en:peanuts
+    python db/graph_store.py sharing OFF_123 --k 3
+"""
+import argparse
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+GRAPH_DIR = 'data/food_graph'
+
+NODE_TYPES = ("product", "allergen", "brand", "category", "source")
+EDGE_TYPES = ("contains", "may_contain", "brand", "category", "source")
+EDGE_CODES = {name: code for code, name in enumerate(EDGE_TYPES)}
+ALLERGEN_EDGES = ("contains", "may_contain")
+
+
+class GraphStore:
+    def __init__(self, graph_dir=GRAPH_DIR):
+        self.graph_dir = graph_dir
+        self.indptr = np.load(os.path.join(graph_dir, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(graph_dir, 'indices.npy'), mmap_mode='r')
+        self.edge_types = np.load(os.path.join(graph_dir, 'edge_types.npy'), mmap_mode='r')
+        self.conn = sqlite3.connect(os.path.join(graph_dir, 'nodes.db'))
+        with open(os.path.join(graph_dir, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+
+    @property
+    def node_count(self):
+        return len(self.indptr) - 1
+
+    def node_id(self, node_type, key):
+        row = self.conn.execute("SELECT node_id FROM nodes WHERE type = ? AND key = ?",
+                                (node_type, key)).fetchone()
+        return row[0] if row else None
+
+    def resolve(self, ref):
+        """'product:OFF_123' / 'allergen:en:milk' -> node_id；未找到时抛出 KeyError。"""
+        node_type, _, key = ref.partition(':')
+        node_id = self.node_id(node_type, key) if node_type in NODE_TYPES else None
+        if node_id is None:
+            raise KeyError(f"未找到节点: {ref}")
+        return node_id
+
+    def nodes(self, node_ids):
+        """返回 {node_id: (类型, 键, 名称)}。"""
+        node_ids = [int(n) for n in node_ids]
+        result = {}
+        for i in range(0, len(node_ids), 500):
+            chunk = node_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for node_id, node_type, key, label in self.conn.execute(
+                    f"SELECT node_id, type, key, label FROM nodes WHERE node_id IN ({placeholders})", chunk):
+                result[node_id] = (node_type, key, label)
+        return result
+
+    def neighbours(self, node_id, edge_types=None):
+        """返回 (邻居节点数组, 边类型数组)；edge_types 为边类型名的集合时只保留这些边。"""
+        start, end = self.indptr[node_id], self.indptr[node_id + 1]
+        neighbours = np.asarray(self.indices[start:end])
+        types = np.asarray(self.edge_types[start:end])
+        if edge_types is not None:
+            keep = np.isin(types, [EDGE_CODES[t] for t in edge_types])
+            neighbours, types = neighbours[keep], types[keep]
+        return neighbours, types
+
+    def gather(self, node_ids, edge_types=None):
+        """
+        一次取出多个节点的全部邻居（向量化，不逐个节点循环）。
+        返回 (所属节点, 邻居节点, 边类型) 三个等长数组。
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        starts = np.asarray(self.indptr[node_ids], dtype=np.int64)
+        lengths = np.asarray(self.indptr[node_ids + 1], dtype=np.int64) - starts
+        total = int(lengths.sum())
+        if total == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty.astype(np.uint8)
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        positions = offsets + np.arange(total)
+        owners = np.repeat(node_ids, lengths)
+        neighbours = np.asarray(self.indices[positions])
+        types = np.asarray(self.edge_types[positions])
+        if edge_types is not None:
+            keep = np.isin(types, [EDGE_CODES[t] for t in edge_types])
+            owners, neighbours, types = owners[keep], neighbours[keep], types[keep]
+        return owners, neighbours, types
+
+    def co_occurrence(self, allergen_id, edge_types=("contains",), top=None):
+        """含有该过敏原的产品中，其他过敏原各出现多少次：[(allergen_node_id, 次数), ...]。"""
+        products, _ = self.neighbours(allergen_id, edge_types)
+        _, allergens, _ = self.gather(products, edge_types)
+        allergens = allergens[allergens != allergen_id]
+        ids, counts = np.unique(allergens, return_counts=True)
+        order = np.argsort(-counts, kind='stable')
+        pairs = [(int(ids[i]), int(counts[i])) for i in order]
+        return pairs[:top] if top else pairs
+
+    def products_sharing(self, product_id, k=2, edge_types=("contains",), limit=None):
+        """与该产品至少共有 k 个过敏原的其他产品：[(product_node_id, 共有数), ...]，按共有数降序。"""
+        allergens, _ = self.neighbours(product_id, edge_types)
+        if len(allergens) < k:
+            return []
+        _, products, _ = self.gather(allergens, edge_types)
+        products = products[products != product_id]
+        ids, counts = np.unique(products, return_counts=True)
+        keep = counts >= k
+        ids, counts = ids[keep], counts[keep]
+        order = np.argsort(-counts, kind='stable')
+        pairs = [(int(ids[i]), int(counts[i])) for i in order]
+        return pairs[:limit] if limit else pairs
+
+    def close(self):
+        self.conn.close()
+
+
+def format_node(info, node_id):
+    node_type, key, label = info.get(node_id, ("?", str(node_id), None))
+    return f"{node_type}:{key}" + (f" ({label})" if label and label != key else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询 build_graph 生成的图谱")
+    parser.add_argument('--graph-dir', default=GRAPH_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('neighbours', help="节点的邻居，如 product:OFF_123 / allergen:en:milk / brand:Nissin")
+    p.add_argument('node')
+    p.add_argument('--edge', action='append', choices=EDGE_TYPES, help="只看这些边类型（可重复）")
+    p.add_argument('--limit', type=int, default=50)
+    p = sub.add_parser('cooccurrence', help="与某过敏原同时出现的过敏原")
+    p.add_argument('allergen')
+    p.add_argument('--may-contain', action='store_true', help="把 \"可能含有\" 也计入")
+    p = sub.add_parser('sharing', help="与某产品共有至少 k 个过敏原的产品")
+    p.add_argument('product_id')
+    p.add_argument('--k', type=int, default=2)
+    p.add_argument('--may-contain', action='store_true', help="把 \"可能含有\" 也计入")
+    p.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    store = GraphStore(args.graph_dir)
+    try:
+        if args.command == 'neighbours':
+            neighbours, types = store.neighbours(store.resolve(args.node), args.edge)
+            info = store.nodes(neighbours[:args.limit])
+            for node_id, code in zip(neighbours[:args.limit], types[:args.limit]):
+                print(f"-[{EDGE_TYPES[code]}]-> {format_node(info, int(node_id))}")
+            print(f"共 {len(neighbours)} 个邻居")
+        elif args.command == 'cooccurrence':
+            edge_types = ALLERGEN_EDGES if args.may_contain else ("contains",)
+            pairs = store.co_occurrence(store.resolve(f"allergen:{args.allergen}"), edge_types)
+            info = store.nodes([node_id for node_id, _ in pairs])
+            for node_id, count in pairs:
+                print(f"{format_node(info, node_id):<40} {count}")
+        else:
+            edge_types = ALLERGEN_EDGES if args.may_contain else ("contains",)
+            pairs = store.products_sharing(store.resolve(f"product:{args.product_id}"), args.k,
+                                           edge_types, args.limit)
+            info = store.nodes([node_id for node_id, _ in pairs])
+            for node_id, count in pairs:
+                print(f"{format_node(info, node_id):<60} 共有 {count} 个过敏原")
+    except KeyError as e:
+        raise SystemExit(str(e.args[0]))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+配料文本的归一化与切分（ingredient_tokens 表，见 db/migrations/0007_ingredient_tokens.sql）
+
+每个产品的配料只在变化后归一化一次，下游直接读取结果：
+    - enrich_allergens 在归一化文本 / 配料项上匹配过敏原关键词（关键词用同一函数归一化）；
+      全量重建时顺带归一化缺行的产品，不再单独扫一遍
+    - search 在 ingredient_tokens_fts 上按归一化后的检索词查配料
+    - init_vector 用归一化后的配料生成向量文档
+
+归一化: NFKC（全角 -> 半角、半角片假名 -> 全角）→ casefold → 繁体/日文新字体 -> 简体
+        → E 编号统一为 e220 的形式（E 220、E-220、INS 220……）→ 合并空白
+配料项: 在列表分隔符（逗号、顿号、分号、括号……）处切开
+
+products 上的触发器在配料变化或产品删除时删掉对应的行，同步时只处理缺行的产品；
+修改归一化规则后提高 NORMALIZER_VERSION，旧版本的行会在下次同步时全部重算。
+
+用法:
+    python db/ingredient_tokens.py [--full]
+"""
+import argparse
+import os
+import re
+import unicodedata
+
+import instrumentation
+from init_db import ensure_schema
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
+
+NORMALIZER_VERSION = "2"
+
+# 繁体 / 日文新字体 -> 简体（只收配料、过敏原和 "可能含有" 声明中常见的字）
+CJK_VARIANTS = dict(zip(
+    "醬醤鹽塩魚蝦雞鷄鶏蠔麵麪麥蕎黃貝魷堅開類質麩蔴豬醃漬薑蔥膠澱劑剤維鈉鈣鐵鉄鋅鉛氫鹼麴麹穀種燒雜蘿蔔筍"
+    "餅燻濃縮紅綠緑鰹鯖鮭鱈鰻鮪龍蠣殼產産製廠線處設備樹實実葉亞亜滷鹵煉脫醱發発條湯調與蘇蟲糰藥檸蘋鳳"
+    "鬆鴨鵝腸烏賊乾鮮鯛飯飲餡餃饅頭燉臘蜆蓮蘆薈凍捲點釀醸節増",
+    "酱酱盐盐鱼虾鸡鸡鸡蚝面面麦荞黄贝鱿坚开类质麸麻猪腌渍姜葱胶淀剂剂维钠钙铁铁锌铅氢碱曲曲谷种烧杂萝卜笋"
+    "饼熏浓缩红绿绿鲣鲭鲑鳕鳗鲔龙蛎壳产产制厂线处设备树实实叶亚亚卤卤炼脱发发发条汤调与苏虫团药柠苹凤"
+    "松鸭鹅肠乌贼干鲜鲷饭饮馅饺馒头炖腊蚬莲芦荟冻卷点酿酿节增",
+))
+# 逐字查表的 str.translate 比正则慢几倍，而大多数文本里根本没有要折叠的字
+CJK_RE = re.compile("[" + "".join(CJK_VARIANTS) + "]")
+
+# E 编号 / INS 编号：e 220、e-220、ins 220、e322(i) -> e220 / e322；e150d 保留字母后缀
+# （不区分大小写，检索词未经归一化时也能用，见 join_e_numbers）
+E_NUMBER_RE = re.compile(
+    r'(?<![a-z0-9])(?:e|ins)\s?[-‐–.]?\s?(\d{3,4})([a-z]?)(?![a-z0-9])(?:\s?\((?:i{1,3}|iv|vi{0,3}|ix|x)\))?',
+    re.IGNORECASE)
+# 没有连续三个数字的文本不可能有 E 编号，跳过上面较慢的正则
+DIGITS_RE = re.compile(r'\d{3}')
+
+# 配料项之间的分隔符；句点后面跟数字时是小数点（2.5%），不切
+SEPARATOR_RE = re.compile(r'[,;:()\[\]{}<>/|*、，；：。（）【】「」『』〔〕・]|\.(?!\d)')
+
+# 每批写入的行数
+BATCH_SIZE = 5000
+
+INSERT_SQL = "INSERT INTO ingredient_tokens (product_id, version, normalized, tokens) VALUES (?, ?, ?, ?)"
+# 新行的 rowid 总是大于插入前的最大 rowid
+INDEX_SQL = '''
+    INSERT INTO ingredient_tokens_fts (rowid, normalized)
+    SELECT rowid, normalized FROM ingredient_tokens WHERE rowid > ?
+'''
+MISSING_SQL = '''
+    SELECT p.id, p.ingredients FROM products p
+    WHERE NOT EXISTS (SELECT 1 FROM ingredient_tokens t WHERE t.product_id = p.id)
+'''
+
+# ingredient_tokens 与 products 连接后读取配料的 SQL 片段（没有同步过的产品取 NULL）
+TOKENS_JOIN = "LEFT JOIN ingredient_tokens t ON t.product_id = p.id"
+
+
+def fold_cjk(match):
+    return CJK_VARIANTS[match.group()]
+
+
+def normalize_text(text):
+    """归一化后的配料文本；同一函数也用于过敏原关键词和检索词，结果可以直接比较。"""
+    if not text:
+        return ""
+    if text.isascii():
+        # 纯 ASCII 时 NFKC 不改变文本、casefold 等于 lower，也没有要折叠的汉字
+        text = text.lower()
+    else:
+        text = unicodedata.normalize("NFKC", text).casefold()
+        if CJK_RE.search(text):
+            text = CJK_RE.sub(fold_cjk, text)
+    if ('e' in text or 'ins' in text) and DIGITS_RE.search(text):
+        text = E_NUMBER_RE.sub(r'e\1\2', text)
+    return ' '.join(text.split())
+
+
+def join_e_numbers(text):
+    """只把 E 编号写成 e220（不做其他归一化），检索原始文本前切分检索词用。"""
+    return E_NUMBER_RE.sub(r'e\1\2', text or "")
+
+
+def tokenize(normalized):
+    """把归一化后的文本切成配料项（按原顺序，保留重复项）。"""
+    return [token for token in map(str.strip, SEPARATOR_RE.split(normalized)) if token]
+
+
+def split_tokens(tokens):
+    """ingredient_tokens.tokens 列 -> 配料项列表。"""
+    return tokens.split("\n") if tokens else []
+
+
+def delete_stale_tokens(conn):
+    """删掉归一化版本过期的行，之后这些产品与缺行的产品一样重新计算。"""
+    conn.execute("DELETE FROM ingredient_tokens WHERE version != ?", (NORMALIZER_VERSION,))
+
+
+def token_row(p_id, normalized, tokens):
+    return (p_id, NORMALIZER_VERSION, normalized, "\n".join(tokens))
+
+
+def write_ingredient_tokens(conn, rows):
+    """写入 token_row() 生成的行并加入全文索引（不提交）。"""
+    last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM ingredient_tokens").fetchone()[0]
+    conn.executemany(INSERT_SQL, rows)
+    # 整批写入全文索引（见 migration 0007）
+    conn.execute(INDEX_SQL, (last_rowid,))
+
+
+def sync_ingredient_tokens(conn):
+    """为缺行（新增、配料变化）和归一化版本过期的产品计算归一化结果，返回处理的产品数。"""
+    with conn:
+        delete_stale_tokens(conn)
+
+    cursor = conn.cursor()
+    cursor.execute(MISSING_SQL)
+    count = 0
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        batch = []
+        for p_id, ingredients in rows:
+            normalized = normalize_text(ingredients)
+            batch.append(token_row(p_id, normalized, tokenize(normalized)))
+        with conn:
+            write_ingredient_tokens(conn, batch)
+        count += len(batch)
+    return count
+
+
+@instrumentation.instrumented("normalize")
+def normalize_ingredients(full=False):
+    if not os.path.exists(DB_PATH):
+        print(f"Error: {DB_PATH} not found.")
+        return
+
+    conn = instrumentation.connect(DB_PATH)
+    ensure_schema(conn)
+    if full:
+        with conn:
+            conn.execute("DELETE FROM ingredient_tokens")
+
+    count = sync_ingredient_tokens(conn)
+    instrumentation.current().add("rows_written", count)
+    total = conn.execute("SELECT COUNT(*) FROM ingredient_tokens").fetchone()[0]
+    conn.close()
+    print(f"配料归一化完成：本次处理 {count} 个产品，共 {total} 个。")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="归一化并切分产品配料（ingredient_tokens 表）")
+    parser.add_argument('--full', action='store_true', help="忽略已有结果，全部重新归一化")
+    args = parser.parse_args()
+    normalize_ingredients(full=args.full)
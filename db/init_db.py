@@ -1,18 +1,61 @@
 import sqlite3
 import os
+import re
+
+import instrumentation
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
 SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
 
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+
+def list_migrations():
+    """返回 [(版本号, 文件路径), ...]，文件名形如 0001_描述.sql。"""
+    migrations = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.match(r'^(\d+)_.*\.sql$', name)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, name)))
+    return migrations
+
+
+def run_migrations(conn, verbose=True):
+    # 当前版本记录在 PRAGMA user_version 中，只执行比它新的迁移
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for version, path in list_migrations():
+        if version <= current:
+            continue
+        with open(path, 'r') as f:
+            sql = f.read()
+        # 每个迁移在单独的事务中执行，失败时整体回滚，版本号不前进
+        try:
+            conn.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"已应用迁移 {os.path.basename(path)}")
+    return applied
+
+
+def ensure_schema(conn, verbose=False):
+    """建表（幂等）并执行所有未应用的迁移。"""
     with open(SCHEMA_PATH, 'r') as f:
         conn.executescript(f.read())
-    conn.commit()
+    return run_migrations(conn, verbose=verbose)
+
+
+@instrumentation.instrumented("init_db")
+def init_db():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = instrumentation.connect(DB_PATH)
+    ensure_schema(conn, verbose=True)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
     conn.close()
-    print(f"Database initialized at {DB_PATH}")
+    print(f"Database initialized at {DB_PATH} (schema version {version})")
 
 if __name__ == "__main__":
     init_db()
-
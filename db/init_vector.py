@@ -1,19 +1,51 @@
-import sqlite3
+import argparse
 import chromadb
 from chromadb.utils import embedding_functions
+import hashlib
 import os
 
+import instrumentation
+from embedding_cache import DEFAULT_MAX_BYTES, EmbeddingCache
+from embedding_engine import MODEL_NAME, EmbeddingEngine, chroma_max_batch_size, embed_and_upsert
+
 DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
 CHROMA_PATH = os.path.join(os.path.dirname(__file__), '../data/chroma_db')
 
+# Process in batches to avoid ChromaDB limits (see chroma_max_batch_size)
+BATCH_SIZE = 1000
+
+
+def build_document(name, brand, ingredients, allergens):
+    return f"Name: {name or ''}. Brand: {brand or ''}. Ingredients: {ingredients or ''}. Allergens: {allergens or ''}."
+
+
+def document_hash(doc_text):
+    return hashlib.sha1(doc_text.encode("utf-8")).hexdigest()
+
+
+def load_indexed_hashes(collection, page_size=5000):
+    """读取向量库中已有的 {id: doc_hash}（分页读取，只取元数据，不取向量）。"""
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            break
+        for p_id, meta in zip(ids, page["metadatas"]):
+            hashes[p_id] = (meta or {}).get("doc_hash")
+        offset += len(ids)
+    return hashes
+
 
-def init_vector_db():
+@instrumentation.instrumented("vector")
+def init_vector_db(batch_size=BATCH_SIZE, workers=None, use_cache=True, cache_max_bytes=DEFAULT_MAX_BYTES):
     # Initialize ChromaDB
     client = chromadb.PersistentClient(path=CHROMA_PATH)
 
-    # Use a default embedding function (e.g., SentenceTransformer)
+    # 写入时由 EmbeddingEngine 计算向量；集合上仍挂同一模型的 embedding_function 供查询使用
     sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2")
+        model_name=MODEL_NAME)
 
     collection = client.get_or_create_collection(
         name="food_products",
@@ -21,51 +53,71 @@ def init_vector_db():
     )
 
     # Connect to SQLite to get data
-    conn = sqlite3.connect(DB_PATH)
+    conn = instrumentation.connect(DB_PATH)
     cursor = conn.cursor()
+    # 文档用原始配料文本：归一化会把日文写法折叠成简体（鶏卵 → 鸡卵），模型对这种文本的理解反而变差；
+    # 写法差异由全文检索中的 ingredient_tokens_fts 负责
     cursor.execute(
         "SELECT id, name, brand, ingredients, allergens FROM products")
     rows = cursor.fetchall()
+    conn.close()
+
+    # 向量库中每条记录都带有其文档文本的哈希，文本没变的产品无需重新计算向量
+    indexed = load_indexed_hashes(collection)
 
     all_documents = []
     all_metadatas = []
     all_ids = []
+    skipped = 0
 
     for row in rows:
         p_id, name, brand, ingredients, allergens = row
-        doc_text = f"Name: {name or ''}. Brand: {brand or ''}. Ingredients: {ingredients or ''}. Allergens: {allergens or ''}."
+        doc_text = build_document(name, brand, ingredients, allergens)
+        doc_hash = document_hash(doc_text)
+
+        if indexed.pop(p_id, None) == doc_hash:
+            skipped += 1
+            continue
 
         all_documents.append(doc_text)
         all_metadatas.append({
             "id": p_id,
             "name": name or "",
             "brand": brand or "",
-            "allergens": allergens or ""
+            "allergens": allergens or "",
+            "doc_hash": doc_hash
         })
         all_ids.append(p_id)
 
-    # Process in batches to avoid ChromaDB limits (max ~5461)
-    batch_size = 1000
+    # 剩下的是 SQLite 中已不存在的产品
+    removed_ids = list(indexed)
+    for i in range(0, len(removed_ids), BATCH_SIZE):
+        collection.delete(ids=removed_ids[i:i + BATCH_SIZE])
+
     total = len(all_documents)
 
     if total > 0:
-        print(f"开始同步 {total} 条数据到向量库...")
-        for i in range(0, total, batch_size):
-            batch_docs = all_documents[i:i + batch_size]
-            batch_metas = all_metadatas[i:i + batch_size]
-            batch_ids = all_ids[i:i + batch_size]
+        max_batch = chroma_max_batch_size(client)
+        if batch_size > max_batch:
+            print(f"批大小 {batch_size} 超过 Chroma 上限，改为 {max_batch}")
+            batch_size = max_batch
+        print(f"开始同步 {total} 条新增/变化的数据到向量库...")
+        cache = EmbeddingCache(MODEL_NAME, max_bytes=cache_max_bytes) if use_cache else None
+        with EmbeddingEngine(workers=workers, cache=cache) as engine:
+            embed_and_upsert(collection, engine, all_ids, all_documents, all_metadatas, batch_size)
 
-            collection.upsert(
-                documents=batch_docs,
-                metadatas=batch_metas,
-                ids=batch_ids
-            )
-            print(f"   进度: {min(i + batch_size, total)} / {total}")
-
-        print(f"成功将 {total} 条产品索引到向量数据库。")
-
-    conn.close()
+    print(f"向量库同步完成：跳过 {skipped} 条（未变化），"
+          f"重新计算向量 {total} 条，删除 {len(removed_ids)} 条。")
 
 
 if __name__ == "__main__":
-    init_vector_db()
+    parser = argparse.ArgumentParser(description="把 SQLite 中的产品同步到向量库")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="每批编码/写入的文档数（不超过 Chroma 的单次写入上限）")
+    parser.add_argument('--workers', type=int, help="编码进程数（默认 CPU 核数的一半，1 为单进程）")
+    parser.add_argument('--no-cache', action='store_true', help="不使用向量缓存，全部重新编码")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="向量缓存的大小上限 (MB)，超出后按最近使用时间淘汰")
+    args = parser.parse_args()
+    init_vector_db(batch_size=args.batch_size, workers=args.workers, use_cache=not args.no_cache,
+                   cache_max_bytes=args.cache_max_mb * 1024 * 1024)
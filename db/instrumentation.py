@@ -0,0 +1,373 @@
+"""
+轻量的阶段埋点：耗时、读写行数、HTTP 请求 / 重试、SQLite 语句耗时、峰值内存
+
+默认关闭。关闭时 stage() 直接执行被包装的代码，current() 返回空对象，connect() 返回普通连接，
+各阶段里的计数调用只多一次函数调用。
+
+环境变量:
+    FOOD_METRICS=1            开启，输出到 data/metrics/
+    FOOD_METRICS_DIR=路径     开启并指定输出目录
+    FOOD_PROFILE=阶段名       对该阶段做 cProfile（只采样进入阶段的线程），写出 profile-<阶段>-<时间>.prof
+
+输出（每个阶段结束时写入）:
+    metrics.jsonl             追加一行 JSON
+    food_pipeline.prom        Prometheus textfile collector 格式，保留每个阶段最近一次的结果
+
+阶段名与 run_pipeline.py 中一致（enrich、export、fetch_off ……）。嵌套的阶段（流水线包着脚本入口）
+计入最外层，不重复记录。
+
+用法:
+    FOOD_METRICS=1 python run_pipeline.py
+    FOOD_METRICS=1 FOOD_PROFILE=enrich python db/enrich_allergens.py
+    python -m pstats data/metrics/profile-enrich-*.prof
+"""
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import re
+import resource
+import sqlite3
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+METRICS_DIR = os.environ.get("FOOD_METRICS_DIR") or (
+    os.path.join(BASE_DIR, 'data/metrics') if os.environ.get("FOOD_METRICS", "0") not in ("", "0") else None)
+ENABLED = METRICS_DIR is not None
+PROFILE_STAGE = os.environ.get("FOOD_PROFILE") or None
+
+JSONL_NAME = "metrics.jsonl"
+PROM_NAME = "food_pipeline.prom"
+PROM_PREFIX = "food_pipeline_stage"
+
+COUNTERS = ("rows_read", "rows_written", "http_requests", "http_retries", "http_errors", "http_cache_hits",
+            "sqlite_statements", "sqlite_seconds")
+
+# 峰值内存的采样间隔（秒）；同一进程内并行的阶段共享进程 RSS，各自记录自己运行期间的峰值
+RSS_SAMPLE_INTERVAL = 0.05
+
+# 逐行迭代游标时，每隔多少行把行数和耗时计入阶段
+ITER_FLUSH_ROWS = 1024
+
+PROM_LINE_RE = re.compile(r'^(\w+)\{stage="([^"]*)"\} (\S+)$')
+
+
+class NullStage:
+    """关闭埋点时的占位对象：所有计数都是空操作。"""
+    name = None
+
+    def add(self, key, n=1):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.peak_rss = current_rss()
+        self.lock = threading.Lock()
+
+    def add(self, key, n=1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+
+_current = contextvars.ContextVar("food_pipeline_stage", default=None)
+_active = []
+_lock = threading.Lock()
+_sampler = None
+
+
+def current_rss():
+    """当前进程的常驻内存（字节）；没有 /proc 时退回到 ru_maxrss。"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Linux 上单位是 KB，macOS 上是字节
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+
+def sample_rss():
+    global _sampler
+    while True:
+        rss = current_rss()
+        with _lock:
+            if not _active:
+                _sampler = None
+                return
+            for s in _active:
+                if rss > s.peak_rss:
+                    s.peak_rss = rss
+        time.sleep(RSS_SAMPLE_INTERVAL)
+
+
+def current():
+    """
+    当前线程所在的阶段。阶段内新建的普通线程（如向量写入线程）不继承 contextvars，
+    这时归到最近开始的活动阶段。
+    """
+    if not ENABLED:
+        return NULL_STAGE
+    s = _current.get()
+    if s is None:
+        with _lock:
+            s = _active[-1] if _active else None
+    return s or NULL_STAGE
+
+
+@contextlib.contextmanager
+def stage(name):
+    if not ENABLED and PROFILE_STAGE != name:
+        yield NULL_STAGE
+        return
+    outer = _current.get()
+    if outer is not None:
+        yield outer
+        return
+
+    global _sampler
+    s = Stage(name)
+    token = _current.set(s)
+    with _lock:
+        _active.append(s)
+        if _sampler is None:
+            _sampler = threading.Thread(target=sample_rss, name="rss-sampler", daemon=True)
+            _sampler.start()
+
+    profiler = cProfile.Profile() if PROFILE_STAGE == name else None
+    if profiler is not None:
+        profiler.enable()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield s
+    except BaseException:
+        status = "failed"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+            dump_profile(profiler, name)
+        _current.reset(token)
+        with _lock:
+            _active.remove(s)
+        s.peak_rss = max(s.peak_rss, current_rss())
+        if ENABLED:
+            record(s, status, elapsed)
+
+
+def instrumented(name):
+    """脚本入口的装饰器：单独运行脚本时也作为一个阶段记录。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED and PROFILE_STAGE != name:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- HTTP ---
+
+def record_http(response):
+    """记录一次 HTTP 调用；urllib3 在底层做的重试从 response.raw.retries 中取出。"""
+    if not ENABLED:
+        return
+    s = current()
+    if getattr(response, 'from_cache', False):
+        # scripts/http_cache.py 直接从磁盘返回的响应
+        s.add("http_cache_hits")
+        return
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    retried = len(retries.history) if retries is not None else 0
+    s.add("http_requests", 1 + retried)
+    if retried:
+        s.add("http_retries", retried)
+    if response.status_code >= 400:
+        s.add("http_errors")
+
+
+def instrument_session(session):
+    """给 requests.Session 挂上响应钩子，经它发出的请求都会被计数。"""
+    if ENABLED:
+        session.hooks['response'].append(lambda response, *args, **kwargs: record_http(response))
+    return session
+
+
+# --- SQLite ---
+
+def add_sql_time(seconds, statements=0, rows=0):
+    s = current()
+    s.add("sqlite_seconds", seconds)
+    if statements:
+        s.add("sqlite_statements", statements)
+    if rows:
+        s.add("rows_read", rows)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """统计语句执行和取数耗时；取出的行数计入 rows_read。"""
+
+    def execute(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            add_sql_time(time.perf_counter() - t0, statements=1)
+
+    def executemany(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            add_sql_time(time.perf_counter() - t0, statements=1)
+
+    def executescript(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(*args)
+        finally:
+            add_sql_time(time.perf_counter() - t0, statements=1)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        add_sql_time(time.perf_counter() - t0, rows=row is not None)
+        return row
+
+    def fetchmany(self, *args):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(*args)
+        add_sql_time(time.perf_counter() - t0, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        add_sql_time(time.perf_counter() - t0, rows=len(rows))
+        return rows
+
+    # 逐行迭代时先在游标上累计，每 ITER_FLUSH_ROWS 行或迭代结束时再计入阶段，避免每行都加锁
+    _iter_rows = 0
+    _iter_seconds = 0.0
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._iter_seconds += time.perf_counter() - t0
+            self.flush_iteration()
+            raise
+        self._iter_seconds += time.perf_counter() - t0
+        self._iter_rows += 1
+        if self._iter_rows >= ITER_FLUSH_ROWS:
+            self.flush_iteration()
+        return row
+
+    def flush_iteration(self):
+        if self._iter_rows or self._iter_seconds:
+            add_sql_time(self._iter_seconds, rows=self._iter_rows)
+            self._iter_rows = 0
+            self._iter_seconds = 0.0
+
+    def close(self):
+        self.flush_iteration()
+        super().close()
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() 等快捷方法在 C 层直接创建普通游标，这里改为经过 TimedCursor
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+
+
+def connect(database, **kwargs):
+    """与 sqlite3.connect 相同；开启埋点时返回统计语句耗时的连接。"""
+    if ENABLED:
+        kwargs.setdefault('factory', TimedConnection)
+    return sqlite3.connect(database, **kwargs)
+
+
+# --- 输出 ---
+
+def dump_profile(profiler, name):
+    directory = METRICS_DIR or os.path.join(BASE_DIR, 'data/metrics')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"profile-{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+    profiler.dump_stats(path)
+    print(f"cProfile 已写入 {path}")
+
+
+def record(s, status, elapsed):
+    with s.lock:
+        counters = dict(s.counters)
+    counters["sqlite_seconds"] = round(counters["sqlite_seconds"], 4)
+    entry = {
+        "ts": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "stage": s.name,
+        "status": status,
+        "pid": os.getpid(),
+        "wall_seconds": round(elapsed, 4),
+        "peak_rss_bytes": s.peak_rss,
+        **counters,
+    }
+    with _lock:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(os.path.join(METRICS_DIR, JSONL_NAME), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        write_prometheus(entry)
+
+
+def write_prometheus(entry):
+    """合并已有文件中其他阶段的样本后整体重写（先写临时文件再替换，采集方不会读到一半）。"""
+    path = os.path.join(METRICS_DIR, PROM_NAME)
+    samples = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                match = PROM_LINE_RE.match(line.strip())
+                if match:
+                    samples[(match.group(1), match.group(2))] = match.group(3)
+
+    values = {
+        "wall_seconds": entry["wall_seconds"],
+        "peak_rss_bytes": entry["peak_rss_bytes"],
+        "success": 1 if entry["status"] == "ok" else 0,
+        "last_run_timestamp_seconds": round(time.time(), 3),
+    }
+    values.update((key, entry[key]) for key in COUNTERS)
+    for key, value in values.items():
+        samples[(f"{PROM_PREFIX}_{key}", entry["stage"])] = value
+
+    lines = []
+    for metric in sorted({metric for metric, _ in samples}):
+        lines.append(f"# TYPE {metric} gauge")
+        for (name, stage_name), value in sorted(samples.items()):
+            if name == metric:
+                lines.append(f'{metric}{{stage="{stage_name}"}} {value}')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
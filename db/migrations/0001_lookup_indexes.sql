@@ -0,0 +1,25 @@
+-- 热点查询列的索引与唯一约束
+-- 旧数据库里可能已有同一产品、同一过敏原的多条映射：先按 "Safety-First" 规则去重
+-- (contains > may_contain > 其他)，再建唯一索引，保证迁移不会失败也不丢失确认的过敏原。
+
+DELETE FROM allergen_mappings
+WHERE id NOT IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY product_id, allergen_name
+            ORDER BY CASE status WHEN 'contains' THEN 0 WHEN 'may_contain' THEN 1 ELSE 2 END, id
+        ) AS rn
+        FROM allergen_mappings
+    )
+    WHERE rn = 1
+);
+
+-- (product_id, allergen_name) 唯一；同时作为 product_id 的前缀索引
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mappings_product_allergen
+    ON allergen_mappings (product_id, allergen_name);
+CREATE INDEX IF NOT EXISTS idx_mappings_allergen_status
+    ON allergen_mappings (allergen_name, status);
+
+CREATE INDEX IF NOT EXISTS idx_products_barcode ON products (barcode);
+CREATE INDEX IF NOT EXISTS idx_products_source ON products (source);
+CREATE INDEX IF NOT EXISTS idx_products_countries ON products (countries);
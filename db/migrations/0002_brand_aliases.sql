@@ -0,0 +1,7 @@
+-- 可维护的品牌别名表，advanced_cleaning 在内置别名之后加载
+-- priority 越小越优先；同一优先级按插入顺序
+CREATE TABLE IF NOT EXISTS brand_aliases (
+    alias TEXT PRIMARY KEY,
+    canonical TEXT NOT NULL,
+    priority INTEGER DEFAULT 100
+);
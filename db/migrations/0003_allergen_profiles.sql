@@ -0,0 +1,14 @@
+-- 每个产品的过敏原位图，由 enrich_allergens 维护
+-- allergen_bits 固定每个标签的位号，一经分配不再改变（标签删除后位号也不复用）
+CREATE TABLE IF NOT EXISTS allergen_bits (
+    tag TEXT PRIMARY KEY,
+    bit INTEGER NOT NULL UNIQUE
+);
+
+-- known = 0 表示产品没有任何配料/过敏原信息，掩码为 0 并不代表安全
+CREATE TABLE IF NOT EXISTS allergen_profiles (
+    product_id TEXT PRIMARY KEY,
+    contains_mask INTEGER NOT NULL DEFAULT 0,
+    may_contain_mask INTEGER NOT NULL DEFAULT 0,
+    known INTEGER NOT NULL DEFAULT 0
+);
@@ -0,0 +1,37 @@
+-- products 的全文索引（外部内容表，不重复存储文本）
+-- trigram 分词不依赖空格，中日文配料中的词也能按子串命中（检索词至少 3 个字符，
+-- 更短的词由 db/search.py 退化为 LIKE 查询）
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, brand, ingredients, categories,
+    content = 'products',
+    content_rowid = 'rowid',
+    tokenize = 'trigram'
+);
+
+-- INSERT OR REPLACE 删除旧行时不会触发 DELETE 触发器（除非打开 recursive_triggers），
+-- 所以在插入前先把同 id 旧行的索引删掉
+CREATE TRIGGER IF NOT EXISTS products_fts_before_insert BEFORE INSERT ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name, brand, ingredients, categories)
+    SELECT 'delete', rowid, name, brand, ingredients, categories FROM products WHERE id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_after_insert AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, name, brand, ingredients, categories)
+    VALUES (new.rowid, new.name, new.brand, new.ingredients, new.categories);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_after_delete AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name, brand, ingredients, categories)
+    VALUES ('delete', old.rowid, old.name, old.brand, old.ingredients, old.categories);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_after_update
+AFTER UPDATE OF name, brand, ingredients, categories ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name, brand, ingredients, categories)
+    VALUES ('delete', old.rowid, old.name, old.brand, old.ingredients, old.categories);
+    INSERT INTO products_fts (rowid, name, brand, ingredients, categories)
+    VALUES (new.rowid, new.name, new.brand, new.ingredients, new.categories);
+END;
+
+-- 已有数据建立索引
+INSERT INTO products_fts (products_fts) VALUES ('rebuild');
@@ -0,0 +1,13 @@
+-- 采集游标的断点，由 scripts/fetch_state.py 维护
+-- 每个来源 + 游标（OFF 的 category:标签 / origin:产地，USDA 的 query:查询词）一行；
+-- last_page 是最后一个已落库的页码，finished_at 非空表示该游标已经抓完
+CREATE TABLE IF NOT EXISTS fetch_state (
+    source TEXT NOT NULL,
+    cursor TEXT NOT NULL,
+    last_page INTEGER NOT NULL DEFAULT 0,
+    items INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMP,
+    updated_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    PRIMARY KEY (source, cursor)
+);
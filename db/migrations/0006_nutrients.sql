@@ -0,0 +1,21 @@
+-- 营养成分（官方成分表：CNF，以及之后的日本成分表），每 100 g 可食部分的含量
+-- nutrients.id 与产品 id 一样带来源前缀（如 CNF_203），不同成分表的营养素编号互不冲突
+CREATE TABLE IF NOT EXISTS nutrients (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    code TEXT,
+    symbol TEXT,
+    unit TEXT,
+    name TEXT,
+    name_fr TEXT
+);
+
+CREATE TABLE IF NOT EXISTS product_nutrients (
+    product_id TEXT NOT NULL,
+    nutrient_id TEXT NOT NULL,
+    amount REAL,
+    PRIMARY KEY (product_id, nutrient_id)
+) WITHOUT ROWID;
+
+-- "某营养素含量最高 / 低于某值的食品" 一类查询
+CREATE INDEX IF NOT EXISTS idx_product_nutrients_nutrient ON product_nutrients(nutrient_id, amount);
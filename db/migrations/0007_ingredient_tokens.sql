@@ -0,0 +1,41 @@
+-- 归一化后的配料（NFKC、大小写折叠、繁简/日文新字体折叠、E 编号统一），由 db/ingredient_tokens.py 维护
+-- normalized 为归一化后的整段配料，tokens 为按分隔符切出的配料项（按原顺序，以换行分隔）；
+-- enrich_allergens、search、init_vector 都读取这里的结果，不再各自处理原始配料文本
+CREATE TABLE IF NOT EXISTS ingredient_tokens (
+    product_id TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    normalized TEXT NOT NULL DEFAULT '',
+    tokens TEXT NOT NULL DEFAULT ''
+);
+
+-- 产品的配料变化或产品被删除时，删掉对应的行；下次同步只需要处理缺行的产品，不必比对全表
+-- INSERT OR REPLACE 删除旧行时不会触发 DELETE 触发器，所以在插入前检查同 id 旧行的配料是否变化
+CREATE TRIGGER IF NOT EXISTS ingredient_tokens_before_product_insert BEFORE INSERT ON products BEGIN
+    DELETE FROM ingredient_tokens
+    WHERE product_id = new.id
+      AND NOT EXISTS (SELECT 1 FROM products WHERE id = new.id AND ingredients IS new.ingredients);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ingredient_tokens_after_product_update
+AFTER UPDATE OF ingredients ON products WHEN old.ingredients IS NOT new.ingredients BEGIN
+    DELETE FROM ingredient_tokens WHERE product_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ingredient_tokens_after_product_delete AFTER DELETE ON products BEGIN
+    DELETE FROM ingredient_tokens WHERE product_id = old.id;
+END;
+
+-- 归一化配料的全文索引（外部内容表），search.py 用它按折叠后的形式检索配料
+-- ingredient_tokens 只插入和删除、不更新。新行由 ingredient_tokens.py 每批一条 INSERT ... SELECT 写入索引：
+-- 逐行的 AFTER INSERT 触发器每行都会把 FTS5 的缓冲刷成一个新段，写入慢约 8 倍
+CREATE VIRTUAL TABLE IF NOT EXISTS ingredient_tokens_fts USING fts5(
+    normalized,
+    content = 'ingredient_tokens',
+    content_rowid = 'rowid',
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS ingredient_tokens_fts_after_delete AFTER DELETE ON ingredient_tokens BEGIN
+    INSERT INTO ingredient_tokens_fts (ingredient_tokens_fts, rowid, normalized)
+    VALUES ('delete', old.rowid, old.normalized);
+END;
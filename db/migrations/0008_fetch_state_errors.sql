@@ -0,0 +1,4 @@
+-- 游标放弃时记录失败的页码和原因（由 scripts/fetch_state.py 维护）：
+-- 这一页没有落库，下次运行仍从 last_page + 1 继续；该页成功落库或游标抓完后清空
+ALTER TABLE fetch_state ADD COLUMN failed_page INTEGER;
+ALTER TABLE fetch_state ADD COLUMN last_error TEXT;
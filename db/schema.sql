@@ -21,3 +21,16 @@ CREATE TABLE IF NOT EXISTS allergen_mappings (
     FOREIGN KEY (product_id) REFERENCES products(id)
 );
 
+
+-- 增量过敏原标注状态：每个产品的内容指纹及所用词典版本
+CREATE TABLE IF NOT EXISTS enrichment_state (
+    product_id TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    dict_version TEXT
+);
+
+-- 上次运行时每个过敏原标签的关键词哈希，用于定位词典改动影响的标签
+CREATE TABLE IF NOT EXISTS enrichment_dict_state (
+    tag TEXT PRIMARY KEY,
+    keywords_hash TEXT
+);
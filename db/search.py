@@ -0,0 +1,234 @@
+"""
+产品检索：FTS5 全文检索 + 向量检索，倒数排名融合 (RRF)
+
+先跑便宜的全文检索（精确的产品名、品牌别名、中日文配料词），
+再与 Chroma 的语义检索结果融合；--lexical-only 时完全不加载模型。
+配料另外在归一化后的文本上检索（ingredient_tokens_fts，见 db/ingredient_tokens.py），
+醬油 / 酱油、全角字母、E 220 / E220 这样的不同写法可以互相命中。
+
+用法:
+    python db/search.py "peanut butter"
+    python db/search.py "花生 酱油" --lexical-only
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from advanced_cleaning import ALIAS_FILE, BRAND_ALIASES
+from brand_normalizer import build_normalizer
+from ingredient_tokens import join_e_numbers, normalize_text
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
+CHROMA_PATH = os.path.join(os.path.dirname(__file__), '../data/chroma_db')
+COLLECTION_NAME = "food_products"
+
+# bm25 列权重: name, brand, ingredients, categories
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+FTS_COLUMNS = ("name", "brand", "ingredients", "categories")
+# trigram 分词器能索引的最短检索词
+MIN_TRIGRAM_CHARS = 3
+# RRF 常数，越大排名靠后的结果权重下降越慢
+RRF_K = 60
+# 每一路检索取回的候选数（相对最终条数的倍数）
+CANDIDATE_FACTOR = 3
+
+
+def fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def query_terms(query, normalizer=None):
+    """
+    切分检索词，每个词返回 [原词, 标准品牌名?]。
+    brand 列已由 advanced_cleaning 归一化，所以 "日清" 这样的别名还要按标准名 "Nissin" 检索。
+    切分前先把 "E 220" 合成 e220，不会拆成 "e" 和 "220" 两个短词。
+    """
+    terms = []
+    for term in join_e_numbers(query).split():
+        alternatives = [term]
+        canonical = normalizer.normalize(term, None) if normalizer is not None else None
+        if canonical and canonical.lower() != term.lower():
+            alternatives.append(canonical)
+        terms.append(alternatives)
+    return terms
+
+
+def lexical_search(conn, query, limit=20, normalizer=None):
+    """返回按相关度排序的 [product_id, ...]；每个检索词（或其品牌别名）都必须命中（任意列）。"""
+    match_groups = []
+    short_terms = []
+    for alternatives in query_terms(query, normalizer):
+        long_alternatives = [a for a in alternatives if len(a) >= MIN_TRIGRAM_CHARS]
+        if long_alternatives:
+            match_groups.append("(" + " OR ".join(fts_phrase(a) for a in long_alternatives) + ")")
+        else:
+            short_terms.append(alternatives[0])
+    if not match_groups and not short_terms:
+        return []
+
+    conditions = []
+    params = []
+    if match_groups:
+        conditions.append("products_fts MATCH ?")
+        params.append(" AND ".join(match_groups))
+    for term in short_terms:
+        # 两个字的中文词（如 花生）无法用 trigram 索引，退化为对 products 的 LIKE
+        # （不能对 products_fts 的列做 LIKE：trigram 会把短模式当作无结果）；
+        # 与其他长检索词一起出现时只在 MATCH 的结果上过滤，单独出现时是一次全表扫描
+        conditions.append("(" + " OR ".join(f"p.{c} LIKE ?" for c in FTS_COLUMNS) + ")")
+        params.extend([f"%{term}%"] * len(FTS_COLUMNS))
+
+    if match_groups:
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        order = f"bm25(products_fts, {weights})"
+    else:
+        order = "(p.name LIKE ?) DESC, p.rowid"
+        params.append(f"%{short_terms[0]}%")
+
+    if match_groups:
+        source = "products_fts JOIN products p ON p.rowid = products_fts.rowid"
+    else:
+        source = "products p"
+    sql = f'''
+        SELECT p.id FROM {source}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {order}
+        LIMIT ?
+    '''
+    params.append(limit)
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+def ingredient_search(conn, query, limit=20):
+    """返回按相关度排序的 [product_id, ...]；每个检索词归一化后都必须出现在归一化的配料中。"""
+    # 整个检索词一起归一化再切分："E 220" 先合成 e220，不会拆成 "e" 和 "220" 两个短词
+    terms = normalize_text(query).split()
+    if not terms:
+        return []
+    long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM_CHARS]
+    short_terms = [t for t in terms if len(t) < MIN_TRIGRAM_CHARS]
+
+    conditions = []
+    params = []
+    if long_terms:
+        source = "ingredient_tokens_fts JOIN ingredient_tokens t ON t.rowid = ingredient_tokens_fts.rowid"
+        conditions.append("ingredient_tokens_fts MATCH ?")
+        params.append(" AND ".join(fts_phrase(t) for t in long_terms))
+        order = "bm25(ingredient_tokens_fts)"
+    else:
+        source = "ingredient_tokens t"
+        order = "t.rowid"
+    for term in short_terms:
+        # 两边都已归一化（含大小写折叠），用 instr 做精确的子串比较，比 LIKE 快
+        conditions.append("instr(t.normalized, ?) > 0")
+        params.append(term)
+
+    sql = f'''
+        SELECT t.product_id FROM {source}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {order}
+        LIMIT ?
+    '''
+    params.append(limit)
+    try:
+        return [row[0] for row in conn.execute(sql, params)]
+    except sqlite3.OperationalError:
+        # 旧数据库还没有 ingredient_tokens（migration 0007）
+        return []
+
+
+class VectorSearcher:
+    """延迟打开 Chroma 集合和编码模型；查询向量走共享的向量缓存。"""
+
+    def __init__(self, chroma_path=CHROMA_PATH, workers=1):
+        self.chroma_path = chroma_path
+        self.workers = workers
+        self.collection = None
+        self.engine = None
+
+    def available(self):
+        return os.path.exists(self.chroma_path)
+
+    def open(self):
+        if self.collection is not None:
+            return
+        import chromadb
+        from embedding_cache import EmbeddingCache
+        from embedding_engine import MODEL_NAME, EmbeddingEngine
+        client = chromadb.PersistentClient(path=self.chroma_path)
+        self.collection = client.get_collection(name=COLLECTION_NAME)
+        self.engine = EmbeddingEngine(workers=self.workers, cache=EmbeddingCache(MODEL_NAME, read_only=True))
+
+    def search(self, query, limit=20):
+        self.open()
+        results = self.collection.query(query_embeddings=self.engine.encode([query]), n_results=limit)
+        return results['ids'][0]
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """rankings: 多路检索的 [id, ...] 列表；返回按融合分数排序的 id 列表。"""
+    scores = {}
+    for ranking in rankings:
+        for rank, p_id in enumerate(ranking):
+            scores[p_id] = scores.get(p_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda p_id: -scores[p_id])
+
+
+def hybrid_search(conn, query, limit=10, lexical_only=False, vector_searcher=None, normalizer=None):
+    """返回 (product_id 列表, 各阶段耗时 dict)。"""
+    timings = {}
+    t0 = time.perf_counter()
+    lexical = lexical_search(conn, query, limit * CANDIDATE_FACTOR, normalizer)
+    ingredients = ingredient_search(conn, query, limit * CANDIDATE_FACTOR)
+    if ingredients:
+        lexical = reciprocal_rank_fusion([lexical, ingredients])
+    timings['lexical'] = time.perf_counter() - t0
+
+    if lexical_only or vector_searcher is None or not vector_searcher.available():
+        return lexical[:limit], timings
+
+    t0 = time.perf_counter()
+    # 向量库中的文档是原始配料文本（见 init_vector），查询也用原始写法编码
+    semantic = vector_searcher.search(query, limit * CANDIDATE_FACTOR)
+    timings['vector'] = time.perf_counter() - t0
+    return reciprocal_rank_fusion([lexical, semantic])[:limit], timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全文 + 语义混合检索产品")
+    parser.add_argument('query')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--lexical-only', action='store_true', help="只用全文检索（不加载模型，延迟最低）")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"Error: {DB_PATH} not found.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    normalizer = build_normalizer(BRAND_ALIASES, conn.cursor(), ALIAS_FILE)
+    searcher = None if args.lexical_only else VectorSearcher()
+    try:
+        ids, timings = hybrid_search(conn, args.query, args.limit, args.lexical_only, searcher, normalizer)
+        for rank, p_id in enumerate(ids, 1):
+            row = conn.execute("SELECT name, brand, source FROM products WHERE id = ?", (p_id,)).fetchone()
+            if row is None:
+                # 向量库尚未同步删除的产品
+                continue
+            name, brand, source = row
+            print(f"{rank:>2}. {name or ''} ({brand or ''}) [{source}] {p_id}")
+        print(" | ".join(f"{stage}: {seconds * 1000:.1f} ms" for stage, seconds in timings.items()))
+    finally:
+        if searcher is not None:
+            searcher.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
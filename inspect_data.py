@@ -1,8 +1,13 @@
 import sqlite3
 import os
+import sys
 import chromadb
 from chromadb.utils import embedding_functions
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db'))
+from embedding_cache import EmbeddingCache  # noqa: E402
+from embedding_engine import MODEL_NAME, EmbeddingEngine  # noqa: E402
+
 DB_PATH = 'data/food_data.db'
 CHROMA_PATH = 'data/chroma_db'
 
@@ -78,7 +83,7 @@ def inspect_vector_db():
     client = chromadb.PersistentClient(path=CHROMA_PATH)
     # 使用与 init_vector.py 相同的模型
     ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2")
+        model_name=MODEL_NAME)
     collection = client.get_collection(
         name="food_products", embedding_function=ef)
 
@@ -89,7 +94,10 @@ def inspect_vector_db():
         # 尝试做一个简单的语义搜索
         query = "Asian noodle with soy sauce"
         print(f"\n测试语义搜索: '{query}'")
-        results = collection.query(query_texts=[query], n_results=3)
+        # 查询向量只读地查共享缓存（vector 阶段可能同时在写），未命中的查询不写入缓存
+        with EmbeddingEngine(workers=1, cache=EmbeddingCache(MODEL_NAME, read_only=True)) as engine:
+            query_embeddings = engine.encode([query])
+        results = collection.query(query_embeddings=query_embeddings, n_results=3)
 
         for i in range(len(results['ids'][0])):
             print(
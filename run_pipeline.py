@@ -1,39 +1,294 @@
-import subprocess
+import argparse
 import os
+import sqlite3
 import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, 'data/food_data.db')
 
-def run_script(script_path):
-    print(f"--- Running {script_path} ---")
-    result = subprocess.run([sys.executable, script_path],
-                            capture_output=True, text=True)
-    if result.stdout:
-        print(result.stdout)
-    if result.stderr:
-        print(f"Errors in {script_path}:")
-        print(result.stderr)
-    return result.returncode == 0
+# 所有阶段都在同一个进程内运行：pandas / chromadb / 模型只导入、加载一次
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+sys.path.insert(0, os.path.join(BASE_DIR, 'db'))
 
+import instrumentation  # noqa: E402
 
-def main():
-    # 1. Init Database
-    if not run_script('db/init_db.py'):
-        print("Failed to initialize database.")
-        return
 
-    # 2. Fetch data from Open Food Facts
-    if not run_script('scripts/fetch_off.py'):
-        print("Failed to fetch data from Open Food Facts.")
+# --- 各阶段入口（延迟导入，只运行部分阶段时不必加载全部依赖） ---
+
+def stage_init_db():
+    from init_db import init_db
+    init_db()
+
+
+def stage_fetch_off():
+    from fetch_off import crawl, get_robust_session
+    crawl(get_robust_session())
+
+
+def stage_fetch_usda():
+    # Note: Requires API key in .env or DEMO_KEY will be used
+    from fetch_usda import fetch_usda_bulk
+    fetch_usda_bulk()
+
+
+def stage_fetch_canada():
+    from fetch_canada import fetch_cnf
+    fetch_cnf()
+
+
+def stage_fetch_japan():
+    from fetch_asian_official import process_japan_official
+    process_japan_official()
+
+
+def stage_advanced_cleaning():
+    from advanced_cleaning import advanced_cleaning
+    advanced_cleaning()
+
+
+def stage_clean_data():
+    from clean_data import clean_and_consolidate
+    clean_and_consolidate()
+
+
+def stage_enrich():
+    from enrich_allergens import enrich_allergens
+    enrich_allergens()
+
+
+def stage_vector():
+    from init_vector import init_vector_db
+    init_vector_db()
+
+
+def stage_graph():
+    from build_graph import build_graph
+    build_graph()
+
+
+def stage_export():
+    from export_csv import export_to_csv
+    export_to_csv()
+
+
+FETCH_STAGES = ["fetch_off", "fetch_usda", "fetch_canada", "fetch_japan"]
+
+# 阶段名: (依赖的阶段, 入口函数)，顺序即默认的展示顺序
+STAGES = {
+    "init_db": ([], stage_init_db),
+    "fetch_off": (["init_db"], stage_fetch_off),
+    "fetch_usda": (["init_db"], stage_fetch_usda),
+    "fetch_canada": (["init_db"], stage_fetch_canada),
+    "fetch_japan": (["init_db"], stage_fetch_japan),
+    "advanced_cleaning": (FETCH_STAGES, stage_advanced_cleaning),
+    "clean_data": (["advanced_cleaning"], stage_clean_data),
+    # enrich 自己归一化新增 / 变化的配料（冷启动时与打标签同一遍），不再单独设 normalize 阶段
+    "enrich": (["clean_data"], stage_enrich),
+    "vector": (["enrich"], stage_vector),
+    "graph": (["enrich"], stage_graph),
+    "export": (["enrich"], stage_export),
+}
+
 
-    # 3. Fetch data from USDA (Note: Requires API key in .env or DEMO_KEY will be used)
-    if not run_script('scripts/fetch_usda.py'):
-        print("Failed to fetch data from USDA.")
+class StageLogWriter:
+    """
+    替换 sys.stdout：各阶段的输出实时按行打印，并在并行阶段的每行前加上阶段名。
+    """
 
-    # 4. Init Vector Database
-    if not run_script('db/init_vector.py'):
-        print("Failed to initialize vector database.")
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def set_stage(self, name):
+        self.local.stage = name
+        self.local.buffer = ""
+
+    def write(self, text):
+        stage = getattr(self.local, "stage", None)
+        if stage is None:
+            with self.lock:
+                self.stream.write(text)
+                self.stream.flush()
+            return len(text)
+        self.local.buffer += text
+        if "\n" in self.local.buffer:
+            *lines, self.local.buffer = self.local.buffer.split("\n")
+            with self.lock:
+                for line in lines:
+                    self.stream.write(f"[{stage}] {line}\n")
+                self.stream.flush()
+        return len(text)
+
+    def flush(self):
+        stage = getattr(self.local, "stage", None)
+        if stage is not None and self.local.buffer:
+            with self.lock:
+                self.stream.write(f"[{stage}] {self.local.buffer}")
+                self.local.buffer = ""
+        self.stream.flush()
+
+
+def count_rows():
+    if not os.path.exists(DB_PATH):
+        return None
+    conn = sqlite3.connect(DB_PATH, timeout=60)
+    try:
+        counts = []
+        for table in ("products", "allergen_mappings"):
+            try:
+                counts.append(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+            except sqlite3.OperationalError:
+                counts.append(0)
+        return tuple(counts)
+    finally:
+        conn.close()
+
+
+def select_stages(only=None, start_from=None):
+    if only:
+        selected = [name.strip() for name in only.split(",") if name.strip()]
+        unknown = [name for name in selected if name not in STAGES]
+        if unknown:
+            raise SystemExit(f"未知阶段: {', '.join(unknown)} (可选: {', '.join(STAGES)})")
+        return [name for name in STAGES if name in selected]
+    if start_from:
+        if start_from not in STAGES:
+            raise SystemExit(f"未知阶段: {start_from} (可选: {', '.join(STAGES)})")
+        # 该阶段及其所有下游阶段
+        selected = {start_from}
+        changed = True
+        while changed:
+            changed = False
+            for name, (deps, _) in STAGES.items():
+                if name not in selected and selected.intersection(deps):
+                    selected.add(name)
+                    changed = True
+        return [name for name in STAGES if name in selected]
+    return list(STAGES)
+
+
+def effective_deps(name, selected):
+    """本次选中的上游阶段：未选中的依赖会被跨过，继续向上查找，保证先后顺序不变。"""
+    deps = set()
+    for dep in STAGES[name][0]:
+        if dep in selected:
+            deps.add(dep)
+        else:
+            deps |= effective_deps(dep, selected)
+    return deps
+
+
+def run_stage(log_writer, name, func):
+    log_writer.set_stage(name)
+    started = time.perf_counter()
+    print(f"--- Running {name} ---")
+    try:
+        # FOOD_METRICS=1 时记录耗时、行数、HTTP、SQLite 语句耗时和峰值内存（见 db/instrumentation.py）
+        with instrumentation.stage(name):
+            func()
+        ok = True
+    except Exception:
+        # KeyboardInterrupt / SystemExit 不算阶段失败，经 future.result() 传回主线程中止整个流水线
+        traceback.print_exc(file=sys.stdout)
+        ok = False
+    finally:
+        log_writer.flush()
+        log_writer.set_stage(None)
+    return ok, time.perf_counter() - started, count_rows()
+
+
+def run_pipeline(selected, jobs=4):
+    """
+    按依赖关系调度阶段：依赖全部完成（或不在本次选择范围内）的阶段立即提交，
+    互不依赖的阶段（例如四个采集脚本）并行执行。失败阶段的下游阶段会被跳过。
+    """
+    log_writer = StageLogWriter(sys.stdout)
+    sys.stdout = log_writer
+
+    results = {}
+    pending = list(selected)
+    running = {}
+    before = {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = effective_deps(name, selected)
+                    if any(results.get(d, {}).get("status") in ("failed", "skipped") for d in deps):
+                        results[name] = {"status": "skipped", "elapsed": 0.0, "rows": None}
+                        pending.remove(name)
+                    elif all(d in results for d in deps):
+                        before[name] = count_rows()
+                        running[pool.submit(run_stage, log_writer, name, STAGES[name][1])] = name
+                        pending.remove(name)
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    ok, elapsed, rows = future.result()
+                    results[name] = {"status": "ok" if ok else "failed", "elapsed": elapsed,
+                                     "rows": rows, "rows_before": before.get(name)}
+    finally:
+        sys.stdout = log_writer.stream
+
+    print_summary(selected, results)
+    return all(r["status"] == "ok" for r in results.values())
+
+
+def format_delta(after, before, index):
+    if after is None:
+        return "-"
+    delta = after[index] - (before[index] if before else 0)
+    return f"{after[index]} ({delta:+d})"
+
+
+def print_summary(selected, results):
+    print("\n--- Pipeline summary ---")
+    print(f"{'stage':<20}{'status':<10}{'wall time':>10}  {'products':>18}  {'allergen_mappings':>20}")
+    total = 0.0
+    for name in selected:
+        r = results[name]
+        total += r["elapsed"]
+        print(f"{name:<20}{r['status']:<10}{r['elapsed']:>9.1f}s  "
+              f"{format_delta(r['rows'], r.get('rows_before'), 0):>18}  "
+              f"{format_delta(r['rows'], r.get('rows_before'), 1):>20}")
+    print(f"{'(sum of stages)':<30}{total:>9.1f}s")
+    print("(行数为阶段结束时的表行数；并行阶段的增量可能包含同时运行的其他阶段写入的行)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按依赖关系在进程内运行数据流水线")
+    parser.add_argument('--only', help="只运行指定阶段（逗号分隔，不自动补依赖）")
+    parser.add_argument('--from', dest='start_from', help="从指定阶段开始，运行它及所有下游阶段")
+    parser.add_argument('--jobs', type=int, default=4, help="最多同时运行的阶段数")
+    parser.add_argument('--list', action='store_true', help="列出所有阶段及其依赖")
+    parser.add_argument('--http-cache', choices=["on", "refresh", "replay", "off"],
+                        help="采集阶段的 HTTP 缓存模式（默认 on，replay 为离线重放，见 scripts/http_cache.py）")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (deps, _) in STAGES.items():
+            print(f"{name:<20} <- {', '.join(deps) or '-'}")
+        return
 
-    print("--- Pipeline execution completed ---")
+    # 部分脚本使用相对路径 (data/...)，统一在项目根目录下运行
+    os.chdir(BASE_DIR)
+    if args.http_cache:
+        import http_cache
+        http_cache.configure(mode=args.http_cache)
+    started = time.perf_counter()
+    ok = run_pipeline(select_stages(args.only, args.start_from), jobs=args.jobs)
+    print(f"--- Pipeline execution completed in {time.perf_counter() - started:.1f}s ---")
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
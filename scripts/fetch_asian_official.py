@@ -1,10 +1,40 @@
-import pandas as pd
-import sqlite3
+"""
+日本食品標準成分表（MEXT, 2020 年版）Excel 的导入
+
+openpyxl 解析整张 '表全体' 要好几秒，解析结果按 Excel 文件内容的哈希缓存为列式文件
+（data/cache/mext/<哈希>.parquet；没有 pyarrow 时用 pickle），文件不变时重跑不再解析 Excel。
+食品行的过滤、分类映射和 id 拼接都是整列运算，产品一次批量写入；
+成分列（エネルギー、たんぱく質……）写入 nutrients / product_nutrients（migration 0006）。
+"""
+import hashlib
 import os
+import re
+
+import pandas as pd
+
+import paths  # noqa: F401
+from ingest import (
+    BulkWriter, DB_PATH, PRODUCT_COLUMNS, UPSERT_NUTRIENT_SQL, UPSERT_PRODUCT_NUTRIENT_SQL, to_rows
+)
+from init_db import ensure_schema
+import instrumentation
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
 JAPAN_EXCEL = os.path.join(os.path.dirname(
     __file__), '../data/japan_standard_foods.xlsx')
+SHEET_NAME = '表全体'
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '../data/cache/mext')
+
+# 数据从第 11 行开始 (index 11)；列 1: 食品番号, 列 3: 食品名, 之后是各成分
+DATA_START_ROW = 11
+FOOD_NO_COL = 1
+NAME_COL = 3
+FIRST_COMPONENT_COL = 4
+
+# 表头中的成分识别子（ENERC_KCAL、PROT-、NACL_EQ ……）和单位
+COMPONENT_ID_RE = re.compile(r'^[A-Z][A-Z0-9_]*-?$')
+UNITS = {"%", "kJ", "kcal", "g", "mg", "µg", "μg"}
+# 成分值中的记号：(数値) 为推定值，Tr 为微量，- 为未测定
+TRACE_MARKS = {"Tr": "0", "(Tr)": "0"}
 
 CATEGORY_MAP = {
     "01": "Grains (穀類)",
@@ -28,64 +58,144 @@ CATEGORY_MAP = {
 }
 
 
-def process_japan_official():
-    if not os.path.exists(JAPAN_EXCEL):
-        print(f"Error: {JAPAN_EXCEL} not found.")
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_sheet(excel_path=JAPAN_EXCEL, cache_dir=CACHE_DIR):
+    """返回整张表（不使用表头，所有单元格为字符串）；命中缓存时不解析 Excel。"""
+    key = f"{file_hash(excel_path)[:16]}-{SHEET_NAME}"
+    ext = '.parquet' if has_pyarrow() else '.pkl'
+    cache_path = os.path.join(cache_dir, key + ext)
+    if os.path.exists(cache_path):
+        print(f"使用已解析的缓存: {cache_path}")
+        return pd.read_parquet(cache_path) if ext == '.parquet' else pd.read_pickle(cache_path)
+
+    df = pd.read_excel(excel_path, sheet_name=SHEET_NAME, header=None, dtype=str)
+    # Parquet 要求字符串列名
+    df.columns = [str(c) for c in df.columns]
+    os.makedirs(cache_dir, exist_ok=True)
+    # 只保留当前 Excel 的缓存
+    for name in os.listdir(cache_dir):
+        if name.endswith(f"-{SHEET_NAME}{ext}"):
+            os.remove(os.path.join(cache_dir, name))
+    tmp_path = cache_path + '.tmp'
+    if ext == '.parquet':
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+    return df
+
+
+def header_row(header, predicate):
+    """表头中满足条件的单元格最多的一行（至少 5 个），没有时返回 None。"""
+    counts = header.apply(lambda row: row.map(lambda v: isinstance(v, str) and bool(predicate(v.strip()))).sum(), axis=1)
+    return counts.idxmax() if len(counts) and counts.max() >= 5 else None
+
+
+def component_columns(header):
+    """
+    从表头识别成分列，返回 DataFrame (column, code, unit, name)。
+    成分识别子所在行给出 code；单位行给出 unit；名称取识别子上方该列最下面的一格（最具体的子项名）。
+    """
+    header = header.iloc[:, FIRST_COMPONENT_COL:]
+    code_row = header_row(header, COMPONENT_ID_RE.match)
+    unit_row = header_row(header, lambda v: v in UNITS)
+    label_rows = header.drop(index=[r for r in (code_row, unit_row) if r is not None])
+    if code_row is not None:
+        label_rows = label_rows.loc[:code_row]
+
+    columns = []
+    for column in header.columns:
+        code = header.at[code_row, column] if code_row is not None else None
+        code = code.strip() if isinstance(code, str) and COMPONENT_ID_RE.match(code.strip()) else f"COL{column}"
+        labels = label_rows[column].dropna().map(str.strip)
+        labels = labels[labels.ne('')]
+        unit = header.at[unit_row, column] if unit_row is not None else None
+        columns.append((column, code, unit.strip() if isinstance(unit, str) else None,
+                        labels.iloc[-1] if len(labels) else code))
+    frame = pd.DataFrame(columns, columns=["column", "code", "unit", "name"])
+    # 识别子重复时（如同一成分的不同计算方法）保留第一列
+    return frame.drop_duplicates("code")
+
+
+def product_frame(data):
+    food_no = data[str(FOOD_NO_COL)].str.strip()
+    name_jp = data[str(NAME_COL)].str.strip()
+    # 验证数据有效性：食品番号至少 5 位，食品名不为空
+    valid = food_no.fillna('').str.len().ge(5) & name_jp.fillna('').ne('')
+    food_no, name_jp = food_no[valid], name_jp[valid]
+
+    frame = pd.DataFrame({
+        "id": "JPN_" + food_no,
+        "source": "JPN_GOV",
+        "name": name_jp,
+        "brand": "MEXT Japan",
+        "ingredients": name_jp,  # Ingredients
+        # 提取分类 (前两位)
+        "categories": food_no.str[:2].map(CATEGORY_MAP).fillna("Other"),
+        "countries": "Japan",
+    }, index=food_no.index)
+    return frame.reindex(columns=list(PRODUCT_COLUMNS))
+
+
+def composition_frame(data, products, components):
+    """成分值 -> (product_id, nutrient_id, amount)；推定值去掉括号，Tr 记为 0，未测定（-）不写入。"""
+    values = data.loc[products.index, components["column"].tolist()]
+    values.columns = "JPN_" + components["code"]
+    values.index = products["id"]
+    stacked = values.stack().str.strip()
+    stacked = stacked.replace(TRACE_MARKS).str.replace(r'^\((.*)\)$', r'\1', regex=True)
+    amounts = pd.to_numeric(stacked, errors='coerce').dropna()
+    frame = amounts.rename("amount").reset_index()
+    frame.columns = ["product_id", "nutrient_id", "amount"]
+    return frame
+
+
+@instrumentation.instrumented("fetch_japan")
+def process_japan_official(excel_path=JAPAN_EXCEL, db_path=DB_PATH):
+    if not os.path.exists(excel_path):
+        print(f"Error: {excel_path} not found.")
         return
 
     print(f"Processing Japan Standard Food Composition Table (2020)...")
 
     try:
-        # 读取 '表全体' sheet，不使用表头，手动处理
-        df = pd.read_excel(JAPAN_EXCEL, sheet_name='表全体', header=None)
-
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        count = 0
-        # 数据从第 11 行开始 (index 11)
-        for i in range(11, len(df)):
-            row = df.iloc[i]
-
-            # 列 1: 食品番号, 列 3: 食品名
-            food_no = str(row[1]).strip()
-            name_jp = str(row[3]).strip()
-
-            # 验证数据有效性
-            if not food_no or food_no == 'nan' or len(food_no) < 5:
-                continue
-            if not name_jp or name_jp == 'nan':
-                continue
-
-            # 提取分类 (前两位)
-            cat_code = food_no[:2]
-            category = CATEGORY_MAP.get(cat_code, "Other")
-
-            food_id = f"JPN_{food_no}"
-
-            data = (
-                food_id,
-                'JPN_GOV',
-                None,
-                name_jp,
-                "MEXT Japan",
-                name_jp,  # Ingredients
-                None,
-                None,
-                None,
-                category,
-                "Japan"
-            )
-
-            cursor.execute('''
-                INSERT OR REPLACE INTO products (id, source, barcode, name, brand, ingredients, allergens, traces, image_url, categories, countries)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', data)
-            count += 1
-
-        conn.commit()
-        conn.close()
-        print(f"成功从日本官方数据导入 {count} 条标准食材记录。")
+        df = load_sheet(excel_path)
+        instrumentation.current().add("rows_read", len(df))
+        data = df.iloc[DATA_START_ROW:]
+        products = product_frame(data)
+        components = component_columns(df.iloc[:DATA_START_ROW])
+        composition = composition_frame(data, products, components)
+
+        with BulkWriter(db_path, batch_size=max(1, len(products)), label="JPN_GOV") as writer:
+            writer.add_many(to_rows(products))
+        print(f"成功从日本官方数据导入 {len(products)} 条标准食材记录。")
+
+        nutrients = pd.DataFrame({
+            "id": "JPN_" + components["code"], "source": "JPN_GOV", "code": components["code"],
+            "symbol": None, "unit": components["unit"], "name": components["name"], "name_fr": None})
+        with BulkWriter(db_path, batch_size=max(1, len(composition)), sql=UPSERT_PRODUCT_NUTRIENT_SQL,
+                        label="JPN_GOV composition") as writer:
+            # 单独运行本脚本时数据库可能还没有营养成分表
+            ensure_schema(writer.conn)
+            with writer.conn:
+                writer.conn.executemany(UPSERT_NUTRIENT_SQL, to_rows(nutrients))
+            writer.add_many(to_rows(composition))
+        print(f"导入 {len(components)} 种成分、{len(composition)} 条成分值。")
 
     except Exception as e:
         print(f"处理数据时出错: {e}")
@@ -1,113 +1,202 @@
-import requests
 import zipfile
-import io
 import pandas as pd
-import sqlite3
 import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
+import paths  # noqa: F401
+from ingest import (
+    BulkWriter, DB_PATH, PRODUCT_COLUMNS, UPSERT_NUTRIENT_SQL, UPSERT_PRODUCT_NUTRIENT_SQL, to_rows
+)
+from http_cache import download_file
+from init_db import ensure_schema
+import instrumentation
+
 # 更新后的 Health Canada CNF 2015 下载链接
 CNF_URL = "https://www.canada.ca/content/dam/hc-sc/documents/services/food-nutrition/healthy-eating/nutrient-data/canadian-nutrient-file-2015-download-files/cnf-fce-2015-csv.zip"
+CNF_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+CNF_DOWNLOAD_DIR = "data/cnf"
+CNF_ENCODING = "ISO-8859-1"
+
+# 用户手动下载解压的目录，以及旧版本自动解压的目录
+MANUAL_DIR = "cnf-fcen-csv"
+LEGACY_DIR = "data/temp_cnf"
+
+# 处理可能的文件名差异：手动下载的版本通常叫 "FOOD NAME.csv"，自动下载的版本可能叫 "FOOD_NM.csv"
+FOOD_NAME_FILES = ("FOOD NAME.csv", "FOOD_NM.csv")
+NUTRIENT_NAME_FILES = ("NUTRIENT NAME.csv", "NT_NM.csv")
+NUTRIENT_AMOUNT_FILES = ("NUTRIENT AMOUNT.csv", "NT_AMT.csv")
+
+# 营养素含量表约 50 万行，分块读取和写入
+NUTRIENT_CHUNK_ROWS = 100000
+
+
+class CnfFiles:
+    """
+    CNF 数据文件：zip 包（直接读取其中的 CSV，不解压、不整个读入内存）或已解压的目录。
+    按文件名查找，不区分大小写，也不管在哪一层子目录。
+    """
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            self.zip = None
+            members = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+        else:
+            self.zip = zipfile.ZipFile(path)
+            members = [m for m in self.zip.namelist() if not m.endswith('/')]
+        self.members = {os.path.basename(m).lower(): m for m in members}
+
+    def find(self, names):
+        for name in names:
+            member = self.members.get(name.lower())
+            if member:
+                return member
+        return None
 
+    def open(self, member):
+        return self.zip.open(member) if self.zip else open(member, 'rb')
 
-def download_and_extract():
-    print(f"正在从 Health Canada 下载数据: {CNF_URL}")
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    try:
-        response = requests.get(CNF_URL, headers=headers, timeout=60)
-        if response.status_code == 200:
-            z = zipfile.ZipFile(io.BytesIO(response.content))
-            os.makedirs("data/temp_cnf", exist_ok=True)
-            z.extractall("data/temp_cnf")
-            print("下载并解压完成。")
-            return "data/temp_cnf"
-        else:
-            print(f"下载失败: 状态码 {response.status_code}")
+    def read_csv(self, names, **kwargs):
+        member = self.find(names)
+        if member is None:
             return None
-    except Exception as e:
-        print(f"网络异常: {e}")
-        return None
+        print(f"找到数据文件: {member}")
+        with self.open(member) as f:
+            return pd.read_csv(f, encoding=CNF_ENCODING, **kwargs)
+
+    def iter_csv(self, names, chunksize, **kwargs):
+        member = self.find(names)
+        if member is None:
+            return
+        print(f"找到数据文件: {member}")
+        with self.open(member) as f:
+            yield from pd.read_csv(f, encoding=CNF_ENCODING, chunksize=chunksize, **kwargs)
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+
+
+def first_column(df, *names):
+    # 不同的 CSV 版本列名可能略有不同，做兼容处理
+    for name in names:
+        if name in df.columns:
+            return df[name].str.strip()
+    return pd.Series(None, index=df.index, dtype=object)
+
+
+def product_frame(df_food):
+    """FOOD NAME 表 -> products 行（列顺序同 PRODUCT_COLUMNS），整列运算，不逐行迭代。"""
+    food_id = first_column(df_food, 'FoodID', 'FoodId')
+    desc_en = first_column(df_food, 'FoodDescription', 'FoodName')
+    desc_fr = first_column(df_food, 'FoodDescriptionF', 'FoodNameF')
+
+    valid = food_id.fillna('').ne('') & desc_en.fillna('').ne('')
+    food_id, desc_en, desc_fr = food_id[valid], desc_en[valid], desc_fr[valid]
+    # 存入双语名称；没有法文名称时只存英文
+    has_fr = desc_fr.fillna('').ne('')
+    ingredients = desc_en.where(~has_fr, desc_en + " / " + desc_fr)
+
+    frame = pd.DataFrame({
+        "id": "CNF_" + food_id,
+        "source": "CNF",
+        "name": desc_en,
+        "brand": "Health Canada",
+        "ingredients": ingredients,
+        "categories": "Standard Canadian Food",
+        "countries": "Canada",
+    }, index=food_id.index)
+    return frame.reindex(columns=list(PRODUCT_COLUMNS))
+
+
+def nutrient_frame(df_names):
+    return pd.DataFrame({
+        "id": "CNF_" + first_column(df_names, 'NutrientID'),
+        "source": "CNF",
+        "code": first_column(df_names, 'NutrientCode'),
+        "symbol": first_column(df_names, 'NutrientSymbol'),
+        "unit": first_column(df_names, 'NutrientUnit'),
+        "name": first_column(df_names, 'NutrientName'),
+        "name_fr": first_column(df_names, 'NutrientNameF'),
+    })
+
+
+def amount_frame(chunk, product_ids):
+    """NUTRIENT AMOUNT 表的一块 -> product_nutrients 行，只保留已导入的食品。"""
+    frame = pd.DataFrame({
+        "product_id": "CNF_" + first_column(chunk, 'FoodID', 'FoodId'),
+        "nutrient_id": "CNF_" + first_column(chunk, 'NutrientID'),
+        "amount": pd.to_numeric(chunk['NutrientValue'], errors='coerce'),
+    })
+    return frame[frame['product_id'].isin(product_ids) & frame['nutrient_id'].notna()]
+
+
+def load_nutrients(files, product_ids, db_path=DB_PATH):
+    df_names = files.read_csv(NUTRIENT_NAME_FILES, dtype=str)
+    amount_columns = {'FoodID', 'FoodId', 'NutrientID', 'NutrientValue'}
+    chunks = files.iter_csv(NUTRIENT_AMOUNT_FILES, NUTRIENT_CHUNK_ROWS,
+                            usecols=lambda c: c in amount_columns, dtype=str)
+
+    amounts = 0
+    with BulkWriter(db_path, batch_size=NUTRIENT_CHUNK_ROWS, sql=UPSERT_PRODUCT_NUTRIENT_SQL,
+                    label="CNF nutrients") as writer:
+        # 单独运行本脚本时数据库可能还没有营养成分表
+        ensure_schema(writer.conn)
+        if df_names is not None:
+            with writer.conn:
+                writer.conn.executemany(UPSERT_NUTRIENT_SQL, to_rows(nutrient_frame(df_names)))
+        for chunk in chunks:
+            instrumentation.current().add("rows_read", len(chunk))
+            frame = amount_frame(chunk, product_ids)
+            writer.add_many(to_rows(frame))
+            amounts += len(frame)
+    return amounts
+
+
+def process_cnf(path, db_path=DB_PATH):
+    print(f"正在处理官方数据: {path}")
+    files = CnfFiles(path)
+    try:
+        df_food = files.read_csv(FOOD_NAME_FILES, dtype=str)
+        if df_food is None:
+            print(f"错误：在 {path} 中找不到有效的食品名称文件 (FOOD NAME.csv 或 FOOD_NM.csv)")
+            return
 
+        instrumentation.current().add("rows_read", len(df_food))
+        rows = product_frame(df_food)
+        # 全部产品在一个事务中写入
+        with BulkWriter(db_path, batch_size=max(1, len(rows)), label="CNF") as writer:
+            writer.add_many(to_rows(rows))
+        print(f"成功从 CNF 导入 {len(rows)} 条标准食品数据。")
 
-def process_cnf(folder_path):
-    print(f"正在处理目录中的官方数据: {folder_path}")
+        amounts = load_nutrients(files, set(rows['id']), db_path)
+        print(f"导入 {amounts} 条营养素含量。")
 
-    # 尝试寻找食品名称文件，处理可能的文件名差异
-    # 手动下载的版本通常叫 "FOOD NAME.csv"，自动下载的版本可能叫 "FOOD_NM.csv"
-    possible_names = ["FOOD NAME.csv", "FOOD_NM.csv"]
-    df_food = None
+    except Exception as e:
+        print(f"处理数据时出错: {e}")
+    finally:
+        files.close()
 
-    for name in possible_names:
-        file_path = os.path.join(folder_path, name)
-        if os.path.exists(file_path):
-            print(f"找到数据文件: {file_path}")
-            try:
-                df_food = pd.read_csv(file_path, encoding="ISO-8859-1")
-                break
-            except Exception as e:
-                print(f"尝试读取 {name} 时出错: {e}")
 
-    if df_food is None:
-        print(f"错误：在 {folder_path} 中找不到有效的食品名称文件 (FOOD NAME.csv 或 FOOD_NM.csv)")
-        return
+@instrumentation.instrumented("fetch_canada")
+def fetch_cnf():
+    # 优先使用用户手动下载的目录，其次是旧版本解压出的目录；
+    # 都没有时下载 zip 到 data/cnf/（流式写入磁盘，已下载过则直接使用），不解压，直接读取其中的 CSV
+    for folder in (MANUAL_DIR, LEGACY_DIR):
+        if os.path.exists(folder):
+            process_cnf(folder)
+            return
 
+    print(f"正在从 Health Canada 获取数据: {CNF_URL}")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        count = 0
-        for _, row in df_food.iterrows():
-            # 不同的 CSV 版本列名可能略有不同，做兼容处理
-            food_id = row.get('FoodID') or row.get('FoodId')
-            desc_en = row.get('FoodDescription') or row.get('FoodName')
-            desc_fr = row.get('FoodDescriptionF') or row.get('FoodNameF')
-
-            if not food_id or not desc_en:
-                continue
-
-            data = (
-                f"CNF_{food_id}",
-                'CNF',
-                None,
-                desc_en,
-                "Health Canada",
-                f"{desc_en} / {desc_fr}",  # 存入双语名称
-                None,
-                None,
-                None,
-                "Standard Canadian Food",
-                "Canada"
-            )
-
-            cursor.execute('''
-                INSERT OR REPLACE INTO products (id, source, barcode, name, brand, ingredients, allergens, traces, image_url, categories, countries)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', data)
-            count += 1
-
-        conn.commit()
-        conn.close()
-        print(f"成功从 CNF 导入 {count} 条标准食品数据。")
-
+        path = download_file(CNF_URL, CNF_DOWNLOAD_DIR, headers=CNF_HEADERS)
     except Exception as e:
-        print(f"处理数据时出错: {e}")
+        print(f"网络异常: {e}")
+        instrumentation.current().add("http_errors")
+        print("无法获取 CNF 数据。请手动下载并解压到 cnf-fcen-csv 文件夹。")
+        return
+    process_cnf(path)
 
 
 if __name__ == "__main__":
-    # 优先检查用户手动下载的目录
-    manual_dir = "cnf-fcen-csv"
-    temp_dir = "data/temp_cnf"
-
-    if os.path.exists(manual_dir):
-        process_cnf(manual_dir)
-    elif os.path.exists(temp_dir):
-        process_cnf(temp_dir)
-    else:
-        # 如果都没有，尝试自动下载
-        downloaded_path = download_and_extract()
-        if downloaded_path:
-            process_cnf(downloaded_path)
-        else:
-            print("无法获取 CNF 数据。请手动下载并解压到 cnf-fcen-csv 文件夹。")
+    fetch_cnf()
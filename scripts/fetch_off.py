@@ -1,14 +1,58 @@
 import requests
-import sqlite3
-import os
 import time
-from requests.adapters import HTTPAdapter
+import argparse
+import asyncio
 from urllib3.util.retry import Retry
 
-DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
+import paths  # noqa: F401
+from ingest import BulkWriter, product_row
+from http_cache import CachingAdapter, ReplayMiss, serves_offline
+from fetch_state import FetchState, DEFAULT_FRESH_HOURS, MAX_PAGE_RETRIES
+import instrumentation
 
+OFF_CATEGORY_BASE_URL = "https://world.openfoodfacts.org"
+OFF_SEARCH_BASE_URL = "https://ca.openfoodfacts.org"
+SEARCH_FIELDS = "code,product_name,brands,ingredients_text,allergens,traces,image_url,categories,countries"
+
+# OFF 官方限速（每分钟请求数）：搜索接口 10 次/分钟，分类等 facet 页面 2 次/分钟
+# https://openfoodfacts.github.io/openfoodfacts-server/api/#rate-limits
+# 同步和异步采集都按这个限速；分类页因此最多 2 页/分钟，大批量数据请用 import_off_dump.py
+OFF_RATE_LIMITS = {"search": 10, "facet": 2}
+
+# 之前抓得比较顺的分类标签（设置 50 页上限，防止卡死）
+SAFE_TAGS = [
+    "en:dairy-substitutes",
+    "en:desserts",
+    "en:pickled-foods",
+    "en:seaweed-snacks",
+    "en:frozen-prepared-meals",
+    "en:condiments",
+    "en:curry-pastes",
+    "en:soups"
+]
+
+# 针对分类标签不全的国家，使用“产地搜索”暴力增补
+ORIGINS = [
+    "China", "Japan", "South Korea", "Thailand", "Vietnam",
+    "Taiwan", "Philippines", "Malaysia", "Singapore", "India"
+]
+
+
+def category_page_url(category_tag, page, base_url=OFF_CATEGORY_BASE_URL):
+    return f"{base_url}/category/{category_tag}/{page}.json"
+
+
+def origin_search_url(origin_name, page, base_url=OFF_SEARCH_BASE_URL):
+    # 使用搜索接口搜索 origins 字段
+    return f"{base_url}/cgi/search.pl?action=process&tagtype_0=origins&tag_contains_0=contains&tag_0={origin_name}&fields={SEARCH_FIELDS}&page_size=100&page={page}&json=true"
+
+
+def get_robust_session(retry_on_429=True):
+    # 异步爬虫自己处理 429（全局限速 + 退避），此时不让 urllib3 在底层重试
+    status_forcelist = [500, 502, 503, 504]
+    if retry_on_429:
+        status_forcelist.insert(0, 429)
 
-def get_robust_session():
     session = requests.Session()
     session.headers.update({
         'User-Agent': 'FoodDataCollector - Canada - EducationProject (https://github.com/anthony/fooddata)'
@@ -16,19 +60,38 @@ def get_robust_session():
     retry = Retry(
         total=5,
         backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
+        status_forcelist=status_forcelist,
+        respect_retry_after_header=retry_on_429,
         allowed_methods=["GET"]
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    # 响应先查 data/http_cache（见 http_cache.py），重跑时已抓过的页面不再请求
+    adapter = CachingAdapter(max_retries=retry)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
-    return session
+    return instrumentation.instrument_session(session)
+
+
+class RateLimiter:
+    """同步采集的限速：同一类接口两次请求之间至少间隔 60 / rpm 秒（异步版用令牌桶，限速相同）。"""
 
+    def __init__(self, rate_limits=None):
+        limits = dict(OFF_RATE_LIMITS, **(rate_limits or {}))
+        self.interval = {kind: 60.0 / rpm for kind, rpm in limits.items()}
+        self.last = {}
 
-def save_to_db(products):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    def wait(self, kind, url):
+        # 缓存能直接给出的页面不用等
+        if serves_offline(url):
+            return
+        last = self.last.get(kind)
+        if last is not None:
+            delay = self.interval[kind] - (time.monotonic() - last)
+            if delay > 0:
+                time.sleep(delay)
+        self.last[kind] = time.monotonic()
 
+
+def save_to_db(products, writer):
     count = 0
     for p in products:
         p_id = p.get('_id') or p.get('code')
@@ -39,86 +102,101 @@ def save_to_db(products):
             'ingredients_text_en') or p.get('ingredients_text_fr')
         name = p.get('product_name') or p.get('product_name_en')
 
-        data = (
+        writer.add(product_row(
             str(p_id),
             'OFF',
-            p.get('code'),
-            name,
-            p.get('brands'),
-            ingredients,
-            p.get('allergens'),
-            p.get('traces'),
-            p.get('image_url'),
-            p.get('categories'),
-            p.get('countries')
-        )
-
-        cursor.execute('''
-            INSERT OR REPLACE INTO products (id, source, barcode, name, brand, ingredients, allergens, traces, image_url, categories, countries)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', data)
+            barcode=p.get('code'),
+            name=name,
+            brand=p.get('brands'),
+            ingredients=ingredients,
+            allergens=p.get('allergens'),
+            traces=p.get('traces'),
+            image_url=p.get('image_url'),
+            categories=p.get('categories'),
+            countries=p.get('countries')
+        ))
         count += 1
 
-    conn.commit()
-    conn.close()
     return count
 
 
-def fetch_by_category_robust(session, category_tag, max_pages=None):
-    page = 1
-    total_in_cat = 0
+def fetch_by_category_robust(session, state, category_tag, max_pages=None, limiter=None):
+    cursor = f"category:{category_tag}"
     print(f"\n[开始扫描分类] 标签: {category_tag}")
+    page = state.resume_page(cursor)
+    if page is None:
+        return
+    total_in_cat = 0
+    failures = 0
 
     while True:
         if max_pages and page > max_pages:
             print(f"   - 已达到该分类设定的最大页数 ({max_pages})，跳过。")
             break
 
-        url = f"https://world.openfoodfacts.org/category/{category_tag}/{page}.json"
+        url = category_page_url(category_tag, page)
+        if limiter is not None:
+            limiter.wait("facet", url)
 
         try:
             response = session.get(url, timeout=30)
             if response.status_code == 404:
                 break
-            if response.status_code != 200:
-                page += 1
-                continue
+            # 其他错误响应（403、5xx……）与异常一样计入重试次数，断点不越过这一页
+            response.raise_for_status()
 
             data = response.json()
             products = data.get('products', [])
             if not products:
                 break
 
-            saved = save_to_db(products)
+            saved = save_to_db(products, state.writer)
+            state.page_done(cursor, page, saved)
             total_in_cat += saved
             print(f"   [页码 {page}] 成功保存 {saved} 条记录 (累计: {total_in_cat})")
 
             page += 1
-            time.sleep(0.5)
+            failures = 0
 
+        except ReplayMiss as e:
+            # 离线重放时缓存里没有这一页：不重试，也不记为抓完
+            print(f"   - {e}")
+            return
         except Exception as e:
+            failures += 1
             print(f"   - 异常: {e}")
+            instrumentation.current().add("http_errors")
+            if failures > MAX_PAGE_RETRIES:
+                print(f"   - 第 {page} 页连续失败 {failures} 次，放弃该分类（下次运行从这一页继续）")
+                state.page_failed(cursor, page, e)
+                return
+            instrumentation.current().add("http_retries")
             time.sleep(5)
-            continue
+
+    state.finish(cursor)
 
 
-def fetch_by_origin_search(session, origin_name, max_pages=20):
+def fetch_by_origin_search(session, state, origin_name, max_pages=20, limiter=None):
     """
     针对分类标签不全的国家，直接按“产地/起源地”进行搜索
     """
+    cursor = f"origin:{origin_name}"
     print(f"\n[开始搜索产地] 起源地: {origin_name}")
-    page = 1
+    page = state.resume_page(cursor)
+    if page is None:
+        return
     total_in_origin = 0
+    failures = 0
 
     while page <= max_pages:
-        # 使用搜索接口搜索 origins 字段
-        fields = "code,product_name,brands,ingredients_text,allergens,traces,image_url,categories,countries"
-        url = f"https://ca.openfoodfacts.org/cgi/search.pl?action=process&tagtype_0=origins&tag_contains_0=contains&tag_0={origin_name}&fields={fields}&page_size=100&page={page}&json=true"
+        url = origin_search_url(origin_name, page)
+        if limiter is not None:
+            limiter.wait("search", url)
 
         try:
             response = session.get(url, timeout=30)
-            if response.status_code != 200:
-                break
+            # 错误响应与异常一样计入重试次数，断点不越过这一页
+            response.raise_for_status()
 
             data = response.json()
             products = data.get('products', [])
@@ -126,48 +204,69 @@ def fetch_by_origin_search(session, origin_name, max_pages=20):
             if not products:
                 break
 
-            saved = save_to_db(products)
+            saved = save_to_db(products, state.writer)
+            state.page_done(cursor, page, saved)
             total_in_origin += saved
             print(
                 f"   [页码 {page}] 产地 {origin_name} 成功抓取 {len(products)} 条，新增/更新 {saved} 条")
 
             page += 1
-            time.sleep(1)
+            failures = 0
+        except ReplayMiss as e:
+            print(f"   - {e}")
+            return
         except Exception as e:
+            failures += 1
             print(f"   - 异常: {e}")
-            break
+            instrumentation.current().add("http_errors")
+            if failures > MAX_PAGE_RETRIES:
+                print(f"   - 第 {page} 页连续失败 {failures} 次，放弃该产地（下次运行从这一页继续）")
+                state.page_failed(cursor, page, e)
+                return
+            instrumentation.current().add("http_retries")
+            time.sleep(5)
+
+    state.finish(cursor)
+
+
+@instrumentation.instrumented("fetch_off")
+def crawl(session, fresh_hours=DEFAULT_FRESH_HOURS, restart=False, rate_limits=None):
+    # 整个采集过程共用一个写入连接，退出时（包括 Ctrl-C）提交剩余缓冲；
+    # 每页落库后记录断点，中断后再次运行从断点继续
+    with BulkWriter(label="OFF") as writer:
+        state = FetchState(writer, "OFF", fresh_hours=fresh_hours, restart=restart)
+        limiter = RateLimiter(rate_limits)
+        for tag in SAFE_TAGS:
+            fetch_by_category_robust(session, state, tag, max_pages=50, limiter=limiter)
+
+        for origin in ORIGINS:
+            try:
+                fetch_by_origin_search(session, state, origin, max_pages=20, limiter=limiter)
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                print(f"搜索 {origin} 失败: {e}")
 
 
 if __name__ == "__main__":
-    session = get_robust_session()
-
-    # 1. 之前抓得比较顺的分类标签（设置 50 页上限，防止卡死）
-    safe_tags = [
-        "en:dairy-substitutes",
-        "en:desserts",
-        "en:pickled-foods",
-        "en:seaweed-snacks",
-        "en:frozen-prepared-meals",
-        "en:condiments",
-        "en:curry-pastes",
-        "en:soups"
-    ]
-
-    for tag in safe_tags:
-        fetch_by_category_robust(session, tag, max_pages=50)
-
-    # 2. 针对之前失败的国家，使用“产地搜索”暴力增补
-    origins = [
-        "China", "Japan", "South Korea", "Thailand", "Vietnam",
-        "Taiwan", "Philippines", "Malaysia", "Singapore", "India"
-    ]
-
-    for origin in origins:
-        try:
-            fetch_by_origin_search(session, origin, max_pages=20)
-        except KeyboardInterrupt:
-            break
-        except Exception as e:
-            print(f"搜索 {origin} 失败: {e}")
+    parser = argparse.ArgumentParser(description="从 Open Food Facts 采集亚洲食品数据")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="并发异步模式：多个分类/产地游标同时进行，共享全局限速器")
+    parser.add_argument('--concurrency', type=int, default=4, help="异步模式下同时进行的游标数")
+    parser.add_argument('--facet-rpm', type=float, help="分类页每分钟请求上限（默认按 OFF 官方限速）")
+    parser.add_argument('--search-rpm', type=float, help="搜索接口每分钟请求上限（默认按 OFF 官方限速）")
+    parser.add_argument('--fresh-hours', type=float, default=DEFAULT_FRESH_HOURS,
+                        help="在这么多小时内抓完的分类/产地不再重抓")
+    parser.add_argument('--restart', action='store_true', help="忽略断点，所有游标从第 1 页开始")
+    args = parser.parse_args()
+
+    rate_limits = {kind: rpm for kind, rpm in (("facet", args.facet_rpm), ("search", args.search_rpm)) if rpm}
+    if args.use_async:
+        from fetch_off_async import crawl_async
+        with instrumentation.stage("fetch_off"):
+            asyncio.run(crawl_async(concurrency=args.concurrency, rate_limits=rate_limits,
+                                    fresh_hours=args.fresh_hours, restart=args.restart))
+    else:
+        crawl(get_robust_session(), fresh_hours=args.fresh_hours, restart=args.restart, rate_limits=rate_limits)
 
     print("\n--- 采集任务全部结束 ---")
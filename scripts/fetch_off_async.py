@@ -0,0 +1,216 @@
+"""
+Open Food Facts 并发异步采集
+
+多个分类/产地游标同时在途，所有请求共享一个按接口类型划分的令牌桶限速器；
+遇到 429 时整个桶暂停（优先使用 Retry-After），页面结果交给唯一的写入任务落库，
+SQLite 不会出现并发写。同一页的重试次数与同步版相同（MAX_PAGE_RETRIES），用尽后记下失败的页，游标不记为抓完。
+
+限速与同步版相同（OFF 官方限速，见 fetch_off.OFF_RATE_LIMITS）。分类页和产地搜索各用一个桶同时进行，
+网络延迟被并发的游标掩盖；但分类页总量受 facet 限速约束（2 页/分钟），--concurrency 对它不起作用。
+
+基础 URL 可替换，方便指向本地的桩 HTTP 服务做离线测试:
+    python scripts/fetch_off.py --async --concurrency 6
+"""
+import asyncio
+import time
+
+import paths  # noqa: F401
+from fetch_off import (
+    OFF_CATEGORY_BASE_URL, OFF_SEARCH_BASE_URL, OFF_RATE_LIMITS, SAFE_TAGS, ORIGINS,
+    category_page_url, origin_search_url, get_robust_session, save_to_db
+)
+from ingest import BulkWriter, DB_PATH
+from fetch_state import FetchState, DEFAULT_FRESH_HOURS, MAX_PAGE_RETRIES
+import http_cache
+import instrumentation
+
+BACKOFF_BASE = 2.0
+
+
+class PageFailed(Exception):
+    """同一页重试 MAX_PAGE_RETRIES 次后仍然失败。"""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # 持锁等待，保证所有协程按先来后到排队
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def back_off(self, seconds):
+        # 收到 429：清空令牌，并让所有使用该桶的游标一起暂停
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+def retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+async def fetch_products(session, bucket, url, end_on_404=False):
+    """
+    返回该页的产品列表；end_on_404 时 404 返回 None（分类翻到头）。
+    与同步版一样，异常、错误响应和无法解析的响应体都计入重试次数，用尽后抛出 PageFailed。
+    """
+    failures = 0
+    while True:
+        # 缓存能直接给出的页面不占用限速令牌
+        if not http_cache.serves_offline(url):
+            await bucket.acquire()
+        backoff = BACKOFF_BASE * 2 ** failures
+        try:
+            response = await asyncio.to_thread(session.get, url, timeout=30)
+            if response.status_code == 429:
+                # 整个桶暂停（优先使用 Retry-After），不再另外等待
+                backoff = retry_after_seconds(response) or backoff
+                print(f"   - 429 限速，暂停 {backoff:.0f}s: {url}")
+                bucket.back_off(backoff)
+                backoff = 0
+            if end_on_404 and response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.json().get('products', [])
+        except http_cache.ReplayMiss:
+            raise
+        except Exception as e:
+            failures += 1
+            print(f"   - 异常: {e}")
+            metrics = instrumentation.current()
+            metrics.add("http_errors")
+            if failures > MAX_PAGE_RETRIES:
+                raise PageFailed(e) from e
+            metrics.add("http_retries")
+            await asyncio.sleep(backoff)
+
+
+async def crawl_pages(session, bucket, results, cursor, page_url, start_page, max_pages, end_on_404=False):
+    for page in range(start_page, max_pages + 1):
+        try:
+            products = await fetch_products(session, bucket, page_url(page), end_on_404)
+        except PageFailed as e:
+            # 断点不越过这一页，记下失败原因，游标不记为抓完
+            print(f"   - [{cursor}] 第 {page} 页连续失败 {MAX_PAGE_RETRIES + 1} 次，放弃（下次运行从这一页继续）")
+            await results.put(("failed", cursor, page, e.__cause__))
+            return
+        if not products:
+            break
+        await results.put(("page", cursor, page, products))
+        print(f"   [{cursor} 页码 {page}] 抓取 {len(products)} 条")
+    await results.put(("finish", cursor, None, None))
+
+
+async def crawl_category(session, bucket, results, category_tag, start_page, max_pages, base_url):
+    print(f"\n[开始扫描分类] 标签: {category_tag}")
+    await crawl_pages(session, bucket, results, f"category:{category_tag}",
+                      lambda page: category_page_url(category_tag, page, base_url),
+                      start_page, max_pages, end_on_404=True)
+
+
+async def crawl_origin(session, bucket, results, origin_name, start_page, max_pages, base_url):
+    print(f"\n[开始搜索产地] 起源地: {origin_name}")
+    await crawl_pages(session, bucket, results, f"origin:{origin_name}",
+                      lambda page: origin_search_url(origin_name, page, base_url),
+                      start_page, max_pages)
+
+
+async def cursor_worker(cursors, results, limiter, category_base_url, search_base_url):
+    # 每个 worker 一个 session，底层连接池在线程间不共享
+    session = get_robust_session(retry_on_429=False)
+    while True:
+        try:
+            kind, key, start_page, max_pages = cursors.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        try:
+            if kind == "category":
+                await crawl_category(session, limiter["facet"], results, key, start_page, max_pages,
+                                     category_base_url)
+            else:
+                await crawl_origin(session, limiter["search"], results, key, start_page, max_pages,
+                                   search_base_url)
+        except http_cache.ReplayMiss as e:
+            # 离线重放时缓存里没有这一页：该游标不记为抓完
+            print(f"   - {e}")
+        except Exception as e:
+            print(f"游标 {key} 失败: {e}")
+
+
+async def write_results(results, state):
+    # 唯一的写入任务：所有页面结果串行落库，每页落库后推进该游标的断点
+    total = 0
+    while True:
+        item = await results.get()
+        if item is None:
+            break
+        action, cursor, page, payload = item
+        if action == "finish":
+            state.finish(cursor)
+        elif action == "failed":
+            state.page_failed(cursor, page, payload)
+        else:
+            saved = save_to_db(payload, state.writer)
+            state.page_done(cursor, page, saved)
+            total += saved
+    return total
+
+
+async def crawl_async(concurrency=4, tags=SAFE_TAGS, origins=ORIGINS,
+                      category_max_pages=50, origin_max_pages=20,
+                      category_base_url=OFF_CATEGORY_BASE_URL, search_base_url=OFF_SEARCH_BASE_URL,
+                      rate_limits=None, db_path=DB_PATH, fresh_hours=DEFAULT_FRESH_HOURS, restart=False):
+    limits = dict(OFF_RATE_LIMITS, **(rate_limits or {}))
+    limiter = {kind: TokenBucket(rpm) for kind, rpm in limits.items()}
+
+    with BulkWriter(db_path, label="OFF async") as writer:
+        # 与同步版共用断点（source = OFF，游标名相同）
+        state = FetchState(writer, "OFF", fresh_hours=fresh_hours, restart=restart)
+        cursors = asyncio.Queue()
+        for kind, keys, max_pages in (("category", tags, category_max_pages), ("origin", origins, origin_max_pages)):
+            for key in keys:
+                start_page = state.resume_page(f"{kind}:{key}")
+                if start_page is not None:
+                    cursors.put_nowait((kind, key, start_page, max_pages))
+
+        # 有界队列：写入跟不上时让抓取协程等待，内存不会无限增长
+        results = asyncio.Queue(maxsize=concurrency * 4)
+        writer_task = asyncio.create_task(write_results(results, state))
+
+        workers = [asyncio.create_task(cursor_worker(cursors, results, limiter, category_base_url, search_base_url))
+                   for _ in range(concurrency)]
+        crawling = asyncio.gather(*workers)
+        try:
+            await asyncio.wait([crawling, writer_task], return_when=asyncio.FIRST_COMPLETED)
+            if crawling.done():
+                crawling.result()
+            else:
+                # 写入任务出错退出后没有人再取队列，抓取协程会永远阻塞在 put 上：取消它们，再抛出写入的异常
+                crawling.cancel()
+                await asyncio.gather(crawling, return_exceptions=True)
+        finally:
+            if not writer_task.done():
+                await results.put(None)
+            total = await writer_task
+    print(f"异步采集完成，共保存 {total} 条记录。")
+    return total
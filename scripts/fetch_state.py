@@ -0,0 +1,102 @@
+"""
+采集游标的断点（fetch_state 表，见 db/migrations/0005_fetch_state.sql）
+
+断点与产品写在 BulkWriter 的同一个连接上，先提交该页的数据再推进断点：
+中断后最多重抓一页（INSERT OR REPLACE 幂等）。
+    - 未抓完的游标从 last_page + 1 继续
+    - 在新鲜期内已抓完的游标直接跳过，超过新鲜期的从第 1 页重新抓
+    - restart=True 时忽略已有断点
+    - 同一页重试用尽时记下失败的页码和原因（page_failed），游标不记为抓完
+"""
+import paths  # noqa: F401
+from init_db import ensure_schema
+
+DEFAULT_FRESH_HOURS = 24.0
+
+# 同一页连续失败这么多次后放弃该游标：断点不前进，下次运行从这一页继续
+MAX_PAGE_RETRIES = 3
+
+PAGE_DONE_SQL = '''
+    INSERT INTO fetch_state (source, cursor, last_page, items, started_at, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT (source, cursor) DO UPDATE SET
+        last_page = excluded.last_page,
+        items = items + excluded.items,
+        updated_at = excluded.updated_at,
+        failed_page = NULL,
+        last_error = NULL
+'''
+
+PAGE_FAILED_SQL = '''
+    INSERT INTO fetch_state (source, cursor, failed_page, last_error, started_at, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT (source, cursor) DO UPDATE SET
+        failed_page = excluded.failed_page,
+        last_error = excluded.last_error,
+        updated_at = excluded.updated_at
+'''
+
+FINISH_SQL = '''
+    INSERT INTO fetch_state (source, cursor, started_at, updated_at, finished_at)
+    VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT (source, cursor) DO UPDATE SET
+        updated_at = excluded.updated_at,
+        finished_at = excluded.finished_at,
+        failed_page = NULL,
+        last_error = NULL
+'''
+
+
+class FetchState:
+    def __init__(self, writer, source, fresh_hours=DEFAULT_FRESH_HOURS, restart=False):
+        self.writer = writer
+        self.conn = writer.conn
+        self.source = source
+        self.fresh_hours = fresh_hours
+        self.restart = restart
+        # 单独运行采集脚本时数据库可能还没有 fetch_state 表
+        ensure_schema(self.conn)
+
+    def resume_page(self, cursor):
+        """返回该游标下一个要抓的页码；在新鲜期内已经抓完时返回 None。"""
+        if self.restart:
+            self.reset(cursor)
+            return 1
+        row = self.conn.execute(
+            "SELECT last_page, items, finished_at, finished_at >= datetime('now', ?), failed_page, last_error "
+            "FROM fetch_state WHERE source = ? AND cursor = ?",
+            (f"-{self.fresh_hours * 3600:.0f} seconds", self.source, cursor)).fetchone()
+        if row is None:
+            return 1
+        last_page, items, finished_at, fresh, failed_page, last_error = row
+        if finished_at is None:
+            if failed_page is not None:
+                print(f"   [{cursor}] 上次在第 {failed_page} 页放弃: {last_error}，重新尝试")
+            elif last_page:
+                print(f"   [{cursor}] 从断点继续: 第 {last_page + 1} 页（已保存 {items} 条）")
+            return last_page + 1
+        if fresh:
+            print(f"   [{cursor}] {finished_at} 已抓完（{items} 条），在 {self.fresh_hours:g} 小时新鲜期内，跳过")
+            return None
+        self.reset(cursor)
+        return 1
+
+    def reset(self, cursor):
+        with self.conn:
+            self.conn.execute("DELETE FROM fetch_state WHERE source = ? AND cursor = ?", (self.source, cursor))
+
+    def page_done(self, cursor, page, items):
+        self.writer.flush()
+        with self.conn:
+            self.conn.execute(PAGE_DONE_SQL, (self.source, cursor, page, items))
+
+    def page_failed(self, cursor, page, error):
+        """这一页重试用尽：断点不前进，记下失败的页码和原因。"""
+        self.writer.flush()
+        with self.conn:
+            self.conn.execute(PAGE_FAILED_SQL, (self.source, cursor, page, str(error)))
+
+    def finish(self, cursor):
+        self.writer.flush()
+        with self.conn:
+            self.conn.execute(FINISH_SQL, (self.source, cursor))
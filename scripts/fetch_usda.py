@@ -1,39 +1,79 @@
-import requests
-import sqlite3
+import argparse
 import os
+import time
 from dotenv import load_dotenv
 
+import paths  # noqa: F401
+from ingest import BulkWriter, product_row
+from http_cache import ReplayMiss, cached_session
+from fetch_state import FetchState, DEFAULT_FRESH_HOURS, MAX_PAGE_RETRIES
+import instrumentation
+
 load_dotenv()
-DB_PATH = os.path.join(os.path.dirname(__file__), '../data/food_data.db')
 API_KEY = os.getenv('USDA_API_KEY', 'DEMO_KEY')
 
-def save_to_db(foods):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+USDA_QUERIES = ['Asian', 'Chinese', 'Japanese', 'Korean', 'Thai']
+
+def food_row(f):
+    """搜索接口和全量数据包 (import_usda_bulk.py) 共用的字段映射；分类字段两边名称不同。"""
+    return product_row(str(f['fdcId']), 'USDA', barcode=f.get('gtinUpc'), name=f.get('description'),
+                       brand=f.get('brandOwner'), ingredients=f.get('ingredients'),
+                       categories=f.get('foodCategory') or f.get('brandedFoodCategory'),
+                       countries=f.get('marketCountry') or 'United States')
+
+def save_to_db(foods, writer):
     for f in foods:
-        fdc_id = f.get('fdcId')
-        if not fdc_id: continue
-        cursor.execute('''
-            INSERT OR REPLACE INTO products (id, source, barcode, name, brand, ingredients, image_url, categories, countries)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (str(fdc_id), 'USDA', f.get('gtinUpc'), f.get('description'), f.get('brandOwner'), f.get('ingredients'), None, f.get('foodCategory'), 'United States'))
-    conn.commit()
-    conn.close()
+        if not f.get('fdcId'): continue
+        writer.add(food_row(f))
 
-def fetch_usda_bulk(queries=['Asian', 'Chinese', 'Japanese', 'Korean', 'Thai']):
-    for query in queries:
-        for page in range(1, 11): # 每个关键词抓 10 页
-            url = f"https://api.nal.usda.gov/fdc/v1/foods/search?api_key={API_KEY}&query={query}&pageSize=100&pageNumber={page}&dataType=Branded"
-            print(f"Fetching USDA {query} page {page}...")
-            try:
-                response = requests.get(url, timeout=20)
-                data = response.json()
-                foods = data.get('foods', [])
-                if not foods: break
-                save_to_db(foods)
-            except Exception as e:
-                print(f"Error: {e}")
-                break
+@instrumentation.instrumented("fetch_usda")
+def fetch_usda_bulk(queries=USDA_QUERIES, max_pages=10,
+                    fresh_hours=DEFAULT_FRESH_HOURS, restart=False):
+    session = cached_session()
+    with BulkWriter(label="USDA") as writer:
+        # 每页落库后记录断点，中断后再次运行从断点继续
+        state = FetchState(writer, "USDA", fresh_hours=fresh_hours, restart=restart)
+        for query in queries:
+            cursor = f"query:{query}"
+            page = state.resume_page(cursor)
+            failures = 0
+            while page is not None and page <= max_pages: # 每个关键词最多抓 max_pages 页
+                url = f"https://api.nal.usda.gov/fdc/v1/foods/search?api_key={API_KEY}&query={query}&pageSize=100&pageNumber={page}&dataType=Branded"
+                print(f"Fetching USDA {query} page {page}...")
+                try:
+                    response = session.get(url, timeout=20)
+                    # 限速 (429) 等错误响应没有 foods 字段，不能当成已经抓完
+                    response.raise_for_status()
+                    data = response.json()
+                    foods = data.get('foods', [])
+                    if not foods: break
+                    save_to_db(foods, writer)
+                    state.page_done(cursor, page, len(foods))
+                    page += 1
+                    failures = 0
+                except ReplayMiss as e:
+                    # 离线重放时缓存里没有这一页：不重试，也不记为抓完
+                    print(e)
+                    page = None
+                except Exception as e:
+                    print(f"Error: {e}")
+                    instrumentation.current().add("http_errors")
+                    failures += 1
+                    if failures > MAX_PAGE_RETRIES:
+                        # 不记为抓完，下次运行从这一页继续
+                        print(f"USDA {query} page {page} failed {failures} times, giving up on this query")
+                        state.page_failed(cursor, page, e)
+                        page = None
+                    else:
+                        instrumentation.current().add("http_retries")
+                        time.sleep(5)
+            if page is not None:
+                state.finish(cursor)
 
 if __name__ == "__main__":
-    fetch_usda_bulk()
+    parser = argparse.ArgumentParser(description="从 USDA FoodData Central 搜索接口采集品牌食品")
+    parser.add_argument('--fresh-hours', type=float, default=DEFAULT_FRESH_HOURS,
+                        help="在这么多小时内抓完的查询词不再重抓")
+    parser.add_argument('--restart', action='store_true', help="忽略断点，所有查询词从第 1 页开始")
+    args = parser.parse_args()
+    fetch_usda_bulk(fresh_hours=args.fresh_hours, restart=args.restart)
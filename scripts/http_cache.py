@@ -0,0 +1,397 @@
+"""
+采集脚本共用的 HTTP 响应缓存（磁盘持久化，跨运行有效）
+
+以 requests 的 HTTPAdapter 子类实现，挂到 session 上即可，urllib3 的重试照常生效：
+    index.db     SQLite 索引：URL 键 -> 状态、响应头、ETag / Last-Modified、大小、写入 / 使用时间
+    bodies/      响应体文件，按键分目录存放（CNF 的 zip 这类大文件也不进数据库）
+
+只缓存 GET 的 200 响应。键为去掉 api_key 参数后的 URL，换了 API key 仍能命中，索引中也不保存密钥。
+新鲜度用本地 TTL 判断，不看服务端的 Cache-Control（OFF 给的 max-age 很短，重跑时照样会全部重下）。
+stream=True 的请求（OFF 全量数据包）不经过缓存。大文件（USDA / CNF 的 zip）用 download_file
+流式下载到 data/ 下的固定位置，文件本身就是缓存，同样按 TTL 和条件请求更新（见 download_file）。
+
+模式（环境变量 FOOD_HTTP_CACHE 或 run_pipeline.py --http-cache）:
+    on        默认。TTL 内直接用缓存；过期后带 If-None-Match / If-Modified-Since 请求，304 时沿用缓存
+    refresh   每次都向服务端做条件请求
+    replay    只用缓存，不访问网络；未缓存的 URL 抛出 ReplayMiss（离线环境、采集阶段的基准测试）
+    off       不读也不写缓存
+
+其他环境变量:
+    FOOD_HTTP_CACHE_DIR       缓存目录（默认 data/http_cache）
+    FOOD_HTTP_CACHE_TTL       新鲜期，秒（默认 7 天）
+    FOOD_HTTP_CACHE_MAX_MB    总大小上限，超过后按最近使用时间淘汰（默认 2048）
+
+用法:
+    python scripts/http_cache.py                  # 统计
+    python scripts/http_cache.py --purge-days 30  # 删除 30 天没有用到的条目
+    python scripts/http_cache.py --clear
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import paths  # noqa: F401
+import instrumentation
+
+CACHE_DIR = os.environ.get("FOOD_HTTP_CACHE_DIR") or os.path.join(os.path.dirname(__file__), '../data/http_cache')
+MODES = ("on", "refresh", "replay", "off")
+MODE = os.environ.get("FOOD_HTTP_CACHE", "on").lower()
+if MODE not in MODES:
+    raise ValueError(f"FOOD_HTTP_CACHE 只能是 {'/'.join(MODES)}，而不是 {MODE!r}")
+TTL_SECONDS = float(os.environ.get("FOOD_HTTP_CACHE_TTL") or 7 * 24 * 3600)
+MAX_BYTES = int(float(os.environ.get("FOOD_HTTP_CACHE_MAX_MB") or 2048) * 1024 * 1024)
+
+# 一次淘汰到上限的 90%，避免每次写入都触发淘汰
+EVICT_TARGET = 0.9
+
+# 不随缓存保存的响应头：响应体已经解压，长度和传输方式以实际内容为准
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive",
+                "set-cookie"}
+SECRET_PARAMS = {"api_key"}
+
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+'''
+
+
+class ReplayMiss(requests.exceptions.RequestException):
+    """replay 模式下请求的 URL 不在缓存中。与服务端真实的错误响应不同，重试没有意义，调用方应停下且不记为抓完。"""
+
+
+def cache_url(url):
+    """去掉密钥参数后的 URL，作为缓存键的来源。"""
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in SECRET_PARAMS]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def url_key(url):
+    return hashlib.sha256(cache_url(url).encode('utf-8')).hexdigest()
+
+
+class HttpCache:
+    def __init__(self, cache_dir=CACHE_DIR, ttl=TTL_SECONDS, max_bytes=MAX_BYTES):
+        self.dir = cache_dir
+        self.body_dir = os.path.join(cache_dir, 'bodies')
+        os.makedirs(self.body_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # 异步爬虫在多个线程里共用同一个缓存
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(INDEX_SCHEMA)
+
+    def body_path(self, key):
+        return os.path.join(self.body_dir, key[:2], key)
+
+    def lookup(self, key):
+        """返回 (条目 dict, 响应体) 或 None；索引和文件不一致时当作未命中。"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, status, headers, etag, last_modified, stored_at FROM entries WHERE key = ?",
+                (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self.body_path(key), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        url, status, headers, etag, last_modified, stored_at = row
+        entry = {"url": url, "status": status, "headers": json.loads(headers), "etag": etag,
+                 "last_modified": last_modified, "stored_at": stored_at}
+        return entry, body
+
+    def is_fresh(self, entry):
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def touch(self, key, revalidated=False):
+        now = time.time()
+        with self.lock, self.conn:
+            if revalidated:
+                self.conn.execute("UPDATE entries SET last_used = ?, stored_at = ? WHERE key = ?", (now, now, key))
+            else:
+                self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+
+    def store(self, key, url, response, body):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in DROP_HEADERS}
+        path = self.body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写文件再更新索引：中途失败时索引不会指向写了一半的响应体
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, url, status, headers, etag, last_modified, size, "
+                "stored_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, cache_url(url), response.status_code, json.dumps(headers), response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'), len(body), now, now))
+        self.evict()
+
+    def total_bytes(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间删除最旧的条目，直到降到上限的 EVICT_TARGET。"""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+        target = self.max_bytes * EVICT_TARGET
+        victims = []
+        with self.lock:
+            for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+                if total <= target:
+                    break
+                victims.append(key)
+                total -= size
+        return self.delete(victims)
+
+    def purge(self, older_than_seconds):
+        """删除超过指定时间没有用到的条目。"""
+        with self.lock:
+            victims = [key for key, in self.conn.execute(
+                "SELECT key FROM entries WHERE last_used < ?", (time.time() - older_than_seconds,))]
+        return self.delete(victims)
+
+    def delete(self, keys):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+        for key in keys:
+            try:
+                os.remove(self.body_path(key))
+            except FileNotFoundError:
+                pass
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            keys = [key for key, in self.conn.execute("SELECT key FROM entries")]
+        return self.delete(keys)
+
+    def stats(self):
+        with self.lock:
+            count, size, oldest = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(stored_at) FROM entries").fetchone()
+            stale = self.conn.execute("SELECT COUNT(*) FROM entries WHERE stored_at < ?",
+                                      (time.time() - self.ttl,)).fetchone()[0]
+        return {"entries": count, "bytes": size, "stale": stale, "oldest": oldest}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache(CACHE_DIR, TTL_SECONDS, MAX_BYTES)
+        return _cache
+
+
+def configure(mode=None, ttl=None, cache_dir=None, max_bytes=None):
+    """在创建 session 之前调用（run_pipeline.py --http-cache）；已打开的缓存会按新设置重新打开。"""
+    global MODE, TTL_SECONDS, CACHE_DIR, MAX_BYTES, _cache
+    if mode is not None:
+        if mode not in MODES:
+            raise ValueError(f"HTTP 缓存模式只能是 {'/'.join(MODES)}，而不是 {mode!r}")
+        MODE = mode
+    TTL_SECONDS = TTL_SECONDS if ttl is None else ttl
+    CACHE_DIR = cache_dir or CACHE_DIR
+    MAX_BYTES = max_bytes or MAX_BYTES
+    with _cache_lock:
+        _cache = None
+
+
+def serves_offline(url):
+    """这个 URL 现在是否不用访问网络就能得到响应（用于跳过限速等待）。"""
+    if MODE == "replay":
+        return True
+    if MODE != "on":
+        return False
+    found = get_cache().lookup(url_key(url))
+    return found is not None and get_cache().is_fresh(found[0])
+
+
+def cached_response(request, entry, body):
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.reason = "OK"
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = body
+    response.raw = io.BytesIO(body)
+    response.url = request.url
+    response.request = request
+    response.from_cache = True
+    return response
+
+
+class CachingAdapter(HTTPAdapter):
+    """带磁盘缓存的 HTTPAdapter；参数与 HTTPAdapter 相同（max_retries 等）。"""
+
+    def send(self, request, stream=False, **kwargs):
+        mode = MODE
+        if mode == "off" or request.method != "GET" or stream:
+            if mode == "replay":
+                raise ReplayMiss(f"replay 模式下不访问网络，缓存中没有: {request.url}", request=request)
+            return super().send(request, stream=stream, **kwargs)
+
+        cache = get_cache()
+        key = url_key(request.url)
+        found = cache.lookup(key)
+        if found is not None:
+            entry, body = found
+            if mode == "replay" or (mode == "on" and cache.is_fresh(entry)):
+                cache.touch(key)
+                return cached_response(request, entry, body)
+            if entry["etag"]:
+                request.headers['If-None-Match'] = entry["etag"]
+            if entry["last_modified"]:
+                request.headers['If-Modified-Since'] = entry["last_modified"]
+        elif mode == "replay":
+            raise ReplayMiss(f"replay 模式下不访问网络，缓存中没有: {request.url}", request=request)
+
+        response = super().send(request, stream=stream, **kwargs)
+        response.from_cache = False
+        if response.status_code == 304 and found is not None:
+            response.close()
+            cache.touch(key, revalidated=True)
+            instrumentation.current().add("http_requests")
+            return cached_response(request, *found)
+        if response.status_code == 200:
+            try:
+                cache.store(key, request.url, response, response.content)
+            except (OSError, sqlite3.Error) as e:
+                print(f"   - HTTP 缓存写入失败，跳过: {e}")
+        return response
+
+
+def download_meta_path(path):
+    return path + '.meta.json'
+
+
+def load_download_meta(path):
+    """下载文件旁的元数据（ETag / Last-Modified / 下载时间）；没有时用文件修改时间，当作没有校验器。"""
+    try:
+        with open(download_meta_path(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"etag": None, "last_modified": None, "fetched_at": os.path.getmtime(path)}
+
+
+def save_download_meta(path, url, etag, last_modified):
+    meta = {"url": cache_url(url), "etag": etag, "last_modified": last_modified, "fetched_at": time.time()}
+    with open(download_meta_path(path) + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(download_meta_path(path) + '.tmp', download_meta_path(path))
+
+
+def download_file(url, directory, headers=None, chunk_size=1 << 20):
+    """
+    把大文件流式下载到 directory/<文件名> 并返回路径，不经过内存。
+    文件本身就是缓存，ETag / Last-Modified 和下载时间存在旁边的 <文件名>.meta.json 里:
+        on       TTL 内直接使用；过期后做条件请求，304 时沿用已有文件（网络不通时也沿用）
+        refresh  已有文件时每次都做条件请求
+        replay   只用已有文件，不存在时报错
+        off      总是重新下载
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, os.path.basename(urlsplit(url).path))
+    exists = os.path.exists(path)
+    if MODE == "replay":
+        if not exists:
+            raise FileNotFoundError(f"replay 模式下不访问网络，且没有已下载的文件: {path}")
+        print(f"使用已下载的文件: {path}")
+        return path
+
+    request_headers = dict(headers or {})
+    meta = load_download_meta(path) if exists and MODE != "off" else None
+    if meta is not None:
+        if MODE == "on" and time.time() - meta["fetched_at"] < TTL_SECONDS:
+            print(f"使用已下载的文件: {path}")
+            return path
+        if meta["etag"]:
+            request_headers['If-None-Match'] = meta["etag"]
+        if meta["last_modified"]:
+            request_headers['If-Modified-Since'] = meta["last_modified"]
+
+    print(f"{'检查更新' if meta is not None else '下载'} {url} ...")
+    try:
+        response = requests.get(url, headers=request_headers, stream=True, timeout=60)
+    except requests.exceptions.RequestException as e:
+        if meta is None:
+            raise
+        print(f"   - 无法校验 {url}（{e}），沿用已下载的文件: {path}")
+        return path
+    with response:
+        instrumentation.record_http(response)
+        if response.status_code == 304 and meta is not None:
+            print(f"服务端文件未变化，使用已下载的文件: {path}")
+            save_download_meta(path, url, meta["etag"], meta["last_modified"])
+            return path
+        response.raise_for_status()
+        # 先写 .part，下载完整后再改名，中断后不会把半个文件当成完整文件
+        with open(path + '.part', 'wb') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+    os.replace(path + '.part', path)
+    save_download_meta(path, url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return path
+
+
+def cached_session(headers=None, max_retries=0):
+    """一般用途的带缓存 session（USDA 搜索等）；OFF 用 fetch_off.get_robust_session。"""
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+    adapter = CachingAdapter(max_retries=max_retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return instrumentation.instrument_session(session)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看 / 清理采集脚本的 HTTP 响应缓存")
+    parser.add_argument('--purge-days', type=float, help="删除超过这么多天没有用到的条目")
+    parser.add_argument('--clear', action='store_true', help="清空缓存")
+    args = parser.parse_args()
+
+    cache = get_cache()
+    if args.clear:
+        print(f"已删除 {cache.clear()} 条缓存")
+    elif args.purge_days is not None:
+        print(f"已删除 {cache.purge(args.purge_days * 86400)} 条超过 {args.purge_days:g} 天未使用的缓存")
+    stats = cache.stats()
+    oldest = time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['oldest'])) if stats['oldest'] else "-"
+    print(f"HTTP 缓存 {os.path.abspath(cache.dir)}: {stats['entries']} 条, {stats['bytes'] / 1e6:.1f} MB, "
+          f"其中 {stats['stale']} 条已超过 TTL（{TTL_SECONDS / 3600:g} 小时），最早写入 {oldest}")
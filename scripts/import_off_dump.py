@@ -0,0 +1,246 @@
+"""
+流式导入 Open Food Facts 全量数据包
+
+支持官方的 JSONL 数据包 (openfoodfacts-products.jsonl.gz) 和 CSV 数据包
+(en.openfoodfacts.org.products.csv.gz，制表符分隔)，也支持未压缩的文件和 URL。
+逐行解压、解析，内存占用与文件大小无关；按国家 / 产地 / 分类过滤后，
+用与 fetch_off.save_to_db 相同的字段映射批量写入。
+
+中断后再次运行会从上次提交的位置（解压后的字节偏移）继续，读取 / 保留的行数累计计算；
+完整读完后删除断点。断点只对同一个数据包有效：本地文件按路径、大小和修改时间区分，
+URL（官方数据包每天重新生成）按服务端的 ETag / Last-Modified / Content-Length 区分。
+未压缩的本地文件续传时直接定位到偏移；gzip 流不能随机访问，续传时断点之前的部分仍要解压
+（URL 还要重新下载），只省去解析和写库。
+
+离线测试用的小数据包: benchmarks/fixtures/off_dump_sample.jsonl（benchmarks/bench_off_dump.py 可生成更大的）
+
+用法:
+    python scripts/import_off_dump.py data/openfoodfacts-products.jsonl.gz
+    python scripts/import_off_dump.py dump.jsonl.gz --country japan --country "south korea" --category en:soups
+    python scripts/import_off_dump.py dump.jsonl.gz --restart      # 忽略断点，从头开始
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import time
+
+import requests
+
+import paths  # noqa: F401
+from fetch_off import SAFE_TAGS, ORIGINS, save_to_db
+from ingest import BulkWriter, DB_PATH
+import instrumentation
+
+OFF_DUMP_URL = "https://static.openfoodfacts.org/data/openfoodfacts-products.jsonl.gz"
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), '../data/off_dump_checkpoint.json')
+
+# 每提交一批写一次断点
+CHECKPOINT_EVERY = 20000
+PROGRESS_INTERVAL = 10.0
+
+
+def normalize_tag(value):
+    """'South Korea' / 'en:south-korea' -> 'south-korea'，用于忽略语言前缀比较标签。"""
+    value = value.strip().lower()
+    if ':' in value:
+        value = value.split(':', 1)[1]
+    return value.replace(' ', '-')
+
+
+class DumpFilter:
+    """产品只要命中任意一个配置的国家、产地或分类就保留；什么都没配置时全部保留。"""
+
+    def __init__(self, countries=(), origins=(), categories=()):
+        self.groups = [
+            ("countries_tags", "countries", {normalize_tag(v) for v in countries}),
+            ("origins_tags", "origins", {normalize_tag(v) for v in origins}),
+            ("categories_tags", "categories", {normalize_tag(v) for v in categories}),
+        ]
+        self.enabled = any(wanted for _, _, wanted in self.groups)
+
+    def __call__(self, product):
+        if not self.enabled:
+            return True
+        for tags_field, text_field, wanted in self.groups:
+            if not wanted:
+                continue
+            tags = product.get(tags_field) or product.get(text_field) or []
+            if isinstance(tags, str):
+                # CSV 数据包里是逗号分隔的文本
+                tags = tags.split(',')
+            if any(normalize_tag(tag) in wanted for tag in tags if tag):
+                return True
+        return False
+
+
+def open_dump(source):
+    """返回 (解压后的二进制流, 读取压缩字节数的函数, 压缩文件总大小或 None, 数据包标识)。"""
+    if source.startswith(('http://', 'https://')):
+        response = requests.get(source, stream=True, timeout=60)
+        instrumentation.record_http(response)
+        response.raise_for_status()
+        raw = response.raw
+        total = int(response.headers.get('Content-Length') or 0) or None
+        position = lambda: raw.tell()
+        version = response.headers.get('ETag') or response.headers.get('Last-Modified') or ''
+        identity = f"{source}:{version}:{total or ''}"
+        plain = None
+        if not source.endswith('.gz'):
+            # 读完响应体时 urllib3 默认会关闭 raw，外层 BufferedReader 里还没读的缓冲就读不到了
+            raw.auto_close = False
+            plain = io.BufferedReader(raw)
+    else:
+        raw = open(source, 'rb')
+        total = os.path.getsize(source)
+        position = raw.tell
+        stat = os.stat(source)
+        identity = f"{os.path.abspath(source)}:{stat.st_size}:{int(stat.st_mtime)}"
+        plain = raw
+
+    stream = gzip.GzipFile(fileobj=raw) if source.endswith('.gz') else plain
+    return stream, position, total, identity
+
+
+def is_csv_dump(source):
+    name = source[:-3] if source.endswith('.gz') else source
+    return name.endswith(('.csv', '.tsv'))
+
+
+def iter_products(stream, csv_dump, offset):
+    """逐行产出 (行尾的解压后字节偏移, 产品 dict 或 None)。"""
+    header = None
+    consumed = 0
+    if csv_dump:
+        header_line = stream.readline()
+        header = header_line.decode('utf-8').rstrip('\r\n').split('\t')
+        consumed = len(header_line)
+        offset = max(offset, consumed)
+
+    if offset > consumed:
+        if stream.seekable():
+            # 对 gzip 流是向前解压并丢弃，不做解析
+            stream.seek(offset)
+        else:
+            # URL 上的未压缩数据包：只能读出来丢掉
+            remaining = offset - consumed
+            while remaining:
+                chunk = stream.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+
+    for line in stream:
+        offset += len(line)
+        text = line.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not text:
+            yield offset, None
+            continue
+        if csv_dump:
+            # 空字段按 NULL 处理，与 API 返回缺失字段时一致
+            yield offset, {k: v for k, v in zip(header, text.split('\t')) if v}
+        else:
+            try:
+                yield offset, json.loads(text)
+            except ValueError:
+                yield offset, None
+
+
+def load_checkpoint(checkpoint_path, source_id):
+    """返回 (偏移, 已读取行数, 已保留条数)；没有断点或断点属于别的数据包时从 0 开始。"""
+    if not os.path.exists(checkpoint_path):
+        return 0, 0, 0
+    with open(checkpoint_path, 'r') as f:
+        state = json.load(f)
+    if state.get('source') != source_id:
+        return 0, 0, 0
+    return state.get('offset', 0), state.get('lines', 0), state.get('kept', 0)
+
+
+def save_checkpoint(checkpoint_path, source_id, offset, lines, kept):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({"source": source_id, "offset": offset, "lines": lines, "kept": kept,
+                   "updated_at": time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+@instrumentation.instrumented("import_off_dump")
+def import_off_dump(source, product_filter=None, restart=False, limit=None, db_path=DB_PATH,
+                    batch_size=5000, checkpoint_path=CHECKPOINT_PATH):
+    product_filter = product_filter or DumpFilter()
+    stream, position, total, source_id = open_dump(source)
+    csv_dump = is_csv_dump(source)
+
+    offset, lines, kept = (0, 0, 0) if restart else load_checkpoint(checkpoint_path, source_id)
+    if offset:
+        print(f"从断点继续: 偏移 {offset / 1e6:.1f} MB（此前已读取 {lines} 行，保留 {kept} 条）")
+
+    read = 0
+    finished = False
+    started = last_report = time.perf_counter()
+    done_offset = offset
+    with BulkWriter(db_path, batch_size=batch_size, label="OFF dump") as writer:
+        try:
+            for line_end, product in iter_products(stream, csv_dump, offset):
+                read += 1
+                lines += 1
+                if product is not None and product_filter(product):
+                    kept += save_to_db([product], writer)
+                done_offset = line_end
+
+                if lines % CHECKPOINT_EVERY == 0:
+                    # 先提交数据再记录断点：中断时最多重复导入一批（INSERT OR REPLACE 幂等）
+                    writer.flush()
+                    save_checkpoint(checkpoint_path, source_id, done_offset, lines, kept)
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    elapsed = now - started
+                    pct = f" {position() / total:.1%}" if total else ""
+                    print(f"   已读取 {lines} 行{pct}，保留 {kept} 条 "
+                          f"({read / elapsed:.0f} 行/秒, {(done_offset - offset) / elapsed / 1e6:.1f} MB/秒 解压后)")
+
+                if limit and read >= limit:
+                    break
+            else:
+                finished = True
+        finally:
+            writer.flush()
+            if finished:
+                # 整个数据包已导入：下次运行（通常是新的数据包）从头开始
+                if os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+            else:
+                save_checkpoint(checkpoint_path, source_id, done_offset, lines, kept)
+            stream.close()
+
+    instrumentation.current().add("rows_read", read)
+    elapsed = time.perf_counter() - started
+    status = "导入完成" if finished else "已暂停（下次运行从断点继续）"
+    print(f"{status}：本次读取 {read} 行，累计读取 {lines} 行、保留并写入 {kept} 条，耗时 {elapsed:.1f}s")
+    return kept
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式导入 Open Food Facts 全量数据包 (JSONL / CSV)")
+    parser.add_argument('source', nargs='?', default=OFF_DUMP_URL, help="本地文件路径或 URL")
+    parser.add_argument('--country', action='append', default=[], help="保留的国家（可重复）")
+    parser.add_argument('--origin', action='append', default=[], help="保留的产地（可重复）")
+    parser.add_argument('--category', action='append', default=[], help="保留的分类标签（可重复）")
+    parser.add_argument('--all', action='store_true', help="不过滤，导入全部产品")
+    parser.add_argument('--restart', action='store_true', help="忽略断点，从头开始")
+    parser.add_argument('--limit', type=int, help="本次最多读取的行数（调试用；未读完时保留断点）")
+    args = parser.parse_args()
+
+    if args.all:
+        product_filter = DumpFilter()
+    elif args.country or args.origin or args.category:
+        product_filter = DumpFilter(args.country, args.origin, args.category)
+    else:
+        # 默认与在线采集的范围一致：SAFE_TAGS 分类 + ORIGINS 产地
+        product_filter = DumpFilter(origins=ORIGINS, categories=SAFE_TAGS)
+
+    import_off_dump(args.source, product_filter, restart=args.restart, limit=args.limit)
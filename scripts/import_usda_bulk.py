@@ -0,0 +1,193 @@
+"""
+流式导入 USDA FoodData Central 的 Branded Foods 全量数据包
+
+替代 fetch_usda.py 的分页搜索（每个关键词最多 1000 条，受 API 限速）。支持官方的两种 zip:
+    FoodData_Central_branded_food_json_*.zip   一个 {"BrandedFoods": [...]} JSON 文件
+    FoodData_Central_branded_food_csv_*.zip    branded_food.csv + food.csv（名称在 food.csv 中）
+直接从 zip 中边解压边解析，不解压到磁盘，也不把整个文件读进内存；JSON 按数组元素逐个解码。
+按关键词 / 分类过滤后，用与 fetch_usda.save_to_db 相同的字段映射 (food_row) 批量写入，
+id 与搜索接口一致，两种方式抓到的同一食品互相覆盖。
+
+zip 需要随机访问，URL 会先下载到 data/usda/ 再导入（http_cache.download_file，TTL 内直接使用，过期后做条件请求）。
+CSV 数据包要先把 food.csv 中品牌食品的名称读入内存（约两百万条），JSON 数据包没有这一步。
+
+用法:
+    python scripts/import_usda_bulk.py data/usda/FoodData_Central_branded_food_json_2024-10-31.zip
+    python scripts/import_usda_bulk.py branded.zip --keyword kimchi --category "Asian Foods"
+    python scripts/import_usda_bulk.py branded.zip --all
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import time
+import zipfile
+
+import paths  # noqa: F401
+from fetch_usda import USDA_QUERIES, food_row
+from ingest import BulkWriter, DB_PATH
+from http_cache import download_file
+import instrumentation
+
+USDA_BRANDED_URL = "https://fdc.nal.usda.gov/fdc-datasets/FoodData_Central_branded_food_json_2024-10-31.zip"
+DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), '../data/usda')
+
+READ_CHUNK = 1 << 20
+PROGRESS_INTERVAL = 10.0
+
+# JSON 数据包的外层：{"BrandedFoods": [ ... ]}；不匹配时按 JSON Lines / 连续对象处理
+JSON_WRAPPER_RE = re.compile(r'\s*\{\s*"\w+"\s*:\s*\[')
+
+# CSV 列名 -> 与 JSON / 搜索接口一致的字段名
+CSV_FIELDS = {
+    "fdc_id": "fdcId", "brand_owner": "brandOwner", "brand_name": "brandName", "gtin_upc": "gtinUpc",
+    "ingredients": "ingredients", "branded_food_category": "brandedFoodCategory",
+    "market_country": "marketCountry",
+}
+
+
+class FoodFilter:
+    """
+    名称 / 品牌 / 配料 / 分类中包含任一关键词，或分类等于任一配置的分类时保留（都不区分大小写）；
+    什么都没配置时全部保留。
+    """
+
+    def __init__(self, keywords=(), categories=()):
+        self.keywords = re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE) if keywords else None
+        self.categories = {c.strip().casefold() for c in categories}
+        self.enabled = bool(self.keywords or self.categories)
+
+    def __call__(self, food):
+        if not self.enabled:
+            return True
+        category = food.get('brandedFoodCategory') or ''
+        if self.categories and category.strip().casefold() in self.categories:
+            return True
+        if self.keywords:
+            text = ' '.join(filter(None, (food.get('description'), food.get('brandOwner'),
+                                          food.get('ingredients'), category)))
+            return self.keywords.search(text) is not None
+        return False
+
+
+def iter_json_objects(stream, chunk_size=READ_CHUNK):
+    """从文本流中逐个解码外层数组里的对象，缓冲区只保留最近的一块。"""
+    decoder = json.JSONDecoder()
+    buf = stream.read(chunk_size)
+    match = JSON_WRAPPER_RE.match(buf)
+    pos = match.end() if match else 0
+    while True:
+        # 跳过元素之间的空白和逗号
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf):
+                break
+            buf = stream.read(chunk_size)
+            pos = 0
+            if not buf:
+                return
+        if buf[pos] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # 对象跨越了块边界：接上下一块再解码
+            more = stream.read(chunk_size)
+            if not more:
+                raise
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        yield obj
+        pos = end
+
+
+def open_member(zf, name):
+    return io.TextIOWrapper(zf.open(name), encoding='utf-8-sig', newline='')
+
+
+def iter_csv_foods(zf, members):
+    names = {os.path.basename(m): m for m in members}
+    if 'branded_food.csv' not in names or 'food.csv' not in names:
+        raise ValueError("CSV 数据包中应有 branded_food.csv 和 food.csv")
+
+    descriptions = {}
+    with open_member(zf, names['food.csv']) as f:
+        for row in csv.DictReader(f):
+            if row.get('data_type') == 'branded_food':
+                descriptions[row['fdc_id']] = row['description']
+
+    with open_member(zf, names['branded_food.csv']) as f:
+        for row in csv.DictReader(f):
+            food = {field: row[column] for column, field in CSV_FIELDS.items() if row.get(column)}
+            # 每个 fdc_id 只出现一次，用完即删，内存随导入逐渐释放
+            food['description'] = descriptions.pop(row['fdc_id'], None)
+            yield food
+
+
+def iter_foods(zf):
+    """返回 (食品 dict 的迭代器, 数据文件)：JSON 数据包优先。"""
+    members = [m for m in zf.namelist() if not m.endswith('/')]
+    json_members = [m for m in members if m.lower().endswith('.json')]
+    if json_members:
+        member = max(json_members, key=lambda m: zf.getinfo(m).file_size)
+        stream = open_member(zf, member)
+        return iter_json_objects(stream), stream
+    return iter_csv_foods(zf, members), None
+
+
+@instrumentation.instrumented("import_usda_bulk")
+def import_usda_bulk(source, food_filter=None, limit=None, db_path=DB_PATH, batch_size=5000):
+    food_filter = food_filter or FoodFilter()
+    if source.startswith(('http://', 'https://')):
+        source = download_file(source, DOWNLOAD_DIR)
+
+    read = kept = 0
+    started = last_report = time.perf_counter()
+    with zipfile.ZipFile(source) as zf, BulkWriter(db_path, batch_size=batch_size, label="USDA bulk") as writer:
+        foods, stream = iter_foods(zf)
+        try:
+            for food in foods:
+                read += 1
+                if food.get('fdcId') and food_filter(food):
+                    writer.add(food_row(food))
+                    kept += 1
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    print(f"   已读取 {read} 条，保留 {kept} 条 ({read / (now - started):.0f} 条/秒)")
+
+                if limit and read >= limit:
+                    break
+        finally:
+            if stream is not None:
+                stream.close()
+
+    instrumentation.current().add("rows_read", read)
+    elapsed = time.perf_counter() - started
+    print(f"导入完成：读取 {read} 条，保留并写入 {kept} 条，耗时 {elapsed:.1f}s")
+    return kept
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式导入 USDA Branded Foods 全量数据包 (JSON / CSV zip)")
+    parser.add_argument('source', nargs='?', default=USDA_BRANDED_URL, help="本地 zip 路径或 URL")
+    parser.add_argument('--keyword', action='append', default=[], help="保留名称/品牌/配料/分类包含该词的食品（可重复）")
+    parser.add_argument('--category', action='append', default=[], help="保留该 brandedFoodCategory（可重复）")
+    parser.add_argument('--all', action='store_true', help="不过滤，导入全部品牌食品")
+    parser.add_argument('--limit', type=int, help="最多读取的条数（调试用）")
+    args = parser.parse_args()
+
+    if args.all:
+        food_filter = FoodFilter()
+    elif args.keyword or args.category:
+        food_filter = FoodFilter(args.keyword, args.category)
+    else:
+        # 默认与分页搜索的关键词一致
+        food_filter = FoodFilter(USDA_QUERIES)
+
+    import_usda_bulk(args.source, food_filter, limit=args.limit)
@@ -0,0 +1,10 @@
+"""
+scripts/ 下的脚本共用 db/ 中的模块（instrumentation、init_db ……），这里把 db/ 加入 sys.path。
+各脚本在导入这些模块之前先 import paths；run_pipeline.py 和 benchmarks/ 自己设置路径。
+"""
+import os
+import sys
+
+DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../db')
+if DB_DIR not in sys.path:
+    sys.path.append(DB_DIR)